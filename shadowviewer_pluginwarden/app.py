@@ -1,23 +1,33 @@
-import json
-from math import ceil
+import asyncio
+from contextlib import asynccontextmanager
 from typing import List
 from fastapi import Depends, FastAPI, Query, Request, HTTPException
-from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse
+from datetime import datetime
 from fastapi_swagger import patch_fastapi
 from loguru import logger
 import hashlib
 import hmac
-from sqlalchemy import func, cast
-from sqlalchemy.types import String
 
 import uvicorn
-from models import get_db, Session,Repository,Author,Asset,Release,WebhookLog,Plugin, save_releases_to_db, write_webhook_log_with_db
-from github_utils import create_pr, webhook_install, webhook_release
+from models import get_db, Session,Repository,Asset,Release, write_webhook_log_with_db, repository_counts, apply_counts_change
+from http_client import http_client
+from index_sync import index_sync
 from res_model import *
-from auth import  router as auth_router, get_current_user
+from revision import bump_catalog_revision
+from auth import  router as auth_router, CurrentUser, get_admin, get_current_user
+from config import settings
 from authors import  router  as authors_router
 from repositories import  router  as repositories_router
 from store import  router  as store_router
+from shards import  router  as shards_router, publish_shards
+from export import  router  as export_router
+from backfill import backfill_status, start_backfill_job
+from plugin_cache import cache_stats
+from counters import get_dashboard_counts, reconcile_counters
+from log_archive import archive_webhook_logs, load_webhook_logs
+from scheduler import schedule, stop_scheduled
+from webhook_queue import HANDLED_EVENTS, enqueue, prune_deliveries, queue_stats, start_workers, stop_workers
 
 def verify_signature(payload_body, secret_token, signature_header):
     """Verify that the payload was sent from GitHub by validating SHA256.
@@ -38,7 +48,26 @@ def verify_signature(payload_body, secret_token, signature_header):
 
 
 
-app = FastAPI(docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动 webhook 后台队列的 worker 与定时任务：投递记录清理、仪表盘计数对账、webhook 日志归档、静态目录分片
+    await start_workers()
+    # 恢复上次退出前索引仓库中尚未同步的更新
+    await asyncio.to_thread(index_sync.load)
+    schedule("webhook delivery pruning", prune_deliveries, settings.webhook_delivery_prune_interval)
+    schedule("dashboard counters reconciliation", reconcile_counters, settings.counters_reconcile_interval)
+    schedule("webhook log archive", archive_webhook_logs, settings.webhook_log_archive_interval)
+    if settings.shard_dir:
+        schedule("store shard publish", publish_shards, settings.shard_publish_interval)
+    yield
+    await stop_scheduled()
+    await stop_workers()
+    # 退出前提交索引仓库中尚未同步的更新
+    await asyncio.to_thread(index_sync.close)
+    http_client.close()
+
+
+app = FastAPI(docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json", lifespan=lifespan)
 
 patch_fastapi(app)
 
@@ -50,6 +79,10 @@ app.include_router(authors_router, prefix="/api")
 app.include_router(repositories_router, prefix="/api")
 # include store routes
 app.include_router(store_router, prefix="/api")
+# include export routes
+app.include_router(export_router, prefix="/api")
+# include static store shard routes
+app.include_router(shards_router, prefix="/api")
 
 
 
@@ -57,18 +90,44 @@ app.include_router(store_router, prefix="/api")
 async def github_webhook(request: Request):
     # 验证请求来源 (可选)
     event = request.headers.get("X-GitHub-Event")
-    logger.info(f"Received event: {event}")
-    payload = await request.json()
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    logger.info(f"Received event: {event} ({delivery_id})")
+    # 验证请求来源：使用原始请求体校验签名；请求体原样入队，只由后台 worker 解析一次 JSON
+    body = await request.body()
+    verify_signature(body, settings.webhook_token, request.headers.get("X-Hub-Signature-256"))
+    if event not in HANDLED_EVENTS:
+        return "skip"
+    # 写入持久化队列并立即返回 202，安装/发布事件由后台 worker 处理；重复投递直接忽略
+    job_id = await asyncio.to_thread(enqueue, event, body.decode('utf-8'), delivery_id)
+    if job_id is None:
+        logger.info(f"Skip duplicate delivery {delivery_id}")
+        return {"duplicate": delivery_id}
+    return JSONResponse(status_code=202, content={"queued": job_id})
+
+
+@app.get("/api/webhook/queue", tags=["WebhookLogs"])
+async def get_webhook_queue(current_user: CurrentUser = Depends(get_admin)):
+    """
+    webhook 队列状态：待处理 / 处理中 / 失败任务数，以及最早待处理任务的等待时间（秒）
+    """
+    return queue_stats()
+
+@app.post("/api/backfill", tags=["WebhookLogs"])
+async def start_backfill(current_user: CurrentUser = Depends(get_admin)):
+    """
+    在后台回填所有已安装仓库的 releases（分页、带 ETag 的条件请求），已有回填在运行时返回 409
+    """
+    if not start_backfill_job():
+        raise HTTPException(status_code=409, detail="Backfill is already running")
+    return JSONResponse(status_code=202, content=backfill_status())
 
-    # 处理 GitHub App 安装创建事件：将仓库信息存入数据库
-    if event == "installation" or event == "installation_repositories":
-        return webhook_install(payload, event)
 
-    # 现有：处理 release 事件
-    elif event == "release":
-       return webhook_release(payload, event) 
-        
-    return "skip"
+@app.get("/api/backfill", tags=["WebhookLogs"])
+async def get_backfill(current_user: CurrentUser = Depends(get_admin)):
+    """
+    回填任务状态：是否在运行，以及最近一次完成的吞吐统计
+    """
+    return backfill_status()
 
 @app.get("/", name="root")
 async def root():
@@ -109,7 +168,7 @@ async def get_release_assets(
 
 
 @app.patch("/api/releases/{release_id}/visible", tags=["Releases"])
-async def set_release_visible(release_id: int, request: Request, db: Session = Depends(get_db), current_user: Author = Depends(get_current_user)):
+async def set_release_visible(release_id: int, request: Request, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
     更新 Release 的 `visible` 字段。只有管理员或仓库所属作者可以修改可见性。
     请求体: { "visible": true|false }
@@ -129,13 +188,18 @@ async def set_release_visible(release_id: int, request: Request, db: Session = D
         if not repo or repo.author_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to change release visibility")
 
+    changed = release.visible != visible
+    counts_before = repository_counts(db, repo)
     release.visible = visible
     db.add(release)
+    apply_counts_change(db, counts_before, repository_counts(db, repo))
     write_webhook_log_with_db(db, repository_id=repo.id,
                               author_id=current_user.id, event="",action="",
                               payload=f"设置仓库 {repo.full_name} 版本 {release.tag_name} 可见状态为 {release.visible}")
     db.commit()
     db.refresh(release)
+    if changed and release.plugin:
+        bump_catalog_revision([release.plugin.plugin_id])
 
     return {"id": release.id, "visible": release.visible}
 
@@ -151,9 +215,9 @@ async def get_asset(asset_id: int, db: Session = Depends(get_db), current_user:
 
 
 @app.get("/api/webhook_logs", response_model=List[WebhookLogModel], tags=["WebhookLogs"])
-async def get_webhook_logs(
+def get_webhook_logs(
     db: Session = Depends(get_db),
-    current_user: Author = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     day: str = Query(None, description="Date in YYYY-MM-DD format. Defaults to today."),
 ):
     """
@@ -169,19 +233,23 @@ async def get_webhook_logs(
     else:
         day_date = datetime.now().date()
 
-    start_dt = datetime(day_date.year, day_date.month, day_date.day)
-    end_dt = start_dt + timedelta(days=1)
-
     # Return logs ordered from oldest -> newest (ascending) so frontend can display small->large
-    query = db.query(WebhookLog).filter(WebhookLog.created_at >= start_dt, WebhookLog.created_at < end_dt).order_by(WebhookLog.created_at.asc())
-    if not current_user.is_admin:
-        query = query.filter(WebhookLog.author_id == current_user.id)
-    logs = query.all()
-    return logs
+    # 超过保留期的日志已归档到按天的压缩文件，这里透明地合并归档与表中的记录
+    # （读取归档文件与查询都是同步的，本接口为同步函数，在线程池中执行）
+    return load_webhook_logs(db, day_date, None if current_user.is_admin else current_user.id)
+
+
+@app.post("/api/webhook_logs/archive", tags=["WebhookLogs"])
+def archive_logs(current_user: CurrentUser = Depends(get_admin)):
+    """
+    立即归档超过保留期的 webhook 日志，返回 {日期: 归档条数}
+    """
+    # 同步函数：归档读写 gzip 文件并删除数据库记录，由 FastAPI 放到线程池执行
+    return archive_webhook_logs()
 
 
 @app.get("/api/stats", tags=["Stats"])
-async def get_stats(db: Session = Depends(get_db), current_user: Author = Depends(get_current_user)):
+def get_stats(db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
     返回三个仪表盘统计项：
     - total_plugins: 已解析并保存到插件表的 plugin.json 数量
@@ -189,28 +257,45 @@ async def get_stats(db: Session = Depends(get_db), current_user: Author = Depend
     - watched_repos: 被标记为 watched 的仓库数量 (Repository.watched == True)
 
     管理员返回全局统计，普通用户仅返回与其相关的统计。
+    统计值读取自增量维护的计数表（dashboard_counters），并由后台定时对账。
+    查询是同步的，本接口为同步函数，由 FastAPI 放到线程池执行。
     """
     try:
-        if current_user.is_admin:
-            # 仅统计关联到被标记为 watched 的仓库的插件，且 Release 为 visible
-            total_plugins = db.query(Plugin).join(Plugin.repository).join(Plugin.release).filter(Repository.watched == True, Release.visible == True).count()
-            installed_repos = db.query(Repository).filter(Repository.installed == True).count()
-            watched_repos = db.query(Repository).filter(Repository.watched == True).count()
-        else:
-            installed_repos = db.query(Repository).filter(Repository.author_id == current_user.id, Repository.installed == True).count()
-            watched_repos = db.query(Repository).filter(Repository.author_id == current_user.id, Repository.watched == True).count()
-            # 仅统计属于当前用户且被 watched 的仓库下的 plugins，且 Release 为 visible
-            total_plugins = db.query(Plugin).join(Plugin.repository).join(Plugin.release).filter(Repository.author_id == current_user.id, Repository.watched == True, Release.visible == True).count()
-
+        counts = get_dashboard_counts(db, 0 if current_user.is_admin else current_user.id)
         return {
-            "total_plugins": int(total_plugins or 0),
-            "installed_repos": int(installed_repos or 0),
-            "watched_repos": int(watched_repos or 0),
+            "total_plugins": int(counts["total_plugins"] or 0),
+            "installed_repos": int(counts["installed_repos"] or 0),
+            "watched_repos": int(counts["watched_repos"] or 0),
         }
-    except Exception as e:
+    except Exception:
         logger.exception("Failed to compute stats")
         raise HTTPException(status_code=500, detail="Failed to compute stats")
 
 
+@app.post("/api/stats/reconcile", tags=["Stats"])
+def reconcile_stats(current_user: CurrentUser = Depends(get_admin)):
+    """
+    立即对账仪表盘计数：从业务表重新计算，返回并修正计数表与实际值的偏差（stored - actual）
+    对账会扫描业务表，在线程池中执行。
+    """
+    return reconcile_counters()
+
+
+@app.get("/api/stats/plugin_json_cache", tags=["Stats"])
+async def get_plugin_json_cache_stats(current_user: CurrentUser = Depends(get_admin)):
+    """
+    plugin.json 下载缓存：命中 / 未命中 / 淘汰次数、占用字节数，以及因内容未变化而跳过重写的插件数
+    """
+    return cache_stats()
+
+
+@app.get("/api/stats/index_sync", tags=["Stats"])
+async def get_index_sync_stats(current_user: CurrentUser = Depends(get_admin)):
+    """
+    索引仓库同步：入队 / 合并的更新数、提交次数、GitHub API 调用次数、分支头移动导致的重试次数，以及待同步的插件数
+    """
+    return index_sync.stats()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8100)
\ No newline at end of file
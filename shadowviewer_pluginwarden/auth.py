@@ -1,4 +1,7 @@
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
 from urllib.parse import urlencode
 
 import requests
@@ -6,7 +9,7 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import RedirectResponse
 
 from config import settings
-from models import get_session, get_or_create_author, Author, Repository
+from models import get_session, get_or_create_author, hash_token, Author, Repository
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -15,6 +18,59 @@ GITHUB_ACCESS_TOKEN_URL = "https://github.com/login/oauth/access_token"
 GITHUB_USER_API = "https://api.github.com/user"
 
 
+class CurrentUser(NamedTuple):
+    """已认证用户的快照：接口需要的公开资料与权限标记，不含 token"""
+    id: int
+    login: str
+    avatar_url: Optional[str]
+    html_url: Optional[str]
+    type: Optional[str]
+    is_admin: bool
+
+    @classmethod
+    def from_author(cls, author: Author) -> "CurrentUser":
+        return cls(author.id, author.login, author.avatar_url, author.html_url, author.type, bool(author.is_admin))
+
+
+# token 认证缓存：sha256(token) -> (过期时间, CurrentUser)，不保存明文 token
+_token_cache: "OrderedDict[str, Tuple[float, CurrentUser]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def invalidate_token(token: str):
+    """移除某个 token 的缓存（登出时调用）"""
+    with _token_cache_lock:
+        _token_cache.pop(hash_token(token), None)
+
+
+def invalidate_author(author_id: int):
+    """移除某个作者的全部缓存（登录、管理员标记变更时调用）"""
+    with _token_cache_lock:
+        for key in [k for k, (_, user) in _token_cache.items() if user.id == author_id]:
+            del _token_cache[key]
+
+
+def _cached_user(token_hash: str) -> Optional[CurrentUser]:
+    with _token_cache_lock:
+        entry = _token_cache.get(token_hash)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _token_cache[token_hash]
+            return None
+        _token_cache.move_to_end(token_hash)
+        return user
+
+
+def _cache_user(token_hash: str, user: CurrentUser):
+    with _token_cache_lock:
+        _token_cache[token_hash] = (time.monotonic() + settings.auth_cache_ttl, user)
+        _token_cache.move_to_end(token_hash)
+        while len(_token_cache) > settings.auth_cache_size:
+            _token_cache.popitem(last=False)
+
+
 @router.get("/login")
 def login(request: Request):
     """Redirect user to GitHub OAuth authorize page."""
@@ -61,6 +117,7 @@ def callback(code: Optional[str] = None):
     with get_session() as session:
         author = get_or_create_author(session, user_json, access_token=access_token, token_scopes=scope, mark_admin=mark_admin)
         session.commit()
+        invalidate_author(author.id)
     resp = RedirectResponse(url="/")
     # In production, set secure=True and samesite adjustments
     resp.set_cookie(key="access_token", value=access_token, httponly=True, secure=False)
@@ -70,15 +127,19 @@ def callback(code: Optional[str] = None):
 @router.get("/logout")
 def logout(request: Request):
     """Clear access token cookie and redirect to home."""
+    token = request.cookies.get("access_token")
+    if token:
+        invalidate_token(token)
     resp = RedirectResponse(url="/")
     resp.delete_cookie(key="access_token")
     return resp
 
 
 def get_current_user(request: Request):
-    """Dependency: validate access token (cookie or Authorization header), persist it to Author, and return Author DB instance.
+    """Dependency: validate access token (cookie or Authorization header) against the persisted Author.
 
-    Raises 401 if missing/invalid. Returns SQLAlchemy `Author` instance on success.
+    Raises 401 if missing/invalid. Returns a `CurrentUser` snapshot (no token) on success,
+    served from a short TTL cache keyed by the token hash.
     """
     token = None
     auth_header = request.headers.get("Authorization")
@@ -89,20 +150,24 @@ def get_current_user(request: Request):
 
     if not token:
         raise HTTPException(status_code=401, detail="Unauthorized: missing token")
-    # 直接在数据库中匹配持久化的 token，避免每次请求都调用 GitHub
+    # 先查 TTL 缓存，未命中再按 token 哈希索引匹配持久化的 token，避免每次请求都调用 GitHub
+    token_hash = hash_token(token)
+    user = _cached_user(token_hash)
+    if user is not None:
+        return user
     with get_session() as session:
-        author = session.query(Author).filter(Author.access_token == token).first()
-        if not author:
+        author = session.query(Author).filter(Author.access_token_hash == token_hash).first()
+        if not author or author.access_token != token:
             raise HTTPException(status_code=401, detail="Unauthorized: token not recognized")
-        # refresh to ensure latest fields
-        session.refresh(author)
-        return author
+        user = CurrentUser.from_author(author)
+    _cache_user(token_hash, user)
+    return user
 
 
 def get_admin(request: Request):
     """Dependency: get current user and verify admin status.
 
-    Raises 403 if not admin. Returns SQLAlchemy `Author` instance on success.
+    Raises 403 if not admin. Returns the `CurrentUser` snapshot on success.
     """
     author = get_current_user(request)
     if not author.is_admin:
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 
-from auth import get_admin, get_current_user
+from auth import CurrentUser, get_admin, get_current_user
 from models import Author, get_db
 from res_model import AuthorModel
 
@@ -12,7 +12,7 @@ from res_model import AuthorModel
 router = APIRouter(prefix="/authors", tags=["Author"])
 
 @router.get("/me", response_model=AuthorModel, tags=["Authors"])
-def me(current_user: Author = Depends(get_current_user)):
+def me(current_user: CurrentUser = Depends(get_current_user)):
     """获取当前登录用户的信息"""
     return current_user
 
@@ -0,0 +1,186 @@
+"""回填已安装仓库的全部 releases。
+
+    python backfill.py                       # 回填所有 Repository.installed 的仓库
+    python backfill.py --repo owner/name     # 只回填指定仓库（可重复）
+    python backfill.py --workers 8 --no-auth
+
+按 Link 头逐页读取 /releases，请求时带上上次成功处理的 ETag（If-None-Match），
+304 响应不计入 GitHub 的速率限制，且整页跳过入库；多个仓库由有界线程池并行处理，
+每页结果交给 save_releases_to_db 入库。
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from loguru import logger
+
+from config import settings
+from http_client import http_client
+from models import GithubEtag, Repository, get_session, save_releases_to_db
+
+# 管理接口触发的回填任务状态
+_state_lock = threading.Lock()
+_state = {"running": False, "started_at": None, "report": None}
+
+
+class BackfillStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.repositories = 0
+        self.pages = 0
+        self.not_modified = 0
+        self.releases = 0
+        self.errors: List[str] = []
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def error(self, message: str):
+        logger.error(message)
+        with self._lock:
+            self.errors.append(message)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        requests = self.pages + self.not_modified
+        return {
+            "repositories": self.repositories,
+            "requests": requests,
+            "pages_ingested": self.pages,
+            "not_modified": self.not_modified,
+            "releases": self.releases,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "releases_per_second": round(self.releases / elapsed, 2) if elapsed else 0.0,
+            "requests_per_second": round(requests / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def _first_page_url(full_name: str) -> str:
+    return f"{settings.github_api_url}/repos/{full_name}/releases?per_page={settings.backfill_per_page}"
+
+
+def _get(url: str, etag: Optional[str], token_provider: Optional[Callable[[], str]]):
+    """GET 一页；每次请求时重新获取令牌（安装令牌一小时后过期，长时间回填中途会更换），401 时换新令牌重试一次"""
+    headers = {"Accept": "application/vnd.github+json"}
+    if etag:
+        headers["If-None-Match"] = etag
+    for attempt in range(2):
+        if token_provider:
+            headers["Authorization"] = f"token {token_provider()}"
+        response = http_client.get(url, headers=headers)
+        if response.status_code != 401 or not token_provider:
+            break
+        logger.warning(f"GET {url} returned 401, retrying with a fresh token")
+    return response
+
+
+def backfill_repository(full_name: str, stats: BackfillStats, token_provider: Optional[Callable[[], str]] = None):
+    """逐页回填一个仓库的 releases；ETag 只在该页入库成功后更新"""
+    url = _first_page_url(full_name)
+    while url:
+        with get_session() as session:
+            cached = session.get(GithubEtag, url)
+            etag, cached_next = (cached.etag, cached.next_url) if cached else (None, None)
+        response = _get(url, etag, token_provider)
+        if response.status_code == 304:
+            # 该页与上次成功入库时相同，沿用记录的下一页地址
+            stats.add(not_modified=1)
+            url = cached_next
+            continue
+        if response.status_code != 200:
+            stats.error(f"{full_name}: GET {url} returned {response.status_code}")
+            return
+        releases = response.json()
+        if not isinstance(releases, list):
+            stats.error(f"{full_name}: GET {url} returned an unexpected payload")
+            return
+        next_url = response.links.get("next", {}).get("url")
+        if releases:
+            save_releases_to_db("release", "backfill", full_name, releases)
+        stats.add(pages=1, releases=len(releases))
+        new_etag = response.headers.get("ETag")
+        if new_etag:
+            with get_session() as session:
+                session.merge(GithubEtag(url=url, etag=new_etag, next_url=next_url, updated_at=datetime.now()))
+                session.commit()
+        url = next_url
+    stats.add(repositories=1)
+
+
+def installed_repositories() -> List[str]:
+    with get_session() as session:
+        return [name for (name,) in session.query(Repository.full_name).filter(Repository.installed == True).order_by(Repository.id)]
+
+
+def run_backfill(full_names: Optional[Iterable[str]] = None, workers: int = None,
+                 token_provider: Optional[Callable[[], str]] = None) -> dict:
+    """回填指定仓库（默认所有已安装仓库），返回吞吐统计"""
+    full_names = list(full_names) if full_names else installed_repositories()
+    stats = BackfillStats()
+
+    def run(full_name):
+        try:
+            backfill_repository(full_name, stats, token_provider)
+        except Exception as e:
+            stats.error(f"{full_name}: {e!r}")
+
+    with ThreadPoolExecutor(max_workers=max(workers or settings.backfill_workers, 1), thread_name_prefix="backfill") as pool:
+        list(pool.map(run, full_names))
+    report = stats.report()
+    logger.info(f"Backfill finished: {report}")
+    return report
+
+
+def _default_token() -> str:
+    from github_utils import installation_token
+    return installation_token()
+
+
+def start_backfill_job(full_names: Optional[List[str]] = None) -> bool:
+    """在后台线程中启动回填，已有回填在运行时返回 False"""
+    with _state_lock:
+        if _state["running"]:
+            return False
+        _state.update(running=True, started_at=datetime.now().isoformat(), report=None)
+
+    def run():
+        try:
+            report = run_backfill(full_names, token_provider=_default_token)
+        except Exception as e:
+            logger.exception("Backfill job failed")
+            report = {"errors": [repr(e)]}
+        with _state_lock:
+            _state.update(running=False, report=report)
+
+    threading.Thread(target=run, name="backfill-job", daemon=True).start()
+    return True
+
+
+def backfill_status() -> dict:
+    with _state_lock:
+        return dict(_state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill releases of installed repositories")
+    parser.add_argument("--repo", action="append", help="full name of a repository to backfill (repeatable)")
+    parser.add_argument("--workers", type=int, default=settings.backfill_workers)
+    parser.add_argument("--no-auth", action="store_true", help="call the GitHub API without the installation token")
+    args = parser.parse_args()
+    try:
+        report = run_backfill(args.repo, args.workers, None if args.no_auth else _default_token)
+    finally:
+        http_client.close()
+    for name, value in report.items():
+        print(f"{name:<22} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""性能基准脚本（使用临时数据库，不会修改 db.sqlite）。
+
+    python bench.py plans     # 各接口热点查询在执行迁移（添加索引）前后的执行计划与耗时
+    python bench.py mixed     # 读写混合吞吐：默认 SQLite 对比 WAL 调优后的 SQLite（或 --url 指定的数据库）
+    python bench.py ingest    # save_releases_to_db 入库（首次与重复入库）每个 release 的 SQL 条数与耗时
+    python bench.py serialize # 商店分页响应（200 条）的序列化耗时：pydantic + json 对比 orjson 与预序列化片段拼接
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event, inspect, text
+
+# models 在导入时按 DATABASE_URL 建表并执行迁移：导入前指向临时目录中的数据库，避免创建或迁移 db.sqlite
+_IMPORT_DIR = tempfile.mkdtemp(prefix="pluginwarden-bench-")
+atexit.register(shutil.rmtree, _IMPORT_DIR, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_IMPORT_DIR, 'import.sqlite')}"
+
+from migrations import run_migrations, schema_migrations
+import models
+import plugin_cache
+import revision
+from models import Base, create_db_engine
+from res_model import PaginatedResponse, PluginModel
+from responses import ORJSONResponse, dump_fragment, fragment_page
+from search_index import drop_search_indexes
+from versions import version_key
+
+# (接口, 说明, SQL, 参数)
+PLAN_QUERIES = [
+    ("POST /api/store/plugins/version", "versions of one plugin",
+     "SELECT plugins.version FROM plugins JOIN releases ON releases.id = plugins.release_id "
+     "WHERE plugins.plugin_id = :plugin_id AND releases.visible = :visible ORDER BY plugins.version_key, plugins.id",
+     {"plugin_id": "plugin-42", "visible": True}),
+    ("POST /api/webhook (release)", "release by (repository_id, tag_name)",
+     "SELECT * FROM releases WHERE repository_id = :repository_id AND tag_name = :tag_name",
+     {"repository_id": 42, "tag_name": "v1.0.7"}),
+    ("POST /api/webhook (release)", "asset by (release_id, name)",
+     "SELECT * FROM assets WHERE release_id = :release_id AND name = 'plugin.json'",
+     {"release_id": 1234}),
+    ("POST /api/webhook (release)", "plugin by release_id",
+     "SELECT * FROM plugins WHERE release_id = :release_id",
+     {"release_id": 1234}),
+    ("GET /api/store/plugins", "dependencies of a catalog page (selectinload)",
+     "SELECT * FROM dependencies WHERE plugin_id IN (1, 50, 100, 150, 200, 250, 300, 350, 400, 450)",
+     {}),
+    ("PATCH /api/repositories/{id}/watched", "plugin ids of a repository",
+     "SELECT DISTINCT plugin_id FROM plugins WHERE repository_id = :repository_id",
+     {"repository_id": 42}),
+    ("GET /api/repositories/", "repositories of an author",
+     "SELECT * FROM repositories WHERE author_id = :author_id",
+     {"author_id": 7}),
+    ("GET /api/webhook_logs (admin)", "logs of one day",
+     "SELECT * FROM webhook_logs WHERE created_at >= :start AND created_at < :end ORDER BY created_at",
+     {"start": datetime(2024, 3, 1), "end": datetime(2024, 3, 2)}),
+    ("GET /api/webhook_logs (author)", "logs of one day for an author",
+     "SELECT * FROM webhook_logs WHERE created_at >= :start AND created_at < :end AND author_id = :author_id "
+     "ORDER BY created_at",
+     {"start": datetime(2024, 3, 1), "end": datetime(2024, 3, 2), "author_id": 7}),
+    ("* get_current_user", "author by token hash",
+     "SELECT * FROM authors WHERE access_token_hash = :h",
+     {"h": "0" * 64}),
+]
+
+
+def _populate(engine, repos: int, releases_per_repo: int, logs: int):
+    rnd = random.Random(0)
+    authors = [{"id": i, "login": f"user{i}", "is_admin": False, "access_token_hash": f"{i:064x}"} for i in range(1, 51)]
+    repositories, releases, assets, plugins, deps = [], [], [], [], []
+    for r in range(1, repos + 1):
+        repositories.append({"id": r, "name": f"repo{r}", "full_name": f"owner/repo{r}", "installed": True,
+                             "watched": True, "author_id": rnd.randint(1, 50)})
+        for n in range(releases_per_repo):
+            rid = len(releases) + 1
+            version = f"1.0.{n}"
+            releases.append({"id": rid, "github_id": rid, "repository_id": r, "tag_name": f"v{version}",
+                             "name": version, "visible": True, "draft": False, "prerelease": False})
+            for name in ("plugin.json", f"plugin-{r}.sdow", "logo.png"):
+                assets.append({"release_id": rid, "name": name, "browser_download_url": f"https://example/{rid}/{name}"})
+            plugins.append({"id": rid, "plugin_id": f"plugin-{r}", "release_id": rid, "repository_id": r,
+                            "version": version, "version_key": version_key(version)})
+            for d in range(2):
+                deps.append({"plugin_id": rid, "dep_id": f"plugin-{rnd.randint(1, repos)}", "need": ">=1.0.0"})
+    start = datetime(2024, 1, 1)
+    webhook_logs = [{"author_id": rnd.randint(1, 50), "repository_id": rnd.randint(1, repos), "event": "release",
+                     "action": "published", "payload": "...", "level": 1,
+                     "created_at": start + timedelta(seconds=rnd.randint(0, 180 * 86400))} for _ in range(logs)]
+    with engine.begin() as conn:
+        for table, rows in (("authors", authors), ("repositories", repositories), ("releases", releases),
+                            ("assets", assets), ("plugins", plugins), ("dependencies", deps),
+                            ("webhook_logs", webhook_logs)):
+            conn.execute(Base.metadata.tables[table].insert(), rows)
+
+
+def _plan(conn, sql: str, params: dict) -> str:
+    rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+    return "; ".join(row[-1] for row in rows)
+
+
+def _timing(conn, sql: str, params: dict, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(text(sql), params).all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def cmd_plans(args):
+    fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    try:
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        # 模拟迁移前的数据库：删除所有二级索引
+        with engine.begin() as conn:
+            names = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")).scalars().all()
+            for name in names:
+                conn.execute(text(f"DROP INDEX {name}"))
+        _populate(engine, args.repos, args.releases, args.logs)
+
+        results = []
+        with engine.connect() as conn:
+            for endpoint, desc, sql, params in PLAN_QUERIES:
+                results.append([endpoint, desc, _plan(conn, sql, params), _timing(conn, sql, params, args.repeat)])
+        applied = run_migrations(engine, Base.metadata)
+        with engine.connect() as conn:
+            conn.execute(text("ANALYZE"))
+            for result, (_, _, sql, params) in zip(results, PLAN_QUERIES):
+                result += [_plan(conn, sql, params), _timing(conn, sql, params, args.repeat)]
+        engine.dispose()
+    finally:
+        os.remove(path)
+
+    print(f"dataset: {args.repos} repositories x {args.releases} releases, {args.logs} webhook logs; "
+          f"migrations applied: {applied}\n")
+    for endpoint, desc, plan_before, ms_before, plan_after, ms_after in results:
+        print(f"{endpoint} - {desc}")
+        print(f"  before: {ms_before:8.3f} ms  {plan_before}")
+        print(f"  after:  {ms_after:8.3f} ms  {plan_after}")
+
+
+def _mixed_run(engine, readers: int, writers: int, seconds: float, repos: int) -> dict:
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        while time.perf_counter() < deadline:
+            try:
+                with engine.connect() as conn:
+                    sql, params = PLAN_QUERIES[0][2], {**PLAN_QUERIES[0][3], "plugin_id": f"plugin-{rnd.randint(1, repos)}"}
+                    conn.execute(text(sql), params).all()
+                    day = datetime(2024, 1, 1) + timedelta(days=rnd.randint(0, 179))
+                    conn.execute(text(PLAN_QUERIES[7][2]), {"start": day, "end": day + timedelta(days=1)}).all()
+                key = "reads"
+            except Exception:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    def writer(seed):
+        rnd = random.Random(seed)
+        while time.perf_counter() < deadline:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(Base.metadata.tables["webhook_logs"].insert().values(
+                        author_id=rnd.randint(1, 50), repository_id=rnd.randint(1, repos), event="release",
+                        action="edited", payload="...", level=1, created_at=datetime.now()))
+                    conn.execute(text("UPDATE plugins SET description = :d WHERE id = :id"),
+                                 {"d": str(rnd.random()), "id": rnd.randint(1, repos)})
+                key = "writes"
+            except Exception:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counts
+
+
+def cmd_mixed(args):
+    if args.url:
+        targets = [(args.url, args.url, True)]
+    else:
+        targets = [("sqlite (default journal)", None, False), ("sqlite (WAL + pragmas)", None, True)]
+
+    print(f"{args.readers} readers / {args.writers} writers, {args.seconds}s per run\n")
+    for label, url, tuned in targets:
+        path = None
+        if url is None:
+            fd, path = tempfile.mkstemp(suffix=".sqlite")
+            os.close(fd)
+            url = f"sqlite:///{path}"
+        engine = create_db_engine(url, tuned=tuned)
+        if path is None and inspect(engine).get_table_names():
+            # 基准会写入并在结束时删除全部表，只允许在空数据库上运行
+            raise SystemExit(f"{label} is not empty, use a dedicated database for benchmarks")
+        try:
+            run_migrations(engine, Base.metadata)
+            _populate(engine, args.repos, 5, 20000)
+            counts = _mixed_run(engine, args.readers, args.writers, args.seconds, args.repos)
+        finally:
+            if path is None:
+                Base.metadata.drop_all(engine)
+                schema_migrations.drop(engine, checkfirst=True)
+                with engine.begin() as conn:
+                    drop_search_indexes(conn)
+            engine.dispose()
+            if path:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+        print(f"{label:<26} {counts['reads'] / args.seconds:9.1f} reads/s  "
+              f"{counts['writes'] / args.seconds:9.1f} writes/s  {counts['errors']} errors")
+
+
+def _serve_files(files: dict, hits: list = None):
+    """在本地线程中提供静态文件（模拟 release 中的 plugin.json 下载），每次请求的路径追加到 hits"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if hits is not None:
+                hits.append(self.path)
+            body = files.get(self.path, "").encode("utf-8")
+            self.send_response(200 if self.path in files else 404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _release_payloads(base_url: str, files: dict, count: int) -> list:
+    user = {"id": 1, "login": "bench", "avatar_url": "a", "html_url": "h", "type": "User"}
+    releases = []
+    for n in range(count):
+        tag = f"v1.{n}.0"
+        path = f"/owner/repo/{tag}/plugin.json"
+        files[path] = json.dumps({
+            "Id": "bench-plugin", "Name": "Bench", "Version": tag[1:], "SdkVersion": "1.0.0",
+            "Description": "benchmark plugin", "Authors": "bench",
+            "Dependencies": [{"Id": "dep-a", "Need": ">=1.0.0"}, {"Id": "dep-b", "Need": ">=2.0.0"}],
+            "PluginStore": {"Tags": ["tool", "bench"], "BackgroundColor": "#fff"},
+        })
+        assets = []
+        for i, name in enumerate(("plugin.json", "bench.sdow", "logo.png")):
+            assets.append({
+                "id": n * 10 + i + 1, "name": name, "label": None, "content_type": "application/octet-stream",
+                "state": "uploaded", "size": len(files[path]) if name == "plugin.json" else 100,
+                "download_count": 0, "uploader": user,
+                "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z",
+                "browser_download_url": base_url + path if name == "plugin.json" else f"https://example/{tag}/{name}",
+            })
+        releases.append({
+            "id": n + 1, "tag_name": tag, "name": tag, "body": "", "draft": False, "prerelease": False,
+            "created_at": "2024-01-01T00:00:00Z", "published_at": "2024-01-02T00:00:00Z",
+            "html_url": "h", "tarball_url": "t", "zipball_url": "z", "author": user, "assets": assets,
+        })
+    return releases
+
+
+def cmd_ingest(args):
+    fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    files, downloads = {}, []
+    server, base_url = _serve_files(files, downloads)
+    try:
+        engine = create_db_engine(f"sqlite:///{path}")
+        run_migrations(engine, Base.metadata)
+        # 入库代码使用全局会话工厂与目录修订号，指向临时数据库
+        models.get_session.configure(bind=engine)
+        revision.attach(engine)
+        with engine.begin() as conn:
+            conn.execute(Base.metadata.tables["repositories"].insert().values(
+                id=1, name="repo", full_name="owner/repo", installed=True, watched=True))
+        releases = _release_payloads(base_url, files, args.releases)
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+        print(f"{args.releases} releases x 3 assets, one plugin.json each\n")
+        for label, action in (("first ingest", "published"), ("re-ingest (edited)", "edited"), ("after restart", "edited")):
+            if label == "after restart":
+                # 清空进程内缓存，相当于重启后再次入库：由数据库中的 raw_json 满足，不重新下载
+                plugin_cache.clear()
+            statements.clear()
+            downloads.clear()
+            start = time.perf_counter()
+            models.save_releases_to_db("release", action, "owner/repo", releases)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<20} {len(statements):6d} statements  {len(statements) / args.releases:7.2f} per release  "
+                  f"{len(downloads):5d} downloads  {elapsed * 1000:8.1f} ms")
+        print(f"\nplugin.json cache: {plugin_cache.cache_stats()}")
+        engine.dispose()
+    finally:
+        server.shutdown()
+        models.http_client.close()
+        os.remove(path)
+
+
+def _plugin_models(count: int) -> list:
+    return [
+        PluginModel(
+            Id=f"plugin-{n}", Name=f"Plugin {n}", Version="1.2.3", Versions=["1.0.0", "1.1.0", "1.2.3"],
+            BackgroundColor="#ffffff", Tags=["tool", "reader", "bench"], Description="一个用于基准测试的插件 " * 4,
+            Authors="bench", WebUri=f"https://github.com/owner/plugin-{n}", Logo=f"https://example/{n}/logo.png",
+            SdkVersion="1.0.0", Dependencies=[{"Id": "dep-a", "Need": ">=1.0.0"}, {"Id": "dep-b", "Need": ">=2.0.0"}],
+            DownloadUrl=f"https://example/{n}/plugin.sdow", LastUpdated=datetime.now().isoformat(),
+        )
+        for n in range(count)
+    ]
+
+
+def cmd_serialize(args):
+    items = _plugin_models(args.items)
+    fragments = [dump_fragment(model) for model in items]
+    page_type = PaginatedResponse[PluginModel]
+    adapter = TypeAdapter(page_type)
+    meta = {"total": len(items), "page": 1, "limit": len(items), "pages": 1}
+
+    def pydantic_json():
+        # 此前的路径：构造响应模型，FastAPI 按 response_model 校验并转换为 JSON 兼容对象，再由 JSONResponse 编码
+        page = page_type(items=items, **meta)
+        value = adapter.validate_python(page.model_dump())
+        return JSONResponse(adapter.dump_python(value, mode="json")).body
+
+    def orjson_models():
+        return ORJSONResponse({**meta, "items": [model.model_dump() for model in items]}).body
+
+    def fragments_concat():
+        return fragment_page(meta, fragments).body
+
+    assert json.loads(pydantic_json()) == json.loads(orjson_models()) == json.loads(fragments_concat())
+    print(f"{args.items}-item page, {len(fragments_concat())} bytes, {args.iterations} iterations\n")
+    for label, fn in (("pydantic + json", pydantic_json), ("orjson (model_dump)", orjson_models),
+                      ("pre-serialized fragments", fragments_concat)):
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) / args.iterations
+        print(f"{label:<26} {elapsed * 1e6:9.1f} us/page")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShadowViewer.PluginWarden benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plans = sub.add_parser("plans", help="query plans before/after migrations")
+    plans.add_argument("--repos", type=int, default=200)
+    plans.add_argument("--releases", type=int, default=25)
+    plans.add_argument("--logs", type=int, default=50000)
+    plans.add_argument("--repeat", type=int, default=20)
+    plans.set_defaults(func=cmd_plans)
+
+    mixed = sub.add_parser("mixed", help="mixed read/write throughput")
+    mixed.add_argument("--url", help="database URL to test instead of comparing SQLite journal modes")
+    mixed.add_argument("--readers", type=int, default=8)
+    mixed.add_argument("--writers", type=int, default=2)
+    mixed.add_argument("--seconds", type=float, default=5.0)
+    mixed.add_argument("--repos", type=int, default=200)
+    mixed.set_defaults(func=cmd_mixed)
+
+    ingest = sub.add_parser("ingest", help="statements per release in save_releases_to_db")
+    ingest.add_argument("--releases", type=int, default=200)
+    ingest.set_defaults(func=cmd_ingest)
+
+    serialize = sub.add_parser("serialize", help="store page serialization cost")
+    serialize.add_argument("--items", type=int, default=200)
+    serialize.add_argument("--iterations", type=int, default=500)
+    serialize.set_defaults(func=cmd_serialize)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
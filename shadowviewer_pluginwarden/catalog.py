@@ -0,0 +1,270 @@
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy.orm import Session, selectinload
+
+from models import Plugin, Release, Repository, get_session
+from res_model import PluginModel
+from responses import dump_fragment
+from revision import changes_since, get_catalog_revision
+from versions import version_key
+
+
+def plugin_to_model(plugin: Plugin, versions: List[str]) -> PluginModel:
+    """将 Plugin 记录转换为商店返回的 PluginModel"""
+    dependencies = [{"Id": d.dep_id, "Need": d.need} for d in (plugin.dependencies or [])]
+    tags = [i.tag for i in plugin.tags] if plugin.tags else []
+    return PluginModel(
+        Id=plugin.plugin_id,
+        Name=plugin.name,
+        Version=plugin.version,
+        Versions=versions,
+        Tags=tags,
+        BackgroundColor=plugin.background_color,
+        Description=plugin.description,
+        Authors=plugin.authors,
+        WebUri=plugin.web_uri,
+        Logo=plugin.logo,
+        SdkVersion=plugin.sdk_version,
+        Dependencies=dependencies,
+        DownloadUrl=plugin.download_url,
+        LastUpdated=plugin.updated_at.isoformat() if plugin.updated_at else None,
+    )
+
+
+def _chunks(values: list, size: int = 500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def load_latest_plugins(session: Session, plugin_ids: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, PluginModel]]:
+    """查询每个 plugin_id 的最新可见版本，返回 {plugin_id: (Plugin.id, PluginModel)}
+
+    plugin_ids 为 None 时加载全部插件。
+    """
+    q = session.query(Plugin.id, Plugin.plugin_id, Plugin.version).join(Plugin.release).filter(
+        Release.visible == True, Plugin.plugin_id.isnot(None)
+    )
+    if plugin_ids is not None:
+        plugin_ids = list(plugin_ids)
+        if not plugin_ids:
+            return {}
+        q = q.filter(Plugin.plugin_id.in_(plugin_ids))
+
+    # 每个 plugin_id 的所有可见版本（按版本键升序）以及最新版本对应的 Plugin.id，
+    # 走 (plugin_id, version_key) 索引，同一 plugin_id 的最后一行即最新版本
+    versions: Dict[str, List[str]] = {}
+    latest: Dict[str, int] = {}
+    rows = q.order_by(Plugin.plugin_id, Plugin.version_key.asc().nullsfirst(), Plugin.id).all()
+    for pk, plugin_id, version in rows:
+        if version is not None:
+            versions.setdefault(plugin_id, []).append(version)
+        latest[plugin_id] = pk
+
+    entries: Dict[str, Tuple[int, PluginModel]] = {}
+    latest_pks = list(latest.values())
+    for chunk in _chunks(latest_pks):
+        plugins = (
+            session.query(Plugin)
+            .join(Plugin.repository)
+            .filter(Plugin.id.in_(chunk), Repository.watched == True)
+            .options(
+                selectinload(Plugin.dependencies),
+                selectinload(Plugin.tags),
+            )
+            .all()
+        )
+        for plugin in plugins:
+            entries[plugin.plugin_id] = (plugin.id, plugin_to_model(plugin, versions.get(plugin.plugin_id, [])))
+    return entries
+
+
+class StoreCatalog:
+    """内存中的插件商店目录：每个 plugin_id 的最新可见版本，按 Plugin.id 倒序排列。
+
+    目录只在目录修订号变化时刷新：变更记录能覆盖时仅重新加载受影响的 plugin_id，
+    否则全量重建。每个条目在加载时同时序列化为 JSON 片段，读取请求只需要对预先构建好的列表切片，
+    分页响应直接拼接片段（fragments=True）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = -1
+        # {plugin_id: (Plugin.id, 条目, JSON 片段)}
+        self._entries: Dict[str, Tuple[int, PluginModel, bytes]] = {}
+        # (按 Plugin.id 倒序的条目, 对应的 -Plugin.id 升序列表, {Plugin.id: 条目}, 同序的 JSON 片段, {Plugin.id: JSON 片段})，
+        # 整体替换保证读者看到一致的视图
+        self._view: Tuple[List[PluginModel], List[int], Dict[int, PluginModel], List[bytes], Dict[int, bytes]] = ([], [], {}, [], {})
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def snapshot(self, fragments: bool = False) -> list:
+        """返回当前目录（按 Plugin.id 倒序），fragments 为 True 时返回 JSON 片段；必要时先刷新"""
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        return self._view[3] if fragments else self._view[0]
+
+    def page_after(self, last_id: Optional[int], limit: int, fragments: bool = False) -> Tuple[list, Optional[int]]:
+        """游标分页：返回 Plugin.id 小于 last_id 的下一页，以及下一页游标对应的 Plugin.id"""
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        items, keys, _, blobs, _ = self._view
+        start = 0 if last_id is None else bisect_right(keys, -last_id)
+        end = start + limit
+        next_id = -keys[end - 1] if end < len(keys) else None
+        return (blobs if fragments else items)[start:end], next_id
+
+    def with_ids(self) -> List[Tuple[int, PluginModel, bytes]]:
+        """返回当前目录的 (Plugin.id, 条目, JSON 片段) 列表（按 Plugin.id 倒序）"""
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        items, keys, _, blobs, _ = self._view
+        return [(-key, item, blob) for key, item, blob in zip(keys, items, blobs)]
+
+    def lookup(self, plugin_pks: Iterable[int], fragments: bool = False) -> list:
+        """按给定顺序返回 Plugin.id 对应的目录条目，跳过不在目录中的记录（旧版本、不可见或未 watched）"""
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        by_pk = self._view[4] if fragments else self._view[2]
+        return [by_pk[pk] for pk in plugin_pks if pk in by_pk]
+
+    def refresh(self):
+        with self._lock:
+            revision = get_catalog_revision()
+            if revision == self._revision:
+                return
+            changed = changes_since(self._revision) if self._revision >= 0 else None
+            with get_session() as session:
+                if changed is None:
+                    loaded = load_latest_plugins(session)
+                    entries = {}
+                    logger.info(f"Store catalog rebuilt at revision {revision}: {len(loaded)} plugins")
+                else:
+                    loaded = load_latest_plugins(session, changed)
+                    entries = dict(self._entries)
+                    for plugin_id in changed:
+                        entries.pop(plugin_id, None)
+            # 只序列化新加载的条目，其余沿用之前的片段
+            entries.update({plugin_id: (pk, model, dump_fragment(model)) for plugin_id, (pk, model) in loaded.items()})
+            self._entries = entries
+            ordered = sorted(entries.values(), key=lambda e: e[0], reverse=True)
+            self._view = (
+                [model for _, model, _ in ordered],
+                [-pk for pk, _, _ in ordered],
+                {pk: model for pk, model, _ in ordered},
+                [blob for _, _, blob in ordered],
+                {pk: blob for pk, _, blob in ordered},
+            )
+            self._revision = revision
+
+    def invalidate(self):
+        """丢弃当前目录，下次读取时全量重建"""
+        with self._lock:
+            self._revision = -1
+
+
+class VersionEntry(NamedTuple):
+    """更新检查使用的一个可见版本"""
+    pk: int
+    name: Optional[str]
+    version: str
+    key: str
+    sdk_version: Optional[str]
+    sdk_key: Optional[str]
+    download_url: Optional[str]
+
+
+def load_version_entries(session: Session, plugin_ids: Optional[Iterable[str]] = None) -> Dict[str, List[VersionEntry]]:
+    """查询商店中可见（Release 可见且仓库 watched）且版本号可解析的所有版本，返回 {plugin_id: 按版本键升序的版本}
+
+    plugin_ids 为 None 时加载全部插件；同一 plugin_id 的同一版本号只保留最后入库的一条。
+    """
+    q = (
+        session.query(Plugin.id, Plugin.plugin_id, Plugin.name, Plugin.version, Plugin.version_key,
+                      Plugin.sdk_version, Plugin.sdk_version_key, Plugin.download_url)
+        .join(Plugin.release)
+        .join(Plugin.repository)
+        .filter(Release.visible == True, Repository.watched == True, Plugin.plugin_id.isnot(None), Plugin.version_key.isnot(None))
+    )
+    rows = []
+    if plugin_ids is None:
+        rows = q.all()
+    else:
+        for chunk in _chunks(list(plugin_ids)):
+            rows.extend(q.filter(Plugin.plugin_id.in_(chunk)).all())
+
+    latest: Dict[Tuple[str, str], Tuple[str, VersionEntry]] = {}
+    for row in sorted(rows, key=lambda r: r.id):
+        latest[(row.plugin_id, row.version)] = (row.plugin_id, VersionEntry(
+            row.id, row.name, row.version, row.version_key, row.sdk_version, row.sdk_version_key, row.download_url))
+    entries: Dict[str, List[VersionEntry]] = {}
+    for plugin_id, entry in sorted(latest.values(), key=lambda e: (e[1].key, e[1].pk)):
+        entries.setdefault(plugin_id, []).append(entry)
+    return entries
+
+
+class LatestVersionIndex:
+    """内存中的版本索引：每个 plugin_id 的可见版本（按版本键升序），用于回答“已安装的插件有哪些更新”。
+
+    与 StoreCatalog 相同，在发布入库、可见性或 watched 变更使目录修订号变化后按变更记录增量刷新。
+    查询时对每个已安装插件只从最高版本向下查看比已安装版本新的版本，开销与已安装插件数相关，与目录大小无关。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = -1
+        # {plugin_id: 版本列表}，刷新时整体替换
+        self._entries: Dict[str, List[VersionEntry]] = {}
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def refresh(self):
+        with self._lock:
+            revision = get_catalog_revision()
+            if revision == self._revision:
+                return
+            changed = changes_since(self._revision) if self._revision >= 0 else None
+            with get_session() as session:
+                if changed is None:
+                    entries = load_version_entries(session)
+                    logger.info(f"Latest version index rebuilt at revision {revision}: {len(entries)} plugins")
+                else:
+                    loaded = load_version_entries(session, changed)
+                    entries = dict(self._entries)
+                    for plugin_id in changed:
+                        entries.pop(plugin_id, None)
+                    entries.update(loaded)
+            self._entries = entries
+            self._revision = revision
+
+    def latest(self, plugin_id: str, installed: Optional[str] = None, sdk_version: Optional[str] = None) -> Optional[VersionEntry]:
+        """plugin_id 比 installed 新、且 SdkVersion 不高于 sdk_version 的最高可见版本，没有时返回 None
+
+        installed 无法解析时视为未知版本，返回最高的兼容版本（与已安装版本号相同时除外）；
+        sdk_version 为空或无法解析时不检查兼容性，插件未声明 SdkVersion 时视为兼容。
+        """
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        installed_key, sdk_key = version_key(installed), version_key(sdk_version)
+        for entry in reversed(self._entries.get(plugin_id, ())):
+            if installed_key is not None and entry.key <= installed_key:
+                return None
+            if sdk_key is not None and entry.sdk_key is not None and entry.sdk_key > sdk_key:
+                continue
+            return None if entry.version == installed else entry
+        return None
+
+    def invalidate(self):
+        """丢弃当前索引，下次读取时全量重建"""
+        with self._lock:
+            self._revision = -1
+
+
+store_catalog = StoreCatalog()
+latest_versions = LatestVersionIndex()
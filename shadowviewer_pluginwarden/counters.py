@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import COUNTER_FIELDS, DashboardCounter, compute_dashboard_counts, get_session
+
+# 最近一次对账结果
+last_report: Optional[dict] = None
+
+
+def get_dashboard_counts(session: Session, author_id: int = 0) -> Dict[str, int]:
+    """读取仪表盘计数（author_id 为 0 表示全局），计数行不存在时按当前数据计算并保存"""
+    counter = session.get(DashboardCounter, author_id)
+    if counter is not None:
+        return {field: getattr(counter, field) for field in COUNTER_FIELDS}
+    values = compute_dashboard_counts(session, author_id)[author_id]
+    try:
+        session.add(DashboardCounter(author_id=author_id, **values))
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+    return values
+
+
+def reconcile_counters() -> dict:
+    """从业务表重新计算全部计数并与计数表比对，修正偏差并返回对账结果"""
+    global last_report
+    drift = {}
+    with get_session() as session:
+        # 先锁住计数行（PostgreSQL），对账期间的增量更新会等待对账提交后再累加
+        rows = {row.author_id: row for row in session.query(DashboardCounter).with_for_update()}
+        expected = compute_dashboard_counts(session)
+        for author_id in set(rows) | set(expected):
+            values = expected.get(author_id, dict.fromkeys(COUNTER_FIELDS, 0))
+            row = rows.get(author_id)
+            if row is None:
+                session.add(DashboardCounter(author_id=author_id, **values))
+                continue
+            diff = {field: getattr(row, field) - values[field] for field in COUNTER_FIELDS if getattr(row, field) != values[field]}
+            if diff:
+                drift[author_id] = diff
+                for field in COUNTER_FIELDS:
+                    setattr(row, field, values[field])
+        session.commit()
+    if drift:
+        logger.warning(f"Dashboard counters drifted and were corrected (stored - actual): {drift}")
+    last_report = {"checked_at": datetime.now().isoformat(), "rows": len(set(rows) | set(expected)), "drift": drift}
+    return last_report
@@ -0,0 +1,294 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Dependency, Plugin, Release, Repository, get_session
+from revision import changes_since, get_catalog_revision
+from versions import parse_need, satisfies
+
+
+class DependencyNode(NamedTuple):
+    """商店中可见的一个插件版本及其依赖 (dep_id, need)"""
+    pk: int
+    plugin_id: str
+    version: Optional[str]
+    key: Optional[str]
+    download_url: Optional[str]
+    dependencies: Tuple[Tuple[str, Optional[str]], ...]
+
+
+def _chunks(values: list, size: int = 500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def load_dependency_nodes(session: Session, plugin_ids: Optional[Iterable[str]] = None) -> Dict[str, List[DependencyNode]]:
+    """查询商店中可见（Release 可见且仓库 watched）的所有版本及其依赖，返回 {plugin_id: 按版本键升序的版本}
+
+    plugin_ids 为 None 时加载全部插件；同一 plugin_id 的同一版本号只保留最后入库的一条。
+    """
+    q = (
+        session.query(Plugin.id, Plugin.plugin_id, Plugin.version, Plugin.version_key, Plugin.download_url)
+        .join(Plugin.release)
+        .join(Plugin.repository)
+        .filter(Release.visible == True, Repository.watched == True, Plugin.plugin_id.isnot(None))
+    )
+    rows = []
+    if plugin_ids is None:
+        rows = q.all()
+    else:
+        for chunk in _chunks(list(plugin_ids)):
+            rows.extend(q.filter(Plugin.plugin_id.in_(chunk)).all())
+
+    dependencies: Dict[int, List[Tuple[str, Optional[str]]]] = {}
+    for chunk in _chunks([row.id for row in rows]):
+        deps = session.query(Dependency.plugin_id, Dependency.dep_id, Dependency.need).filter(
+            Dependency.plugin_id.in_(chunk)).order_by(Dependency.id)
+        for pk, dep_id, need in deps:
+            dependencies.setdefault(pk, []).append((dep_id, need))
+
+    latest: Dict[Tuple[str, Optional[str]], DependencyNode] = {}
+    for row in sorted(rows, key=lambda r: r.id):
+        latest[(row.plugin_id, row.version)] = DependencyNode(
+            row.id, row.plugin_id, row.version, row.version_key, row.download_url, tuple(dependencies.get(row.id, ())))
+    nodes: Dict[str, List[DependencyNode]] = {}
+    for node in sorted(latest.values(), key=lambda n: (n.key is not None, n.key or '', n.pk)):
+        nodes.setdefault(node.plugin_id, []).append(node)
+    return nodes
+
+
+class _Restart(Exception):
+    pass
+
+
+class DependencyGraph:
+    """内存中的依赖图：每个 plugin_id 的商店可见版本（按版本键升序）与依赖边，以及反向依赖索引。
+
+    与 StoreCatalog 相同，在目录修订号变化时按变更记录只重新加载受影响的 plugin_id，否则全量重建。
+    解析结果按 (plugin_id, version) 缓存，图变化时借助反向依赖索引只丢弃依赖了变更插件（直接或间接）的结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = -1
+        # {plugin_id: 版本列表}、{dep_id: 任一版本依赖它的 plugin_id}，刷新时整体替换
+        self._nodes: Dict[str, List[DependencyNode]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._resolved: "OrderedDict[Tuple[str, Optional[str]], dict]" = OrderedDict()
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def refresh(self):
+        with self._lock:
+            revision = get_catalog_revision()
+            if revision == self._revision:
+                return
+            changed = changes_since(self._revision) if self._revision >= 0 else None
+            with get_session() as session:
+                if changed is None:
+                    nodes = load_dependency_nodes(session)
+                    logger.info(f"Dependency graph rebuilt at revision {revision}: {len(nodes)} plugins")
+                else:
+                    loaded = load_dependency_nodes(session, changed)
+                    nodes = dict(self._nodes)
+                    for plugin_id in changed:
+                        nodes.pop(plugin_id, None)
+                    nodes.update(loaded)
+            if changed is None:
+                dependents = self._build_dependents(nodes.values())
+                self._resolved.clear()
+            else:
+                dependents = self._update_dependents(changed, nodes)
+                affected = self._affected(changed, dependents)
+                for key in [k for k in self._resolved if k[0] in affected]:
+                    del self._resolved[key]
+            self._nodes, self._dependents = nodes, dependents
+            self._revision = revision
+
+    @staticmethod
+    def _build_dependents(versions_lists: Iterable[List[DependencyNode]]) -> Dict[str, Set[str]]:
+        dependents: Dict[str, Set[str]] = {}
+        for versions in versions_lists:
+            for node in versions:
+                for dep_id, _ in node.dependencies:
+                    dependents.setdefault(dep_id, set()).add(node.plugin_id)
+        return dependents
+
+    def _update_dependents(self, changed: Set[str], nodes: Dict[str, List[DependencyNode]]) -> Dict[str, Set[str]]:
+        """从反向索引中移除变更插件原有的依赖边并加入新的依赖边（复制被修改的集合，读者看到的旧索引不变）"""
+        dependents = dict(self._dependents)
+        for plugin_id in changed:
+            for node in self._nodes.get(plugin_id, []):
+                for dep_id, _ in node.dependencies:
+                    if plugin_id in dependents.get(dep_id, ()):
+                        dependents[dep_id] = dependents[dep_id] - {plugin_id}
+        for plugin_id in changed:
+            for node in nodes.get(plugin_id, []):
+                for dep_id, _ in node.dependencies:
+                    dependents[dep_id] = dependents.get(dep_id, set()) | {plugin_id}
+        return {dep_id: ids for dep_id, ids in dependents.items() if ids}
+
+    @staticmethod
+    def _affected(changed: Set[str], dependents: Dict[str, Set[str]]) -> Set[str]:
+        """变更的插件以及直接或间接依赖它们的插件"""
+        affected = set(changed)
+        stack = list(changed)
+        while stack:
+            for plugin_id in dependents.get(stack.pop(), ()):
+                if plugin_id not in affected:
+                    affected.add(plugin_id)
+                    stack.append(plugin_id)
+        return affected
+
+    def resolve(self, plugin_id: str, version: Optional[str] = None) -> Optional[dict]:
+        """解析 plugin_id（version 为空时取最新可见版本）的传递依赖闭包，插件或版本不存在时返回 None"""
+        if self._revision != get_catalog_revision():
+            self.refresh()
+        key = (plugin_id, version)
+        with self._lock:
+            cached = self._resolved.get(key)
+            if cached is not None:
+                self._resolved.move_to_end(key)
+                return cached
+            revision, nodes = self._revision, self._nodes
+        versions = nodes.get(plugin_id)
+        if not versions:
+            return None
+        root = versions[-1] if version is None else next((n for n in reversed(versions) if n.version == version), None)
+        if root is None:
+            return None
+        result = _resolve(nodes, root)
+        with self._lock:
+            # 解析期间图已刷新时不缓存，避免缓存基于旧图的结果
+            if revision == self._revision:
+                self._resolved[key] = result
+                while len(self._resolved) > settings.resolve_cache_size:
+                    self._resolved.popitem(last=False)
+        return result
+
+    def invalidate(self):
+        """丢弃当前依赖图，下次读取时全量重建"""
+        with self._lock:
+            self._revision = -1
+
+
+def _label(node: DependencyNode) -> str:
+    return f"{node.plugin_id}@{node.version}"
+
+
+def _best(versions: List[DependencyNode], constraints: List[tuple]) -> Optional[DependencyNode]:
+    """满足全部约束的最高版本"""
+    for node in reversed(versions):
+        if all(satisfies(node.key, constraint) for _, constraint, _ in constraints):
+            return node
+    return None
+
+
+def _resolve(nodes: Dict[str, List[DependencyNode]], root: DependencyNode) -> dict:
+    """贪心解析：每个依赖选择满足已知全部约束的最高版本。
+
+    已选版本不满足后出现的约束时，记住该依赖的全部约束并从头重新遍历（约束只增不减，轮数有限）；
+    仍无法满足、依赖不存在或约束无法解析时记为冲突。返回的插件按安装顺序排列（被依赖的在前，根插件最后）。
+    """
+    pins: Dict[str, List[tuple]] = {}
+    for _ in range(len(nodes) + 1):
+        try:
+            return _walk(nodes, root, pins)
+        except _Restart:
+            continue
+    return _walk(nodes, root, pins, restart=False)
+
+
+def _walk(nodes: Dict[str, List[DependencyNode]], root: DependencyNode, pins: Dict[str, List[tuple]], restart: bool = True) -> dict:
+    selected: Dict[str, DependencyNode] = {root.plugin_id: root}
+    depth: Dict[str, int] = {root.plugin_id: 0}
+    required_by: Dict[str, List[str]] = {root.plugin_id: []}
+    constraints: Dict[str, List[tuple]] = {k: list(v) for k, v in pins.items()}
+    visiting: List[str] = []
+    order: List[str] = []
+    cycles: List[List[str]] = []
+    conflicts: List[dict] = []
+
+    def conflict(dep_id, need, requester, reason):
+        conflicts.append({
+            "Id": dep_id,
+            "Need": need,
+            "RequiredBy": requester,
+            "Available": [n.version for n in nodes.get(dep_id, [])],
+            "Reason": reason,
+        })
+
+    # 显式栈代替递归，依赖链再深也不会超出递归深度：栈中每一项为 (节点, 节点标签, 尚未处理的依赖)
+    stack = []
+
+    def enter(node: DependencyNode):
+        visiting.append(node.plugin_id)
+        stack.append((node, _label(node), iter(node.dependencies)))
+
+    enter(root)
+    while stack:
+        node, requester, dependencies = stack[-1]
+        for dep_id, need in dependencies:
+            constraint = parse_need(need)
+            if constraint is None:
+                conflict(dep_id, need, requester, "invalid")
+                continue
+            constraints.setdefault(dep_id, []).append((need, constraint, requester))
+            required_by.setdefault(dep_id, []).append(requester)
+            chosen = selected.get(dep_id)
+            if chosen is not None:
+                if dep_id in visiting:
+                    cycles.append(visiting[visiting.index(dep_id):] + [dep_id])
+                if satisfies(chosen.key, constraint):
+                    continue
+                candidate = _best(nodes.get(dep_id, []), constraints[dep_id])
+                if candidate is None or dep_id == root.plugin_id or not restart:
+                    conflict(dep_id, need, requester, "unsatisfied")
+                    continue
+                # 已选版本不满足新的约束：带着该依赖的全部约束重新遍历
+                pins[dep_id] = constraints[dep_id]
+                raise _Restart()
+            versions = nodes.get(dep_id)
+            if not versions:
+                conflict(dep_id, need, requester, "missing")
+                continue
+            candidate = _best(versions, constraints[dep_id])
+            if candidate is None:
+                conflict(dep_id, need, requester, "unsatisfied")
+                continue
+            selected[dep_id] = candidate
+            depth[dep_id] = len(visiting)
+            # 先处理该依赖，回到栈顶后从当前节点的下一个依赖继续
+            enter(candidate)
+            break
+        else:
+            # 依赖全部处理完：出栈，依赖先于依赖它的插件进入安装顺序
+            stack.pop()
+            visiting.pop()
+            order.append(node.plugin_id)
+    return {
+        "Id": root.plugin_id,
+        "Version": root.version,
+        "Resolved": not conflicts,
+        "Plugins": [
+            {
+                "Id": plugin_id,
+                "Version": selected[plugin_id].version,
+                "DownloadUrl": selected[plugin_id].download_url,
+                "Depth": depth[plugin_id],
+                "RequiredBy": required_by[plugin_id],
+            }
+            for plugin_id in order
+        ],
+        "Cycles": cycles,
+        "Conflicts": conflicts,
+    }
+
+
+dependency_graph = DependencyGraph()
@@ -0,0 +1,133 @@
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import selectinload
+
+from auth import CurrentUser, get_current_user
+from catalog import plugin_to_model
+from config import settings
+from models import Plugin, Release, Repository, WebhookLog, get_session
+from res_model import AuthorModel, RepositoryBasicModel, WebhookLogModel
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+NDJSON = "application/x-ndjson"
+
+
+def _ndjson(models: Iterable[BaseModel], exclude: set = None) -> Iterator[str]:
+    """将模型逐行序列化为 NDJSON，每 export_batch_size 行输出一个分块"""
+    lines = []
+    for model in models:
+        lines.append(model.model_dump_json(exclude=exclude))
+        if len(lines) >= settings.export_batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _stream(rows: Iterator[str], filename: str) -> StreamingResponse:
+    # 同步生成器由 Starlette 在线程池中迭代，数据库游标只在迭代期间打开
+    return StreamingResponse(rows, media_type=NDJSON, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _parse_day(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+
+@router.get("/plugins", response_class=StreamingResponse, tags=["Export"])
+async def export_plugins():
+    """
+    导出商店中所有可见的插件版本（NDJSON，每行一个版本，按 Plugin.id 升序），用于镜像同步
+    """
+    def rows():
+        with get_session() as session:
+            query = (
+                session.query(Plugin)
+                .join(Plugin.repository)
+                .join(Plugin.release)
+                .filter(Repository.watched == True, Release.visible == True, Plugin.plugin_id.isnot(None))
+                .options(selectinload(Plugin.dependencies), selectinload(Plugin.tags))
+                .order_by(Plugin.id)
+                .yield_per(settings.export_batch_size)
+            )
+            yield from _ndjson((plugin_to_model(plugin, []) for plugin in query), exclude={"Versions"})
+
+    return _stream(rows(), "plugins.ndjson")
+
+
+@router.get("/repositories", response_class=StreamingResponse, tags=["Export"])
+async def export_repositories(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    导出仓库基本信息（NDJSON，不含发布列表）：管理员导出全部，普通用户只导出自己的仓库
+    """
+    author_id = None if current_user.is_admin else current_user.id
+
+    def rows():
+        with get_session() as session:
+            query = session.query(Repository).options(selectinload(Repository.author)).order_by(Repository.id)
+            if author_id is not None:
+                query = query.filter(Repository.author_id == author_id)
+            models = (
+                RepositoryBasicModel(
+                    id=repo.id,
+                    name=repo.name,
+                    full_name=repo.full_name,
+                    html_url=repo.html_url,
+                    watched=repo.watched,
+                    author=AuthorModel.model_validate(repo.author) if repo.author else None,
+                )
+                for repo in query.yield_per(settings.export_batch_size)
+            )
+            yield from _ndjson(models, exclude={"releases", "release_count"})
+
+    return _stream(rows(), "repositories.ndjson")
+
+
+@router.get("/webhook_logs", response_class=StreamingResponse, tags=["Export"])
+async def export_webhook_logs(
+    start: Optional[str] = Query(None, description="起始日期（含），YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="结束日期（不含），YYYY-MM-DD"),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    导出 webhook 日志表中的记录（NDJSON，按 id 升序）：管理员导出全部，普通用户只导出自己的日志。
+    已归档的日志请直接使用归档目录中的按天文件。
+    """
+    start_dt, end_dt = _parse_day(start), _parse_day(end)
+    author_id = None if current_user.is_admin else current_user.id
+
+    def rows():
+        with get_session() as session:
+            query = session.query(WebhookLog).options(selectinload(WebhookLog.author)).order_by(WebhookLog.id)
+            if start_dt:
+                query = query.filter(WebhookLog.created_at >= start_dt)
+            if end_dt:
+                query = query.filter(WebhookLog.created_at < end_dt)
+            if author_id is not None:
+                query = query.filter(WebhookLog.author_id == author_id)
+            models = (
+                WebhookLogModel(
+                    id=log.id,
+                    author=AuthorModel.model_validate(log.author) if log.author else None,
+                    repository_id=log.repository_id,
+                    event=log.event,
+                    action=log.action,
+                    payload=log.payload,
+                    created_at=log.created_at,
+                    level=log.level or 0,
+                )
+                for log in query.yield_per(settings.export_batch_size)
+            )
+            # 仓库信息（含发布列表）体积大且会逐行触发查询，导出中只保留 repository_id
+            yield from _ndjson(models, exclude={"repository"})
+
+    return _stream(rows(), "webhook_logs.ndjson")
@@ -1,39 +1,23 @@
-import json
-import os
-import time
 from sqlalchemy.orm import Session
-import requests
-from github import Github, Auth
-from github.GithubException import GithubException
+from github import Auth
 from config import settings
+from http_client import http_client
+from index_sync import PluginUpdate, index_sync
 from loguru import logger
 
-from models import Repository, get_session, save_releases_to_db, Author, get_or_create_author, WebhookLog, write_webhook_log_with_db
+from models import Repository, get_session, save_releases_to_db, Author, get_or_create_author, WebhookLog, write_webhook_log_with_db, repository_counts, apply_counts_change
 
-g = Github(
-    auth=Auth.AppAuth(settings.app_id,
-                      settings.app_private_key
-                      ).get_installation_auth(settings.app_installation_id))
+installation_auth = Auth.AppAuth(settings.app_id,
+                                 settings.app_private_key
+                                 ).get_installation_auth(settings.app_installation_id)
 
-source_branch = "main"
-
-
-def any_plugin(raw_plugin_json, plugin_json):
-    mew_plugin_json = []
-    flag = False
-    for plugin in raw_plugin_json:
-        if plugin["Id"] == plugin_json["Id"]:
-            mew_plugin_json.append(plugin_json)
-            flag = True
-        else:
-            mew_plugin_json.append(plugin)
-    if not flag:
-        mew_plugin_json.append(plugin_json)
-    return flag, mew_plugin_json
 
+def installation_token() -> str:
+    """GitHub App 安装令牌（过期前由 PyGithub 自动刷新），用于直接调用 REST API"""
+    return installation_auth.token
 
 def get_pr_file(plugin_json_url, assets):
-    resp = requests.get(plugin_json_url)
+    resp = http_client.get(plugin_json_url)
     resp.raise_for_status()
     plugin_json = resp.json()
     plugin_json["Assets"] = assets
@@ -41,6 +25,7 @@ def get_pr_file(plugin_json_url, assets):
 
 
 def create_pr(assets):
+    """将 release 中的插件加入索引仓库的待同步队列，由 index_sync 合并窗口内的更新后一次提交"""
     plugin_json_url = None
     logo_url = None
     logo_name = None
@@ -64,66 +49,24 @@ def create_pr(assets):
     if plugin_json_url is None:
         logger.warning("No plugin json file found, skip")
         return
-    new_branch = str(int(time.time()))
-    logger.info(f"[{new_branch}]Creating new branch")
-    repo = g.get_repo(settings.repo_name)
-    plugin_file = repo.get_contents("plugin.json")
-    raw_plugin_json = json.loads(plugin_file.decoded_content.decode("utf-8"))
     plugin_json = get_pr_file(plugin_json_url, new_assets)
     plugin_id = plugin_json["Id"]
-    plugin_version = plugin_json["Version"]
-    source_ref = repo.get_git_ref(f"heads/{source_branch}")
-    new_branch_ref = repo.create_git_ref(ref=f"refs/heads/{new_branch}", sha=source_ref.object.sha)
-    if logo_url:
-        logo_flag = False
-        logo_path = f"{plugin_id}/{logo_name}"
-        logo_data = {
-            "path": logo_path,
-            "message": f"{'Update' if logo_flag else 'Create'} Plugin Logo: {plugin_id} v{plugin_version}",
-            "content": requests.get(logo_url).content,
-        }
-        try:
-            logo_file_content = repo.get_contents(logo_path)
-            logo_flag = True
-        except GithubException:
-            pass
-        except Exception as e:
-            logger.error(e)
-
-        if logo_flag:
-            repo.update_file(**logo_data,
-                             sha=logo_file_content.sha,
-                             branch=new_branch)
-        else:
-            repo.create_file(**logo_data, branch=new_branch)
-        logger.info(f"[{new_branch}]Creating Logo")
-        plugin_json[
-            "Logo"] = f"https://raw.githubusercontent.com/{settings.repo_name}/refs/heads/main/{logo_path}"
-    flag, mew_plugin_json = any_plugin(raw_plugin_json, plugin_json)
-    commit_message = f"{'Update' if flag else 'Create'} Plugin: {plugin_id} v{plugin_version}"
-
-    repo.update_file("plugin.json", commit_message,
-                     json.dumps(mew_plugin_json, indent=4, ensure_ascii=False),
-                     sha=plugin_file.sha,
-                     branch=new_branch)
-
-    logger.info(f"[{new_branch}]Update Plugin json")
-    pr_body = "..."
-    pr = repo.create_pull(
-        title=commit_message,
-        body=pr_body,
-        head=new_branch,
-        base=source_branch
-    )
-    logger.info(f"[{new_branch}]Create Pr")
-    pr.merge()
-    logger.info(f"[{new_branch}]Merge Pr")
-    new_branch_ref.delete()
+    index_sync.enqueue(PluginUpdate(
+        plugin_json,
+        logo_path=f"{plugin_id}/{logo_name}" if logo_url else None,
+        logo_url=logo_url,
+    ))
+    logger.info(f"Queued index sync for {plugin_id} v{plugin_json.get('Version')}")
 
 def webhook_release(payload:dict, event:str):
     full = payload["repository"]["full_name"]
     action = payload.get("action")
-    save_releases_to_db(event,action, full, [payload["release"]])
+    release = payload["release"]
+    save_releases_to_db(event,action, full, [release])
+    # 正式版本（released：发布正式版或预发布转为正式版）入库后加入索引仓库的同步队列；
+    # 失败时任务重试，重复入库与重复入队都是幂等的
+    if settings.index_sync_enabled and action == "released":
+        create_pr(release.get("assets") or [])
     return "success"
 
 def webhook_install(payload:dict, event:str):
@@ -143,6 +86,7 @@ def webhook_install(payload:dict, event:str):
                     try:
                         full = r.get("full_name")
                         repo = db.query(Repository).filter(Repository.full_name == full).first()
+                        counts_before = repository_counts(db, repo)
                         if not repo:
                             repo = Repository(
                                 id=r.get("id"),
@@ -157,6 +101,7 @@ def webhook_install(payload:dict, event:str):
                             repo.installed = True
                             if author:
                                 repo.author_id = author.id
+                        apply_counts_change(db, counts_before, repository_counts(db, repo))
                         write_webhook_log_with_db(db, repository_id=repo.id,
                                         author_id=author.id if author else None,
                                         event=event,
@@ -171,7 +116,9 @@ def webhook_install(payload:dict, event:str):
                         full = r.get("full_name")
                         repo = db.query(Repository).filter(Repository.full_name == full).first()
                         if repo:
+                            counts_before = repository_counts(db, repo)
                             repo.installed = False
+                            apply_counts_change(db, counts_before, repository_counts(db, repo))
                         write_webhook_log_with_db(db, repository_id=repo.id,
                                         author_id=author.id if author else None,
                                         event=event,
@@ -187,6 +134,7 @@ def webhook_install(payload:dict, event:str):
                         try:
                             full = r.get("full_name") or f"{r.get('owner', {}).get('login')}/{r.get('name')}"
                             repo = db.query(Repository).filter(Repository.full_name == full).first()
+                            counts_before = repository_counts(db, repo)
                             if not repo:
                                 repo = Repository(
                                     id=r.get("id"),
@@ -202,6 +150,7 @@ def webhook_install(payload:dict, event:str):
                                 # 如果有 installation 对应的 author，确保仓库记录与其绑定
                                 if author:
                                     repo.author_id = author.id
+                            apply_counts_change(db, counts_before, repository_counts(db, repo))
                             write_webhook_log_with_db(db, repository_id=repo.id,
                                         author_id=author.id if author else None,
                                         event=event,
@@ -220,7 +169,9 @@ def webhook_install(payload:dict, event:str):
                             full = r.get("full_name") or f"{r.get('owner', {}).get('login')}/{r.get('name')}"
                             repo = db.query(Repository).filter(Repository.full_name == full).first()
                             if repo:
+                                counts_before = repository_counts(db, repo)
                                 repo.installed = False
+                                apply_counts_change(db, counts_before, repository_counts(db, repo))
                             write_webhook_log_with_db(db, repository_id=repo.id,
                                         author_id=author.id if author else None,
                                         event=event,
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import threading
+from typing import List, Union
+
+import httpx
+from loguru import logger
+
+from config import settings
+
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# 可重试的状态码：限流与网关/服务端临时错误
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """共享的 GitHub HTTP 客户端。
+
+    一个后台事件循环线程持有带连接池（keep-alive，安装 h2 时启用 HTTP/2）的
+    httpx.AsyncClient，同步代码（入库线程、CLI）和异步代码都通过它发请求，
+    复用同一个连接池；并发请求数受信号量限制，传输错误和 429/5xx 按指数退避重试。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._client: httpx.AsyncClient = None
+        self._semaphore: asyncio.Semaphore = None
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="http-client", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self._loop = loop
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout),
+            limits=httpx.Limits(max_connections=settings.http_max_connections,
+                                max_keepalive_connections=settings.http_max_connections),
+            follow_redirects=True,
+            headers={"User-Agent": "ShadowViewer.PluginWarden"},
+        )
+        self._semaphore = asyncio.Semaphore(settings.http_max_concurrency)
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt >= settings.http_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else None
+                reason = f"status {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt >= settings.http_retries:
+                    raise
+                delay = None
+                reason = repr(e)
+            if delay is None:
+                delay = settings.http_retry_backoff * 2 ** attempt * (1 + random.random() / 2)
+            attempt += 1
+            logger.warning(f"{method} {url} failed ({reason}), retry {attempt}/{settings.http_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _submit(self, coro):
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """同步请求（不能在本客户端的事件循环线程内调用）"""
+        return self._submit(self._request(method, url, **kwargs)).result()
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """在任意事件循环中等待请求结果"""
+        return await asyncio.wrap_future(self._submit(self._request(method, url, **kwargs)))
+
+    def get_many(self, urls: List[str], **kwargs) -> List[Union[httpx.Response, Exception]]:
+        """并行 GET 多个地址，按输入顺序返回响应或异常"""
+        if not urls:
+            return []
+
+        async def run():
+            return await asyncio.gather(*(self._request("GET", url, **kwargs) for url in urls), return_exceptions=True)
+
+        return self._submit(run()).result()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,289 @@
+"""索引仓库（settings.repo_name）同步。
+
+新发布的插件不再各自开分支、提 PR、合并：更新先进入内存中的待同步队列，同一插件只保留最新的一次，
+窗口（settings.index_sync_window 秒）结束后用 Git Data API 一次性落地：
+
+    GET   git/ref/heads/{branch}       当前分支头
+    GET   git/commits/{sha}            分支头的 tree
+    GET   git/trees/{tree}             plugin.json 的 blob sha（未变化时沿用缓存的索引，不再下载）
+    POST  git/blobs                    每个尚未上传过的 logo
+    POST  git/trees                    以分支头的 tree 为 base_tree 写入 plugin.json 与 logo
+    POST  git/commits                  一个提交包含窗口内的全部更新
+    PATCH git/refs/heads/{branch}      非强制更新；分支头已被移动（422）时从头重试
+
+同一时刻只有一次同步在进行，不会再有两次发布争用同一个 plugin.json sha。
+
+待同步的更新同时写入 index_sync_updates 表，同步成功后删除；进程重启后由 load() 从表中恢复队列，
+窗口内或同步失败等待重试的更新不会因为重启而丢失。
+"""
+import base64
+import hashlib
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+
+from config import settings
+from http_client import http_client
+from models import IndexSyncUpdate, get_session
+
+INDEX_PATH = "plugin.json"
+
+
+class PluginUpdate(NamedTuple):
+    """一个待同步的插件：plugin.json 中的条目，以及可选的 logo（仓库内路径与下载地址）"""
+    plugin_json: dict
+    logo_path: Optional[str] = None
+    logo_url: Optional[str] = None
+
+
+class IndexSyncError(Exception):
+    pass
+
+
+class _NotFastForward(Exception):
+    pass
+
+
+def git_blob_sha(data: bytes) -> str:
+    """与 git 相同的 blob 对象 sha"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def render_index(plugins: Dict[str, dict]) -> bytes:
+    return json.dumps(list(plugins.values()), indent=4, ensure_ascii=False).encode("utf-8")
+
+
+def _commit_message(updates: List[PluginUpdate], existing: Dict[str, dict]) -> str:
+    lines = [
+        f"{'Update' if u.plugin_json['Id'] in existing else 'Create'} Plugin: {u.plugin_json['Id']} v{u.plugin_json.get('Version')}"
+        for u in updates
+    ]
+    if len(lines) == 1:
+        return lines[0]
+    return f"Sync {len(lines)} plugins\n\n" + "\n".join(lines)
+
+
+class IndexSync:
+    """合并窗口内的插件更新，作为一个提交写入索引仓库"""
+
+    def __init__(self, token_provider: Optional[Callable[[], str]] = None):
+        self._token_provider = token_provider
+        self._lock = threading.Lock()
+        # 同一时刻只执行一次同步
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, PluginUpdate] = {}
+        # 待同步更新在 index_sync_updates 表中的 updated_at，同步成功后按它删除
+        self._stamps: Dict[str, datetime] = {}
+        self._timer: Optional[threading.Timer] = None
+        # 最近读取或写入的 plugin.json：(blob sha, {Id: 条目})
+        self._index_sha: Optional[str] = None
+        self._index: Dict[str, dict] = {}
+        # 已上传过的 logo blob sha，内容相同时直接引用
+        self._blobs: set = set()
+        self._stats = {"enqueued": 0, "coalesced": 0, "commits": 0, "plugins_synced": 0,
+                       "api_calls": 0, "retries": 0, "failures": 0, "index_downloads": 0, "logo_uploads": 0,
+                       "restored": 0}
+
+    def enqueue(self, update: PluginUpdate):
+        """加入待同步队列，同一插件未同步的旧更新被替换；窗口结束后由后台线程提交"""
+        plugin_id = update.plugin_json["Id"]
+        stamp = datetime.now()
+        with self._lock:
+            # 先落库再进入内存队列，持有锁保证表中保留的是同一插件最后加入的更新
+            with get_session() as session:
+                session.merge(IndexSyncUpdate(
+                    plugin_id=plugin_id,
+                    plugin_json=json.dumps(update.plugin_json, ensure_ascii=False),
+                    logo_path=update.logo_path,
+                    logo_url=update.logo_url,
+                    updated_at=stamp,
+                ))
+                session.commit()
+            self._stats["enqueued"] += 1
+            if plugin_id in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[plugin_id] = update
+            self._stamps[plugin_id] = stamp
+            self._schedule(settings.index_sync_window)
+
+    def load(self) -> int:
+        """从 index_sync_updates 表恢复上次退出前未同步的更新（启动时调用），返回恢复的条数"""
+        with get_session() as session:
+            rows = session.query(IndexSyncUpdate).order_by(IndexSyncUpdate.updated_at).all()
+        restored = 0
+        with self._lock:
+            for row in rows:
+                # 内存中已有更新的版本时以内存为准
+                if row.plugin_id in self._pending:
+                    continue
+                self._pending[row.plugin_id] = PluginUpdate(json.loads(row.plugin_json), row.logo_path, row.logo_url)
+                self._stamps[row.plugin_id] = row.updated_at
+                restored += 1
+            self._stats["restored"] += restored
+            self._schedule(settings.index_sync_window)
+        if restored:
+            logger.info(f"Index sync: restored {restored} pending plugins")
+        return restored
+
+    def _schedule(self, delay: float):
+        """调用方持有 self._lock"""
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(delay, self._run)
+            self._timer.name = "index-sync"
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        failed = False
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Index sync failed")
+            failed = True
+        with self._lock:
+            # 失败的更新已放回队列；同步期间到达的新更新等待下一个窗口
+            self._schedule(settings.index_sync_retry_backoff if failed else settings.index_sync_window)
+
+    def flush(self) -> Optional[str]:
+        """立即同步当前队列中的全部更新，返回新提交的 sha（队列为空时返回 None）；失败时更新放回队列"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                stamps, self._stamps = self._stamps, {}
+            if not pending:
+                return None
+            try:
+                sha = self._sync(list(pending.values()))
+            except Exception:
+                with self._lock:
+                    self._stats["failures"] += 1
+                    # 同步期间到达的同一插件的新更新优先
+                    self._pending = {**pending, **self._pending}
+                    self._stamps = {**stamps, **self._stamps}
+                raise
+            with get_session() as session:
+                # 同步期间同一插件再次加入队列时 updated_at 已变化，该记录保留
+                for plugin_id, stamp in stamps.items():
+                    session.query(IndexSyncUpdate).filter(
+                        IndexSyncUpdate.plugin_id == plugin_id, IndexSyncUpdate.updated_at == stamp
+                    ).delete(synchronize_session=False)
+                session.commit()
+            with self._lock:
+                self._stats["commits"] += 1
+                self._stats["plugins_synced"] += len(pending)
+            return sha
+
+    def _api(self, method: str, path: str, body: dict = None):
+        headers = {"Accept": "application/vnd.github+json"}
+        if self._token_provider:
+            headers["Authorization"] = f"token {self._token_provider()}"
+        url = f"{settings.github_api_url}/repos/{settings.repo_name}/{path}"
+        with self._lock:
+            self._stats["api_calls"] += 1
+        response = http_client.request(method, url, headers=headers, json=body)
+        if response.status_code == 422 and method == "PATCH":
+            raise _NotFastForward(response.text)
+        if response.status_code >= 400:
+            raise IndexSyncError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def _load_index(self, tree_sha: str) -> Dict[str, dict]:
+        """分支头的 plugin.json；blob 与缓存相同时不重新下载"""
+        tree = self._api("GET", f"git/trees/{tree_sha}")
+        blob_sha = next((e["sha"] for e in tree.get("tree", []) if e["path"] == INDEX_PATH), None)
+        if blob_sha is None:
+            return {}
+        if blob_sha != self._index_sha:
+            blob = self._api("GET", f"git/blobs/{blob_sha}")
+            plugins = json.loads(base64.b64decode(blob["content"]).decode("utf-8"))
+            self._index = {p["Id"]: p for p in plugins}
+            self._index_sha = blob_sha
+            with self._lock:
+                self._stats["index_downloads"] += 1
+        return self._index
+
+    def _upload_logos(self, updates: List[PluginUpdate]) -> Dict[str, str]:
+        """并行下载 logo 并上传尚未上传过的 blob，返回 {Id: logo 的 blob sha}，下载失败的 logo 跳过"""
+        with_logo = [u for u in updates if u.logo_url]
+        entries = {}
+        responses = http_client.get_many([u.logo_url for u in with_logo])
+        for update, response in zip(with_logo, responses):
+            if isinstance(response, Exception) or response.status_code != 200:
+                logger.warning(f"Skip logo {update.logo_url} of {update.plugin_json['Id']}: {response!r}")
+                continue
+            sha = git_blob_sha(response.content)
+            if sha not in self._blobs:
+                created = self._api("POST", "git/blobs", {
+                    "content": base64.b64encode(response.content).decode("ascii"), "encoding": "base64"})
+                sha = created["sha"]
+                self._blobs.add(sha)
+                with self._lock:
+                    self._stats["logo_uploads"] += 1
+            entries[update.plugin_json["Id"]] = sha
+        return entries
+
+    def _sync(self, updates: List[PluginUpdate]) -> str:
+        branch = settings.base_branch
+        logos = self._upload_logos(updates)
+        for attempt in range(settings.index_sync_retries + 1):
+            head = self._api("GET", f"git/ref/heads/{branch}")["object"]["sha"]
+            base_tree = self._api("GET", f"git/commits/{head}")["tree"]["sha"]
+            existing = self._load_index(base_tree)
+            plugins = dict(existing)
+            tree = []
+            for update in updates:
+                plugin_json = dict(update.plugin_json)
+                if update.plugin_json["Id"] in logos:
+                    tree.append({"path": update.logo_path, "mode": "100644", "type": "blob", "sha": logos[update.plugin_json["Id"]]})
+                    plugin_json["Logo"] = f"https://raw.githubusercontent.com/{settings.repo_name}/refs/heads/{branch}/{update.logo_path}"
+                plugins[plugin_json["Id"]] = plugin_json
+            content = render_index(plugins)
+            tree.append({"path": INDEX_PATH, "mode": "100644", "type": "blob", "content": content.decode("utf-8")})
+            new_tree = self._api("POST", "git/trees", {"base_tree": base_tree, "tree": tree})["sha"]
+            if new_tree == base_tree:
+                # 分支上已是这些内容（例如重启后恢复的更新已由其他进程提交），不产生空提交
+                self._index, self._index_sha = plugins, git_blob_sha(content)
+                logger.info(f"Index sync: {len(updates)} plugins already up to date at {head[:7]}")
+                return head
+            commit = self._api("POST", "git/commits", {
+                "message": _commit_message(updates, existing), "tree": new_tree, "parents": [head]})["sha"]
+            try:
+                self._api("PATCH", f"git/refs/heads/{branch}", {"sha": commit, "force": False})
+            except _NotFastForward:
+                # 其他提交先落地了：基于新的分支头重新生成
+                with self._lock:
+                    self._stats["retries"] += 1
+                logger.warning(f"Index sync: {branch} moved during sync (attempt {attempt + 1}/{settings.index_sync_retries + 1})")
+                continue
+            self._index, self._index_sha = plugins, git_blob_sha(content)
+            logger.info(f"Index sync: {len(updates)} plugins committed as {commit[:7]}")
+            return commit
+        raise IndexSyncError(f"{branch} kept moving, gave up after {settings.index_sync_retries} retries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+    def close(self):
+        """取消等待中的窗口并同步剩余的更新（进程退出前调用）"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Index sync failed on shutdown")
+
+
+def _default_token() -> str:
+    from github_utils import installation_token
+    return installation_token()
+
+
+index_sync = IndexSync(_default_token)
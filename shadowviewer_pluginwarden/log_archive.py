@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Author, Repository, WebhookLog, get_session
+
+# webhook 日志归档：超过保留期的日志按天写入压缩的 JSONL 文件（{archive_dir}/YYYY/YYYY-MM-DD.jsonl.gz），
+# 然后从 webhook_logs 表删除，使热表与其索引只保留最近的数据。
+# 按天查询时透明地合并归档文件与表中尚未归档的记录。
+
+_FIELDS = ("id", "author_id", "repository_id", "event", "action", "payload", "level")
+
+
+def _key(row) -> tuple:
+    # SQLite 在删除最大 id 的记录后会复用 id，合并时用 (id, created_at) 区分记录
+    return row["id"], row["created_at"]
+
+
+def archive_path(day: date) -> str:
+    return os.path.join(settings.webhook_log_archive_dir, f"{day:%Y}", f"{day:%Y-%m-%d}.jsonl.gz")
+
+
+def read_archive(day: date) -> List[dict]:
+    """读取某一天的归档记录，没有归档时返回空列表"""
+    path = archive_path(day)
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for row in rows:
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return rows
+
+
+def _write_archive(day: date, rows: List[dict]):
+    """原子地写入归档文件：先写临时文件并落盘，再替换"""
+    path = archive_path(day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            for row in rows:
+                line = {**row, "created_at": row["created_at"].isoformat()}
+                f.write((json.dumps(line, ensure_ascii=False, separators=(',', ':')) + "\n").encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+
+def _day_bounds(day: date):
+    start = datetime(day.year, day.month, day.day)
+    return start, start + timedelta(days=1)
+
+
+def archive_day(session: Session, day: date) -> int:
+    """归档某一天的日志并从表中删除，返回归档的记录数
+
+    已有归档文件时按 (id, created_at) 合并（上次归档后中断、或归档后又写入了该天的日志），
+    文件落盘之后才删除表中的记录，中途失败不会丢失日志。
+    """
+    start, end = _day_bounds(day)
+    rows = {_key(row): row for row in read_archive(day)}
+    ids = []
+    query = (
+        session.query(WebhookLog)
+        .filter(WebhookLog.created_at >= start, WebhookLog.created_at < end)
+        .order_by(WebhookLog.id)
+        .yield_per(1000)
+    )
+    for log in query:
+        row = {field: getattr(log, field) for field in _FIELDS}
+        row["created_at"] = log.created_at
+        rows[_key(row)] = row
+        ids.append(log.id)
+    if not ids:
+        return 0
+    _write_archive(day, sorted(rows.values(), key=lambda r: (r["created_at"], r["id"])))
+    for i in range(0, len(ids), 500):
+        session.query(WebhookLog).filter(WebhookLog.id.in_(ids[i:i + 500])).delete(synchronize_session=False)
+    session.commit()
+    return len(ids)
+
+
+def archive_webhook_logs() -> Dict[str, int]:
+    """归档所有早于保留期的日志，返回 {日期: 归档条数}"""
+    today = datetime.now().date()
+    horizon, _ = _day_bounds(today - timedelta(days=settings.webhook_log_retention_days))
+    archived = {}
+    with get_session() as session:
+        while True:
+            oldest = session.query(func.min(WebhookLog.created_at)).filter(WebhookLog.created_at < horizon).scalar()
+            if oldest is None:
+                break
+            day = oldest.date()
+            archived[day.isoformat()] = archive_day(session, day)
+    if archived:
+        logger.info(f"Archived webhook logs older than {horizon:%Y-%m-%d}: {archived}")
+    return archived
+
+
+def load_webhook_logs(session: Session, day: date, author_id: Optional[int] = None) -> list:
+    """某一天的日志（按时间升序）：合并表中的记录与归档文件，author_id 非空时只返回该作者的日志"""
+    start, end = _day_bounds(day)
+    query = session.query(WebhookLog).filter(WebhookLog.created_at >= start, WebhookLog.created_at < end)
+    if author_id is not None:
+        query = query.filter(WebhookLog.author_id == author_id)
+    logs = {(log.id, log.created_at): log for log in query}
+
+    archived = [row for row in read_archive(day)
+                if _key(row) not in logs and (author_id is None or row["author_id"] == author_id)]
+    if archived:
+        # 归档中只保存外键，关联的作者与仓库批量查询
+        author_ids = {row["author_id"] for row in archived if row["author_id"] is not None}
+        repo_ids = {row["repository_id"] for row in archived if row["repository_id"] is not None}
+        authors = {a.id: a for a in session.query(Author).filter(Author.id.in_(author_ids))} if author_ids else {}
+        repos = {r.id: r for r in session.query(Repository).filter(Repository.id.in_(repo_ids))} if repo_ids else {}
+        for row in archived:
+            logs[_key(row)] = SimpleNamespace(**row, author=authors.get(row["author_id"]),
+                                              repository=repos.get(row["repository_id"]))
+    return sorted(logs.values(), key=lambda log: (log.created_at, log.id))
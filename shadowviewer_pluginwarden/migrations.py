@@ -0,0 +1,169 @@
+import hashlib
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from loguru import logger
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from search_index import create_repository_search_index, create_search_index, index_plugin
+from versions import version_key
+
+# 迁移记录表：已执行的迁移版本
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255)),
+    Column('applied_at', DateTime),
+)
+
+# (版本号, 说明, 迁移函数)，按版本号顺序执行
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    def decorator(fn: Callable[[Connection, MetaData], None]):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn: Connection, metadata: MetaData, table: str, column: str) -> bool:
+    """按模型定义为已有的表补充列，返回是否新增"""
+    if column in _columns(conn, table):
+        return False
+    col = metadata.tables[table].c[column]
+    ddl = col.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def _create_indexes(conn: Connection, metadata: MetaData, *names: str):
+    """创建模型中声明的索引（已存在则跳过）"""
+    indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+@migration(1, "plugins.version_key / sdk_version_key")
+def _plugin_version_keys(conn: Connection, metadata: MetaData):
+    added = _add_column(conn, metadata, 'plugins', 'version_key')
+    added = _add_column(conn, metadata, 'plugins', 'sdk_version_key') or added
+    _create_indexes(conn, metadata, 'ix_plugins_plugin_id_version_key')
+    if added:
+        rows = conn.execute(text("SELECT id, version, sdk_version FROM plugins")).all()
+        for pk, version, sdk_version in rows:
+            conn.execute(text("UPDATE plugins SET version_key = :v, sdk_version_key = :s WHERE id = :id"),
+                         {"v": version_key(version), "s": version_key(sdk_version), "id": pk})
+
+
+@migration(2, "plugins.download_url")
+def _plugin_download_url(conn: Connection, metadata: MetaData):
+    if _add_column(conn, metadata, 'plugins', 'download_url'):
+        conn.execute(text(
+            "UPDATE plugins SET download_url = ("
+            "SELECT a.browser_download_url FROM assets a "
+            "WHERE a.release_id = plugins.release_id AND lower(a.name) LIKE '%.sdow' "
+            "ORDER BY a.id LIMIT 1)"
+        ))
+
+
+@migration(3, "authors.access_token_hash")
+def _author_token_hash(conn: Connection, metadata: MetaData):
+    if _add_column(conn, metadata, 'authors', 'access_token_hash'):
+        rows = conn.execute(text("SELECT id, access_token FROM authors WHERE access_token IS NOT NULL")).all()
+        for pk, token in rows:
+            conn.execute(text("UPDATE authors SET access_token_hash = :h WHERE id = :id"),
+                         {"h": hashlib.sha256(token.encode('utf-8')).hexdigest(), "id": pk})
+    _create_indexes(conn, metadata, 'ix_authors_access_token_hash')
+
+
+@migration(4, "hot-path indexes")
+def _hot_path_indexes(conn: Connection, metadata: MetaData):
+    _create_indexes(
+        conn, metadata,
+        'ix_plugins_release_id',
+        'ix_plugins_repository_id',
+        'ix_releases_repository_id_tag_name',
+        'ix_assets_release_id_name',
+        'ix_dependencies_plugin_id',
+        'ix_plugin_tags_plugin_id',
+        'ix_repositories_author_id',
+        'ix_webhook_logs_created_at',
+        'ix_webhook_logs_author_id_created_at',
+    )
+
+
+@migration(5, "plugin full-text search index")
+def _plugin_search_index(conn: Connection, metadata: MetaData):
+    create_search_index(conn)
+    tags = {}
+    for plugin_pk, tag in conn.execute(text("SELECT plugin_id, tag FROM plugin_tags")):
+        tags.setdefault(plugin_pk, []).append(tag)
+    rows = conn.execute(text("SELECT id, name, description, authors FROM plugins")).all()
+    for pk, name, description, authors in rows:
+        index_plugin(conn, pk, name, description, authors, tags.get(pk, []))
+
+
+@migration(6, "repository name trigram index")
+def _repository_search_index(conn: Connection, metadata: MetaData):
+    create_repository_search_index(conn)
+
+
+@migration(7, "plugins.raw_json_sha256")
+def _plugin_raw_json_sha256(conn: Connection, metadata: MetaData):
+    if not _add_column(conn, metadata, 'plugins', 'raw_json_sha256'):
+        return
+    rows = conn.execute(text("SELECT id, raw_json FROM plugins WHERE raw_json IS NOT NULL")).all()
+    if rows:
+        conn.execute(
+            text("UPDATE plugins SET raw_json_sha256 = :sha WHERE id = :pk"),
+            [{"pk": pk, "sha": hashlib.sha256(raw_json.encode("utf-8")).hexdigest()} for pk, raw_json in rows],
+        )
+
+
+@migration(8, "webhook_jobs.worker_id / claimed_at")
+def _webhook_job_lease(conn: Connection, metadata: MetaData):
+    _add_column(conn, metadata, 'webhook_jobs', 'worker_id')
+    if _add_column(conn, metadata, 'webhook_jobs', 'claimed_at'):
+        # 旧版本留下的 running 任务以开始时间作为租约起点
+        conn.execute(text("UPDATE webhook_jobs SET claimed_at = started_at WHERE status = 'running'"))
+
+
+@migration(9, "plugins.raw_json_asset")
+def _plugin_raw_json_asset(conn: Connection, metadata: MetaData):
+    # 已有记录没有来源信息，下一次入库时下载一次后补上
+    _add_column(conn, metadata, 'plugins', 'raw_json_asset')
+
+
+def run_migrations(engine: Engine, metadata: MetaData) -> List[int]:
+    """创建缺失的表并依次执行未执行过的迁移，返回本次执行的版本号"""
+    metadata.create_all(engine)
+    _migration_metadata.create_all(engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    done = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        # 每个迁移在独立事务中执行，失败时回滚且不记录版本
+        with engine.begin() as conn:
+            fn(conn, metadata)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.now()))
+        logger.info(f"Applied migration {version}: {description}")
+        done.append(version)
+    return done
+
+
+if __name__ == '__main__':
+    from models import engine
+
+    with engine.connect() as conn:
+        for row in conn.execute(select(schema_migrations).order_by(schema_migrations.c.version)):
+            print(f"{row.version:>4}  {row.applied_at:%Y-%m-%d %H:%M:%S}  {row.description}")
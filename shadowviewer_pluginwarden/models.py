@@ -1,12 +1,24 @@
+import hashlib
 import json
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
-import requests
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, BigInteger, text
+from sqlalchemy import cast, create_engine, event, func, insert, update, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, BigInteger, Index, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import relationship,Mapped, sessionmaker,declarative_base,Session
 import os
 from datetime import datetime, timezone, timedelta
 
+from config import settings
+from http_client import http_client
+from plugin_cache import asset_stamp, cache_key, content_sha256, get_plugin_json, put_plugin_json, record_lookups, record_unchanged
+from revision import attach as attach_catalog_revision, bump_catalog_revision
+from search_index import index_plugins
+from versions import version_key
+from migrations import run_migrations
+
 def get_local_time(time_str) -> datetime:
     # 原始 UTC 时间
     dt_utc = datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%SZ')
@@ -19,8 +31,37 @@ def get_local_time(time_str) -> datetime:
 # 创建SQLAlchemy基类
 Base = declarative_base()
 
-db_file = "db.sqlite"
-engine = create_engine(f'sqlite:///{db_file}')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL 模式下写入不阻塞读取；NORMAL 同步级别在 WAL 下仍保证一致性
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    cursor.close()
+
+
+def create_db_engine(database_url: str = None, tuned: bool = True):
+    """根据配置创建数据库引擎：SQLite 在连接时设置 WAL 等 PRAGMA，其他数据库（PostgreSQL）使用连接池配置"""
+    url = make_url(database_url or settings.database_url)
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": True,
+    }
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout / 1000}
+        db_engine = create_engine(url, **options)
+        if tuned:
+            event.listen(db_engine, "connect", _sqlite_pragmas)
+        return db_engine
+    options["pool_recycle"] = settings.db_pool_recycle
+    return create_engine(url, **options)
+
+
+engine = create_db_engine()
 
 
 get_session = sessionmaker(bind=engine)
@@ -43,7 +84,7 @@ class Repository(Base):
     installed = Column(Boolean, default=False, nullable=False)
     watched = Column(Boolean, default=False, nullable=False)
     # 关联仓库所属的Author（例如GitHub仓库所有者）
-    author_id = Column(Integer, ForeignKey('authors.id'), nullable=True)
+    author_id = Column(Integer, ForeignKey('authors.id'), nullable=True, index=True)
     author = relationship("Author", back_populates="repositories")
     # 与Release的关系
     releases = relationship("Release", back_populates="repository", cascade="all, delete-orphan")
@@ -83,6 +124,10 @@ class Release(Base):
     author: Mapped["Author"] = relationship("Author")
     # 与Plugin的一对一关系（每个 Release 对应一个 plugin.json）
     plugin: Mapped["Plugin"] = relationship("Plugin", back_populates="release", uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('ix_releases_repository_id_tag_name', 'repository_id', 'tag_name'),
+    )
     
     def __repr__(self):
         return f"<Release(tag_name='{self.tag_name}', name='{self.name}')>"
@@ -108,6 +153,10 @@ class Asset(Base):
     release: Mapped["Release"] = relationship("Release", back_populates="assets")
     # 与Uploader(Author)的关系
     uploader: Mapped["Author"] = relationship("Author")
+
+    __table_args__ = (
+        Index('ix_assets_release_id_name', 'release_id', 'name'),
+    )
     
     def __repr__(self):
         return f"<Asset(name='{self.name}', download_count={self.download_count})>"
@@ -122,6 +171,8 @@ class Author(Base):
     type = Column(String(50))
     # OAuth token and metadata
     access_token = Column(Text, nullable=True)
+    # access_token 的 SHA-256，用于按 token 索引查找作者
+    access_token_hash = Column(String(64), nullable=True, index=True)
     token_updated_at = Column(DateTime, nullable=True)
     token_scopes = Column(String(255), nullable=True)
     # Use Author to manage permissions
@@ -140,17 +191,22 @@ class Plugin(Base):
 
     id = Column(Integer, primary_key=True)
     plugin_id = Column(String(255), nullable=True)
-    release_id = Column(Integer, ForeignKey('releases.id'))
-    repository_id = Column(Integer, ForeignKey('repositories.id'), nullable=True)
+    release_id = Column(Integer, ForeignKey('releases.id'), index=True)
+    repository_id = Column(Integer, ForeignKey('repositories.id'), nullable=True, index=True)
 
     # 常用字段
     name = Column(String(255), nullable=True)
     version = Column(String(100), nullable=True)
+    # 可排序的版本键（见 versions.version_key），用于选取最新版本
+    version_key = Column(String(100), nullable=True)
     description = Column(Text, nullable=True)
     authors = Column(String(255), nullable=True)
     web_uri = Column(String(255), nullable=True)
     logo = Column(String(255), nullable=True)
     sdk_version = Column(String(100), nullable=True)
+    sdk_version_key = Column(String(100), nullable=True)
+    # Release 中 .sdow 安装包的下载地址，入库时解析，避免每次请求遍历 assets
+    download_url = Column(String(255), nullable=True)
 
     # 复杂字段以 JSON 文本存储
     # 关系字段：依赖和标签（一对多）
@@ -159,12 +215,20 @@ class Plugin(Base):
     tags: Mapped[List["PluginTag"]] = relationship("PluginTag", back_populates="plugin", cascade="all, delete-orphan")
 
     raw_json = Column(Text, nullable=True)
+    # raw_json 的 SHA-256，重复入库时内容未变化则跳过插件信息的重写
+    raw_json_sha256 = Column(String(64), nullable=True)
+    # raw_json 来自哪个 plugin.json asset（"github_id:updated_at:size"），asset 未变化时直接复用 raw_json，重启后也不必重新下载
+    raw_json_asset = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     # 关系
     release: Mapped["Release"] = relationship("Release", back_populates="plugin")
     repository: Mapped["Repository"] = relationship("Repository")
 
+    __table_args__ = (
+        Index('ix_plugins_plugin_id_version_key', 'plugin_id', 'version_key'),
+    )
+
     def __repr__(self):
         return f"<Plugin(plugin_id='{self.plugin_id}', name='{self.name}', version='{self.version}')>"
 
@@ -173,7 +237,7 @@ class Dependency(Base):
     __tablename__ = 'dependencies'
 
     id = Column(Integer, primary_key=True)
-    plugin_id = Column(Integer, ForeignKey('plugins.id'))
+    plugin_id = Column(Integer, ForeignKey('plugins.id'), index=True)
     dep_id = Column(String(255), nullable=False)
     need = Column(String(100), nullable=True)
 
@@ -187,7 +251,7 @@ class PluginTag(Base):
     __tablename__ = 'plugin_tags'
 
     id = Column(Integer, primary_key=True)
-    plugin_id = Column(Integer, ForeignKey('plugins.id'))
+    plugin_id = Column(Integer, ForeignKey('plugins.id'), index=True)
     tag = Column(String(100), nullable=False)
 
     plugin: Mapped["Plugin"] = relationship("Plugin", back_populates="tags")
@@ -205,15 +269,104 @@ class WebhookLog(Base):
     event = Column(String(100), nullable=False)
     action = Column(String(100), nullable=True)
     payload = Column(Text)
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=datetime.now, index=True)
     level = Column(Integer, default=0)
     # 关系
     author: Mapped["Author"] = relationship("Author", back_populates="webhook_logs")
     repository: Mapped["Repository"] = relationship("Repository")
 
+    __table_args__ = (
+        Index('ix_webhook_logs_author_id_created_at', 'author_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<WebhookLog(event='{self.event}', action='{self.action}', author_id={self.author_id})>"
 
+class WebhookJob(Base):
+    """待处理的 webhook 事件（持久化队列），由后台 worker 消费"""
+    __tablename__ = 'webhook_jobs'
+
+    id = Column(Integer, primary_key=True)
+    delivery_id = Column(String(100), nullable=True)
+    event = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    # pending / running / failed，处理成功的任务直接删除
+    status = Column(String(20), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    # 租约：领取任务的 worker 与最近一次续约时间，租约过期的 running 任务才会被重新排队
+    worker_id = Column(String(100), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_webhook_jobs_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<WebhookJob(event='{self.event}', status='{self.status}', attempts={self.attempts})>"
+
+
+class IndexSyncUpdate(Base):
+    """等待同步到索引仓库的插件更新（index_sync 待同步队列的持久化副本），同一插件只保留最新的一条"""
+    __tablename__ = 'index_sync_updates'
+
+    plugin_id = Column(String(255), primary_key=True)
+    plugin_json = Column(Text, nullable=False)
+    logo_path = Column(String(255), nullable=True)
+    logo_url = Column(String(500), nullable=True)
+    # 加入队列的时间，同步成功后只删除时间未变的记录（同步期间到达的新更新保留）
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f"<IndexSyncUpdate(plugin_id='{self.plugin_id}', updated_at={self.updated_at})>"
+
+
+class WebhookDelivery(Base):
+    """已接收的 GitHub webhook 投递（X-GitHub-Delivery），用于过滤重复投递"""
+    __tablename__ = 'webhook_deliveries'
+
+    delivery_id = Column(String(100), primary_key=True)
+    event = Column(String(100), nullable=True)
+    received_at = Column(DateTime, default=datetime.now, index=True)
+
+    def __repr__(self):
+        return f"<WebhookDelivery(delivery_id='{self.delivery_id}', event='{self.event}')>"
+
+
+class DashboardCounter(Base):
+    """/api/stats 的仪表盘计数，author_id 为 0 的一行是全局计数，其余为各作者的计数"""
+    __tablename__ = 'dashboard_counters'
+
+    author_id = Column(Integer, primary_key=True, autoincrement=False)
+    total_plugins = Column(Integer, nullable=False, default=0)
+    installed_repos = Column(Integer, nullable=False, default=0)
+    watched_repos = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f"<DashboardCounter(author_id={self.author_id}, total_plugins={self.total_plugins})>"
+
+
+class GithubEtag(Base):
+    """GitHub API 条件请求缓存：每个地址最近一次成功处理的 200 响应的 ETag，以及该页的下一页地址"""
+    __tablename__ = 'github_etags'
+
+    url = Column(String(500), primary_key=True)
+    etag = Column(String(200), nullable=False)
+    next_url = Column(String(500), nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f"<GithubEtag(url='{self.url}', etag='{self.etag}')>"
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
 # 创建或获取Author
 def get_or_create_author(session:Session, author_data, access_token: str = None, token_scopes: str = None, mark_admin: bool = False):
     author = session.query(Author).filter_by(id=author_data['id']).first()
@@ -231,6 +384,7 @@ def get_or_create_author(session:Session, author_data, access_token: str = None,
     # Update token info if provided
     if access_token:
         author.access_token = access_token
+        author.access_token_hash = hash_token(access_token)
         author.token_updated_at = datetime.now()
     if token_scopes:
         author.token_scopes = token_scopes
@@ -247,13 +401,17 @@ def fetch_github_releases(repo_owner, repo_name, token=None):
     if token:
         headers['Authorization'] = f'token {token}'
     
-    url = f'https://api.github.com/repos/{repo_owner}/{repo_name}/releases'
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error fetching releases: {response.status_code}")
-        return []
+    url = f'{settings.github_api_url}/repos/{repo_owner}/{repo_name}/releases?per_page=100'
+    releases = []
+    # 按 Link 头逐页读取全部 releases
+    while url:
+        response = http_client.get(url, headers=headers)
+        if response.status_code != 200:
+            print(f"Error fetching releases: {response.status_code}")
+            break
+        releases.extend(response.json())
+        url = response.links.get('next', {}).get('url')
+    return releases
 
 
 def plugin_json_exists(release_data):
@@ -267,7 +425,7 @@ def plugin_json_download(browser_download_url):
     # if token:
     #     headers['Authorization'] = f'token {token}'
      
-    response = requests.get(browser_download_url, headers=headers)
+    response = http_client.get(browser_download_url, headers=headers)
     if response.status_code == 200:
         return response.text
     else:
@@ -275,121 +433,349 @@ def plugin_json_download(browser_download_url):
         return None
 
 
-def process_asset(session: Session, release: Release, asset_data: dict):
-    """Create or update an Asset record and handle plugin.json if present.
+def _stored_plugin_jsons(session: Session, keys: Dict[str, tuple], tags: Dict[str, str]) -> Dict[str, str]:
+    """数据库中已保存的 plugin.json：Plugin.raw_json_asset 与 asset 当前的 (github_id, updated_at, size) 相同，
+    且 release 的 tag 未变化时返回保存的 raw_json（其中 ms-plugin:// 已替换，再次替换不会改变内容）
 
-    This unifies logic used for both new releases and existing releases.
+    keys 为 {browser_download_url: cache_key}，tags 为 {browser_download_url: tag_name}，返回 {browser_download_url: text}
     """
-    # Handle plugin.json specially (download and populate Plugin)
-    if asset_data.get('name') == 'plugin.json' and asset_data.get('browser_download_url'):
-        plugin_text = plugin_json_download(asset_data['browser_download_url'])
-        if plugin_text:
-            plugin_text = plugin_text.replace("ms-plugin://", f"https://raw.githubusercontent.com/{release.repository.full_name}/{release.tag_name}/")
-            try:
-                plugin_data = json.loads(plugin_text)
-            except Exception:
-                plugin_data = None
-
-            if plugin_data:
-                plugin_obj = session.query(Plugin).filter_by(release_id=release.id).first()
-                if not plugin_obj:
-                    plugin_obj = Plugin(release_id=release.id)
-                    # 关联到发布对应的仓库
-                    plugin_obj.repository_id = release.repository_id
-                    session.add(plugin_obj)
-                else:
-                    # 确保 repository_id 与 release 的 repository 保持一致
-                    plugin_obj.repository_id = release.repository_id
-
-                plugin_obj.plugin_id = plugin_data.get('Id')
-                plugin_obj.name = plugin_data.get('Name') or plugin_data.get('name')
-                plugin_obj.version = plugin_data.get('Version')
-                plugin_obj.description = plugin_data.get('Description')
-                plugin_obj.authors = plugin_data.get('Authors')
-                plugin_obj.web_uri = plugin_data.get('WebUri')
-                plugin_obj.logo = plugin_data.get('Logo')
-                plugin_obj.sdk_version = plugin_data.get('SdkVersion')
-
-                deps = plugin_data.get('Dependencies', []) or []
-                plugin_obj.dependencies = []
-                for d in deps:
-                    dep_id = d.get('Id') or d.get('id')
-                    need = d.get('Need') or d.get('need')
-                    if dep_id:
-                        plugin_obj.dependencies.append(Dependency(dep_id=dep_id, need=need))
-
-                ps = plugin_data.get('PluginStore') or {}
-                tags = ps.get('Tags', []) or []
-                plugin_obj.tags = []
-                for t in tags:
-                    plugin_obj.tags.append(PluginTag(tag=t, plugin_id=plugin_obj.id))
-                
-                plugin_obj.background_color = ps.get('BackgroundColor')
-                plugin_obj.raw_json = plugin_text
-
-    # Find existing asset by github_id
-    asset = session.query(Asset).filter_by(
-        release_id=release.id,
-        name=asset_data.get('name'),
-        ).first()
-    if not asset:
-        uploader = None
-        if 'uploader' in asset_data and asset_data['uploader']:
-            uploader = get_or_create_author(session, asset_data['uploader'])
-
-        created_at = None
-        updated_at = None
-        try:
-            if asset_data.get('created_at'):
-                created_at = get_local_time(asset_data['created_at'])
-        except Exception:
-            created_at = None
-        try:
-            if asset_data.get('updated_at'):
-                updated_at = get_local_time(asset_data['updated_at'])
-        except Exception:
-            updated_at = None
-
-        asset = Asset(
-            github_id=asset_data['id'],
-            release_id=release.id,
-            uploader_id=uploader.id if uploader else None,
-            name=asset_data.get('name'),
-            label=asset_data.get('label'),
-            content_type=asset_data.get('content_type'),
-            state=asset_data.get('state'),
-            size=asset_data.get('size'),
-            download_count=asset_data.get('download_count'),
-            created_at=created_at,
-            updated_at=updated_at,
-            browser_download_url=asset_data.get('browser_download_url')
+    by_stamp = {asset_stamp(key): url for url, key in keys.items()}
+    texts = {}
+    for chunk in _chunks(list(by_stamp)):
+        rows = (
+            session.query(Plugin.raw_json_asset, Release.tag_name, Plugin.raw_json)
+            .join(Plugin.release)
+            .filter(Plugin.raw_json_asset.in_(chunk), Plugin.raw_json.isnot(None))
         )
-        session.add(asset)
+        for stamp, tag_name, raw_json in rows:
+            url = by_stamp[stamp]
+            if tags.get(url) == tag_name:
+                texts[url] = raw_json
+    return texts
+
+
+def download_plugin_jsons(releases_data: list, session: Optional[Session] = None) -> dict:
+    """并行下载多个 release 中的 plugin.json，返回 {browser_download_url: text}
+
+    asset 的 (id, updated_at, size) 命中内存中的 plugin.json 缓存，或与数据库中上次入库的 asset 相同
+    （见 _stored_plugin_jsons，重启后仍然有效）时直接使用已有内容，不再下载。
+    下载失败（非 200）的地址不会出现在结果中；网络错误在重试后继续抛出，交由调用方重试。
+    """
+    texts = {}
+    pending = {}
+    tags = {}
+    for release_data in releases_data:
+        for asset_data in release_data.get('assets', []):
+            url = asset_data.get('browser_download_url')
+            if asset_data.get('name') != 'plugin.json' or not url or url in texts or url in pending:
+                continue
+            tags[url] = release_data.get('tag_name')
+            key = cache_key(asset_data)
+            text = get_plugin_json(key) if key else None
+            if text is not None:
+                texts[url] = text
+            else:
+                pending[url] = key
+    if session is not None and pending:
+        stored = _stored_plugin_jsons(session, {url: key for url, key in pending.items() if key}, tags)
+        for url, text in stored.items():
+            texts[url] = text
+            put_plugin_json(pending.pop(url), text)
+        record_lookups(len(stored), len(pending))
     else:
-        # update existing asset fields
-        asset.name = asset_data.get('name')
-        asset.label = asset_data.get('label')
-        asset.content_type = asset_data.get('content_type')
-        asset.state = asset_data.get('state')
-        asset.size = asset_data.get('size')
-        asset.download_count = asset_data.get('download_count')
-        asset.browser_download_url = asset_data.get('browser_download_url')
+        record_lookups(0, len(pending))
+    urls = list(pending)
+    for url, response in zip(urls, http_client.get_many(urls)):
+        if isinstance(response, Exception):
+            raise response
+        if response.status_code == 200:
+            texts[url] = response.text
+            if pending[url]:
+                put_plugin_json(pending[url], response.text)
+        else:
+            print(f"Error fetching {url}: {response.status_code}")
+    return texts
+
+
+def find_download_url(assets_data: list):
+    """返回 release assets 中第一个 .sdow 安装包的下载地址"""
+    for asset_data in assets_data or []:
+        name = asset_data.get('name')
+        if name and name.lower().endswith('.sdow'):
+            return asset_data.get('browser_download_url')
+    return None
+
+
+# release 事件 action 在 webhook 日志中的显示名称
+ACTION_NAMES = {
+    "edited": "编辑",
+    "published": "发布",
+    "released": "发布",
+    "created": "创建",
+    "deleted": "删除",
+    "backfill": "回填",
+}
+
+
+def _insert(session: Session, model):
+    """方言原生的 INSERT 构造（SQLite / PostgreSQL 都支持 ON CONFLICT）"""
+    if session.get_bind().dialect.name == "postgresql":
+        return pg_insert(model)
+    return sqlite_insert(model)
+
+
+def _chunks(items: list, size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _bulk_update(session: Session, model, rows: List[dict]):
+    """按主键批量 UPDATE；列组合相同的行排在一起，每种组合只执行一次 executemany"""
+    if rows:
+        session.execute(update(model), sorted(rows, key=lambda row: sorted(row)))
+
+
+def _parse_time(value):
+    try:
+        return get_local_time(value) if value else None
+    except Exception:
+        return None
+
+
+def _author_row(author_data: dict) -> dict:
+    return {
+        'id': author_data['id'],
+        'login': author_data.get('login'),
+        'avatar_url': author_data.get('avatar_url'),
+        'html_url': author_data.get('html_url'),
+        'type': author_data.get('type'),
+    }
+
+
+def _parse_plugin_json(repo: Repository, release_data: dict, plugin_texts: dict):
+    """返回 release 中 plugin.json 的 (原文, 解析结果, asset 标识)，没有或无法解析时返回 None"""
+    for asset_data in release_data['assets']:
+        url = asset_data.get('browser_download_url')
+        if asset_data.get('name') != 'plugin.json' or not url:
+            continue
+        plugin_text = plugin_texts.get(url)
+        if not plugin_text:
+            continue
+        plugin_text = plugin_text.replace("ms-plugin://", f"https://raw.githubusercontent.com/{repo.full_name}/{release_data['tag_name']}/")
         try:
-            if asset_data.get('updated_at'):
-                asset.updated_at = get_local_time(asset_data['updated_at'])
+            plugin_data = json.loads(plugin_text)
         except Exception:
-            pass
+            continue
+        if plugin_data and isinstance(plugin_data, dict):
+            key = cache_key(asset_data)
+            return plugin_text, plugin_data, asset_stamp(key) if key else None
+    return None
+
+
+def _plugin_values(repo: Repository, release_data: dict, plugin_text: str, plugin_data: dict, source: Optional[str]) -> dict:
+    ps = plugin_data.get('PluginStore') or {}
+    version = plugin_data.get('Version')
+    sdk_version = plugin_data.get('SdkVersion')
+    return {
+        'repository_id': repo.id,
+        'plugin_id': plugin_data.get('Id'),
+        'name': plugin_data.get('Name') or plugin_data.get('name'),
+        'version': version,
+        'version_key': version_key(version),
+        'description': plugin_data.get('Description'),
+        'authors': plugin_data.get('Authors'),
+        'web_uri': plugin_data.get('WebUri'),
+        'logo': plugin_data.get('Logo'),
+        'sdk_version': sdk_version,
+        'sdk_version_key': version_key(sdk_version),
+        'background_color': ps.get('BackgroundColor'),
+        'download_url': find_download_url(release_data['assets']),
+        'raw_json': plugin_text,
+        'raw_json_sha256': content_sha256(plugin_text),
+        'raw_json_asset': source,
+        'updated_at': datetime.now(),
+    }
+
+
+def _upsert_releases(session: Session, repo: Repository, releases_data: list) -> Dict[str, int]:
+    """按 (repository_id, tag_name) 匹配已有 release 并批量更新，其余批量插入，返回 {tag_name: Release.id}"""
+    tags = [r['tag_name'] for r in releases_data]
+    release_ids = {}
+    for chunk in _chunks(tags):
+        release_ids.update(session.query(Release.tag_name, Release.id).filter(
+            Release.repository_id == repo.id, Release.tag_name.in_(chunk)))
+
+    updates, inserts = [], []
+    for release_data in releases_data:
+        author = release_data.get('author')
+        values = {
+            'github_id': release_data['id'],
+            'name': release_data['name'],
+            'body': release_data['body'],
+            'draft': release_data['draft'],
+            'prerelease': release_data['prerelease'],
+        }
+        if author:
+            values['author_id'] = author['id']
+        if release_data['tag_name'] in release_ids:
+            updates.append({'id': release_ids[release_data['tag_name']], **values})
+        else:
+            inserts.append({
+                **values,
+                'repository_id': repo.id,
+                'author_id': author['id'] if author else None,
+                'tag_name': release_data['tag_name'],
+                'created_at': get_local_time(release_data['created_at']),
+                'published_at': get_local_time(release_data['published_at']) if release_data['published_at'] else None,
+                'html_url': release_data['html_url'],
+                'tarball_url': release_data['tarball_url'],
+                'zipball_url': release_data['zipball_url'],
+            })
+    _bulk_update(session, Release, updates)
+    if inserts:
+        stmt = _insert(session, Release)
+        # github_id 已存在（例如 tag 被改名）时更新该 release，而不是违反唯一约束
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Release.github_id],
+            set_={key: stmt.excluded[key] for key in inserts[0] if key != 'github_id'},
+        ).returning(Release.tag_name, Release.id)
+        release_ids.update(session.execute(stmt, inserts).tuples().all())
+    return release_ids
+
+
+def _upsert_assets(session: Session, releases_data: list, release_ids: Dict[str, int]):
+    """按 (release_id, name) 匹配已有 asset 并批量更新，其余批量插入"""
+    asset_ids = {}
+    for chunk in _chunks(list(release_ids.values())):
+        for asset_id, release_id, name in session.query(Asset.id, Asset.release_id, Asset.name).filter(Asset.release_id.in_(chunk)):
+            asset_ids[(release_id, name)] = asset_id
+
+    updates, inserts = [], []
+    for release_data in releases_data:
+        release_id = release_ids[release_data['tag_name']]
+        for asset_data in release_data['assets']:
+            values = {
+                'name': asset_data.get('name'),
+                'label': asset_data.get('label'),
+                'content_type': asset_data.get('content_type'),
+                'state': asset_data.get('state'),
+                'size': asset_data.get('size'),
+                'download_count': asset_data.get('download_count'),
+                'browser_download_url': asset_data.get('browser_download_url'),
+            }
+            updated_at = _parse_time(asset_data.get('updated_at'))
+            asset_id = asset_ids.get((release_id, asset_data.get('name')))
+            if asset_id is not None:
+                if updated_at:
+                    values['updated_at'] = updated_at
+                updates.append({'id': asset_id, **values})
+            else:
+                uploader = asset_data.get('uploader')
+                inserts.append({
+                    **values,
+                    'github_id': asset_data['id'],
+                    'release_id': release_id,
+                    'uploader_id': uploader['id'] if uploader else None,
+                    'created_at': _parse_time(asset_data.get('created_at')),
+                    'updated_at': updated_at,
+                })
+    _bulk_update(session, Asset, updates)
+    if inserts:
+        stmt = _insert(session, Asset)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Asset.github_id],
+            set_={key: stmt.excluded[key] for key in inserts[0] if key not in ('github_id', 'created_at')},
+        )
+        session.execute(stmt, inserts)
+
+
+def _upsert_plugins(session: Session, repo: Repository, releases_data: list, release_ids: Dict[str, int], plugin_texts: dict):
+    """写入各 release 的 plugin.json：Plugin 批量更新或插入，依赖与标签整体替换，并更新全文索引
+
+    已有 Plugin 的 raw_json_sha256 与新内容相同时不重写插件信息、依赖、标签与索引，只同步下载地址。
+    """
+    parsed = {}
+    for release_data in releases_data:
+        result = _parse_plugin_json(repo, release_data, plugin_texts)
+        if result:
+            parsed[release_ids[release_data['tag_name']]] = (release_data, *result)
+    if not parsed:
+        return
+
+    existing = {}
+    for chunk in _chunks(list(parsed)):
+        rows = session.query(Plugin.id, Plugin.release_id, Plugin.plugin_id, Plugin.raw_json_sha256, Plugin.raw_json_asset,
+                             Plugin.download_url).filter(
+            Plugin.release_id.in_(chunk)).order_by(Plugin.id.desc())
+        # 同一 release 有多条记录时使用最早的一条
+        existing.update({row.release_id: row for row in rows})
+
+    # 记录受影响的 plugin_id（包括改名前的 Id），提交后用于刷新商店目录
+    touched = session.info.setdefault("catalog_plugin_ids", set())
+    updates, inserts, moved = [], [], []
+    for release_id, (release_data, plugin_text, plugin_data, source) in list(parsed.items()):
+        values = _plugin_values(repo, release_data, plugin_text, plugin_data, source)
+        row = existing.get(release_id)
+        if row is not None and row.raw_json_sha256 == values['raw_json_sha256']:
+            # plugin.json 未变化，asset 变化时仍需更新 .sdow 下载地址与 raw_json 的来源
+            del parsed[release_id]
+            if row.download_url != values['download_url']:
+                moved.append({'id': row.id, 'download_url': values['download_url'], 'raw_json_asset': source})
+                touched.add(row.plugin_id)
+            elif row.raw_json_asset != source:
+                moved.append({'id': row.id, 'download_url': row.download_url, 'raw_json_asset': source})
+            continue
+        touched.add(values['plugin_id'])
+        if row is not None:
+            if row.plugin_id:
+                touched.add(row.plugin_id)
+            updates.append({'id': row.id, **values})
+        else:
+            inserts.append({'release_id': release_id, **values})
+
+    record_unchanged(len(existing) - len(updates))
+    _bulk_update(session, Plugin, moved)
+    plugin_pks = {release_id: row.id for release_id, row in existing.items()}
+    if updates:
+        session.execute(update(Plugin), updates)
+        for chunk in _chunks([row['id'] for row in updates]):
+            session.query(Dependency).filter(Dependency.plugin_id.in_(chunk)).delete(synchronize_session=False)
+            session.query(PluginTag).filter(PluginTag.plugin_id.in_(chunk)).delete(synchronize_session=False)
+    if inserts:
+        stmt = insert(Plugin).returning(Plugin.release_id, Plugin.id)
+        plugin_pks.update(session.execute(stmt, inserts).tuples().all())
+
+    dependencies, tags, documents = [], [], []
+    for release_id, (_, _, plugin_data, _) in parsed.items():
+        pk = plugin_pks[release_id]
+        for d in plugin_data.get('Dependencies', []) or []:
+            dep_id = d.get('Id') or d.get('id')
+            if dep_id:
+                dependencies.append({'plugin_id': pk, 'dep_id': dep_id, 'need': d.get('Need') or d.get('need')})
+        plugin_tags = [t for t in (plugin_data.get('PluginStore') or {}).get('Tags', []) or [] if t]
+        tags.extend({'plugin_id': pk, 'tag': t} for t in plugin_tags)
+        documents.append((pk, plugin_data.get('Name') or plugin_data.get('name'), plugin_data.get('Description'),
+                          plugin_data.get('Authors'), plugin_tags))
+    if dependencies:
+        session.execute(insert(Dependency), dependencies)
+    if tags:
+        session.execute(insert(PluginTag), tags)
+    index_plugins(session, documents)
 
-    return asset
 
 # 将GitHub release数据保存到数据库
 def save_releases_to_db(event:str,action:str, full_name:str, releases_data:list):
+    """入库一批 release（同一仓库）
+
+    先用少量 IN 查询预取已有的 release / asset / plugin，再按表批量写入（UPDATE 按主键 executemany，
+    新记录使用方言原生的 INSERT ... ON CONFLICT），SQL 条数与 release 数量基本无关。
+    """
     with get_session() as session:
         repo = session.query(Repository).filter_by(full_name=full_name).first()
         if not repo:
             # 获取仓库信息
-            repo_url = f'https://api.github.com/repos/{full_name}'
-            repo_response = requests.get(repo_url)
+            repo_url = f'{settings.github_api_url}/repos/{full_name}'
+            repo_response = http_client.get(repo_url)
             if repo_response.status_code == 200:
                 repo_data = repo_response.json()
                 repo = Repository(
@@ -402,73 +788,147 @@ def save_releases_to_db(event:str,action:str, full_name:str, releases_data:list)
             else:
                 print(f"Error fetching repository info: {repo_response.status_code}")
                 return
-        
-        for release_data in releases_data:
-            if not plugin_json_exists(release_data):
-                continue
-            author = None
-            if 'author' in release_data and release_data['author']:
-                author = get_or_create_author(session, release_data['author'])
-            
-            # 检查release是否已存在
-            release = session.query(Release).filter_by(
-                repository_id=repo.id,
-                tag_name=release_data['tag_name']
-                ).first()
-            if not release:
-                # 创建新release
-                release = Release(
-                    github_id=release_data['id'],
-                    repository_id=repo.id,
-                    author_id=author.id if author else None,
-                    tag_name=release_data['tag_name'],
-                    name=release_data['name'],
-                    body=release_data['body'],
-                    draft=release_data['draft'],
-                    prerelease=release_data['prerelease'],
-                    created_at=get_local_time(release_data['created_at']),
-                    published_at=get_local_time(release_data['published_at']) if release_data['published_at'] else None,
-                    html_url=release_data['html_url'],
-                    tarball_url=release_data['tarball_url'],
-                    zipball_url=release_data['zipball_url']
-                )
-                session.add(release)
-                session.flush()
-                
-                # 处理assets
-                for asset_data in release_data['assets']:
-                    process_asset(session, release, asset_data)
-            else:
-                # 更新已存在的release
-                release.github_id=release_data['id']
-                release.tag_name = release_data['tag_name']
-                release.name = release_data['name']
-                release.body = release_data['body']
-                release.draft = release_data['draft']
-                release.prerelease = release_data['prerelease']
-                if author:
-                    release.author_id = author.id
-                
-                # 更新assets
-                for asset_data in release_data['assets']:
-                    process_asset(session, release, asset_data)
-
-            if action == "edited":
-                action_str = "编辑"
-            elif action == "published" or action == "released":
-                action_str = "发布"
-            elif action == "created":
-                action_str = "创建"
-            elif action == "deleted":
-                action_str = "删除"
-            else:
-                action_str = action
-            write_webhook_log_with_db(session, repository_id=repo.id,
-                                    author_id=author.id if author else None,
-                                    event=event,
-                                    action=action,
-                                    payload=f"仓库 {full_name} {action_str}版本 {release_data['tag_name']}", level=1)
+
+        counts_before = repository_counts(session, repo)
+
+        # 并行下载所有 release 的 plugin.json
+        releases_data = [r for r in releases_data if plugin_json_exists(r)]
+        plugin_texts = download_plugin_jsons(releases_data, session)
+        # 同一 tag 出现多次时以最后一次为准
+        releases_data = list({r['tag_name']: r for r in releases_data}.values())
+
+        if releases_data:
+            # release 作者与 asset 上传者：不存在的作者一次插入
+            authors = {}
+            for release_data in releases_data:
+                for author_data in [release_data.get('author')] + [a.get('uploader') for a in release_data['assets']]:
+                    if author_data:
+                        authors[author_data['id']] = _author_row(author_data)
+            if authors:
+                stmt = _insert(session, Author).on_conflict_do_nothing(index_elements=[Author.id])
+                session.execute(stmt, list(authors.values()))
+
+            release_ids = _upsert_releases(session, repo, releases_data)
+            _upsert_assets(session, releases_data, release_ids)
+            _upsert_plugins(session, repo, releases_data, release_ids, plugin_texts)
+
+            action_str = ACTION_NAMES.get(action, action)
+            session.execute(insert(WebhookLog), [
+                {
+                    'repository_id': repo.id,
+                    'author_id': release_data['author']['id'] if release_data.get('author') else None,
+                    'event': event,
+                    'action': action,
+                    'payload': f"仓库 {full_name} {action_str}版本 {release_data['tag_name']}",
+                    'level': 1,
+                }
+                for release_data in releases_data
+            ])
+        apply_counts_change(session, counts_before, repository_counts(session, repo))
         session.commit()
+        touched = session.info.pop("catalog_plugin_ids", None)
+        if touched:
+            bump_catalog_revision(touched)
+
+
+# 仪表盘计数的增量维护：写路径在修改仓库（installed / watched / 作者）、Release 可见性或入库插件前后
+# 各取一次仓库的计数贡献，在同一事务中把差值累加到全局和作者的计数行
+COUNTER_FIELDS = ('total_plugins', 'installed_repos', 'watched_repos')
+
+
+def repository_counts(session: Session, repo: Optional[Repository]) -> Optional[Tuple[Optional[int], Dict[str, int]]]:
+    """仓库对仪表盘计数的贡献 (author_id, 计数)，repo 为 None 时返回 None"""
+    if repo is None:
+        return None
+    session.flush()
+    plugins = 0
+    if repo.watched:
+        # 只统计 Release 可见的插件，与 /api/stats 的定义一致
+        plugins = session.query(func.count(Plugin.id)).join(Plugin.release).filter(
+            Plugin.repository_id == repo.id, Release.visible == True
+        ).scalar()
+    return repo.author_id, {
+        'total_plugins': plugins,
+        'installed_repos': int(bool(repo.installed)),
+        'watched_repos': int(bool(repo.watched)),
+    }
+
+
+def compute_dashboard_counts(session: Session, author_id: Optional[int] = None) -> Dict[int, Dict[str, int]]:
+    """从业务表重新计算仪表盘计数，返回 {author_id: 计数}，键 0 为全局计数
+
+    author_id 为空时计算全部作者与全局计数；非 0 时只计算该作者。
+    """
+    repo_q = session.query(
+        Repository.author_id,
+        func.sum(cast(Repository.installed, Integer)),
+        func.sum(cast(Repository.watched, Integer)),
+    )
+    plugin_q = (
+        session.query(Repository.author_id, func.count(Plugin.id))
+        .select_from(Plugin)
+        .join(Plugin.repository)
+        .join(Plugin.release)
+        .filter(Repository.watched == True, Release.visible == True)
+    )
+    if author_id:
+        repo_q = repo_q.filter(Repository.author_id == author_id)
+        plugin_q = plugin_q.filter(Repository.author_id == author_id)
+
+    counts: Dict[int, Dict[str, int]] = {}
+
+    def entry(key):
+        return counts.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+
+    for key, installed, watched in repo_q.group_by(Repository.author_id):
+        entry(key)['installed_repos'] = int(installed or 0)
+        entry(key)['watched_repos'] = int(watched or 0)
+    for key, plugins in plugin_q.group_by(Repository.author_id):
+        entry(key)['total_plugins'] = int(plugins or 0)
+
+    if author_id:
+        return {author_id: entry(author_id)}
+    total = dict.fromkeys(COUNTER_FIELDS, 0)
+    for values in counts.values():
+        for field in COUNTER_FIELDS:
+            total[field] += values[field]
+    # 没有作者的仓库只计入全局计数
+    counts.pop(None, None)
+    counts[0] = total
+    return counts
+
+
+def _add_counter(session: Session, author_id: int, delta: Dict[str, int]):
+    updated = session.query(DashboardCounter).filter(DashboardCounter.author_id == author_id).update(
+        {getattr(DashboardCounter, field): getattr(DashboardCounter, field) + value for field, value in delta.items()},
+        synchronize_session=False,
+    )
+    if updated:
+        return
+    # 计数行还不存在：按当前事务中（已 flush）的数据直接计算完整值
+    try:
+        with session.begin_nested():
+            values = compute_dashboard_counts(session, author_id)[author_id]
+            session.add(DashboardCounter(author_id=author_id, **values))
+    except IntegrityError:
+        # 并发事务已经创建了计数行，改为累加
+        _add_counter(session, author_id, delta)
+
+
+def apply_counts_change(session: Session, before, after):
+    """将仓库计数贡献的变化（repository_counts 的前后两次结果）累加到计数表，需要在提交前调用"""
+    deltas: Dict[int, Dict[str, int]] = {}
+    for counts, sign in ((before, -1), (after, 1)):
+        if counts is None:
+            continue
+        author_id, values = counts
+        for key in {0, author_id} - {None}:
+            delta = deltas.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+            for field in COUNTER_FIELDS:
+                delta[field] += sign * values[field]
+    for key, delta in deltas.items():
+        if any(delta.values()):
+            _add_counter(session, key, delta)
 
 
 def write_webhook_log_with_db(db: Session, repository_id,author_id,event,action,payload,level=0):
@@ -501,7 +961,10 @@ def write_webhook_log(repository_id,author_id,event,action,payload,level=0):
     except Exception as e:
         logger.error(f"Failed to write webhook log for {event}: {e}")
 
-Base.metadata.create_all(engine)
+# 创建缺失的表并执行未执行过的数据库迁移
+run_migrations(engine, Base.metadata)
+# 目录修订号写入数据库，多个进程共享
+attach_catalog_revision(engine, settings.catalog_revision_poll_interval)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import settings
+
+# plugin.json 下载缓存（LRU，按内容总字节数限制容量）
+# 键为 (asset github_id, updated_at, size)：GitHub 上 asset 的内容变化时 updated_at / size 随之变化，
+# 同一个键对应的内容不会变化，命中时不需要重新下载。值为 (文本, 字节数)。
+# 本缓存只在进程内有效，作为第一层；未命中时由 models.download_plugin_jsons 再对照数据库中保存的
+# 键与 Plugin.raw_json_asset（第二层，重启后仍然有效），都未命中才下载。
+# 入库时另用内容的 SHA-256（Plugin.raw_json_sha256）判断插件信息是否需要重写。
+CacheKey = Tuple[int, str, int]
+
+_entries: "OrderedDict[CacheKey, Tuple[str, int]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored_hits": 0, "downloads": 0, "evictions": 0, "unchanged": 0}
+_bytes = 0
+
+
+def content_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(asset_data: dict) -> Optional[CacheKey]:
+    """release asset 的缓存键，缺少 id / updated_at 时不缓存"""
+    if asset_data.get("id") is None or not asset_data.get("updated_at"):
+        return None
+    return asset_data["id"], asset_data["updated_at"], asset_data.get("size") or 0
+
+
+def asset_stamp(key: CacheKey) -> str:
+    """缓存键的文本形式，保存在 Plugin.raw_json_asset 中"""
+    return f"{key[0]}:{key[1]}:{key[2]}"
+
+
+def get_plugin_json(key: CacheKey) -> Optional[str]:
+    """返回缓存的 plugin.json 文本，未命中返回 None"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[0]
+
+
+def put_plugin_json(key: CacheKey, text: str):
+    """缓存下载到的 plugin.json；超出容量时淘汰最久未使用的条目"""
+    global _bytes
+    size = len(text.encode("utf-8"))
+    if size > settings.plugin_json_cache_bytes:
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _bytes -= old[1]
+        _entries[key] = (text, size)
+        _bytes += size
+        while _bytes > settings.plugin_json_cache_bytes:
+            _, (_, evicted) = _entries.popitem(last=False)
+            _bytes -= evicted
+            _stats["evictions"] += 1
+
+
+def clear():
+    """清空内存缓存（统计保留）"""
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+
+def record_lookups(stored_hits: int, downloads: int):
+    """记录内存缓存未命中后，由数据库中已保存的内容满足的次数与实际下载次数"""
+    with _lock:
+        _stats["stored_hits"] += stored_hits
+        _stats["downloads"] += downloads
+
+
+def record_unchanged(count: int):
+    """记录因内容未变化而跳过重写的 Plugin 数"""
+    with _lock:
+        _stats["unchanged"] += count
+
+
+def cache_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(_entries),
+            "bytes": _bytes,
+            "max_bytes": settings.plugin_json_cache_bytes,
+        }
@@ -1,14 +1,18 @@
 
 from math import ceil
-from typing import List
+from typing import List, Optional, Union
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
 
 
-from auth import get_current_user
-from models import Author, Release, Repository, get_db, write_webhook_log_with_db
+from auth import CurrentUser, get_current_user
+from models import Plugin, Release, Repository, apply_counts_change, get_db, repository_counts, write_webhook_log_with_db
+from pagination import decode_cursor, encode_cursor
 from res_model import *
+from revision import bump_catalog_revision
+from search_index import repository_name_filter
 
 
 router = APIRouter(prefix="/repositories", tags=["Repositories"])
@@ -18,7 +22,7 @@ router = APIRouter(prefix="/repositories", tags=["Repositories"])
 @router.get("/installed_exists", tags=["Repositories"])
 async def installed_exists(
     db: Session = Depends(get_db),
-    current_user: Author = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     检查数据库中是否存在与当前用户关联且已安装的仓库
@@ -28,71 +32,117 @@ async def installed_exists(
     return {"installed_repo_exists": installed_repo_exists}
 
 
-@router.get("/search", response_model=List[RepositoryBasicModel], tags=["Search"])
+@router.get("/search", response_model=PaginatedResponse[RepositoryBasicModel], tags=["Search"])
 async def search_repositories(
-    q: str = Query(..., description="搜索关键词"),
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词"),
+    page: int = Query(1, ge=1, description="页码（从1开始）"),
+    limit: int = Query(20, ge=1, le=100, description="每页条数"),
     db: Session = Depends(get_db),
-    current_user: Author = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     搜索仓库
+
+    仓库名匹配走三元组索引；发布数量与总数在同一个分组查询中计算（窗口函数），
+    作者信息批量加载，SQL 条数与匹配的仓库数量无关。
     """
-    search_term = f"%{q}%"
-    base_q = db.query(Repository).filter(
-        Repository.name.like(search_term) | Repository.full_name.like(search_term)
+    base_q = (
+        db.query(Repository, func.count(Release.id), func.count().over())
+        .outerjoin(Release, Release.repository_id == Repository.id)
+        .filter(repository_name_filter(db, Repository.id, Repository.full_name, q))
     )
     if not getattr(current_user, "is_admin", False):
         base_q = base_q.filter(Repository.author_id == current_user.id)
-    repositories = base_q.all()
-    
-    result = []
-    for repo in repositories:
-        release_count = db.query(Release).filter(Release.repository_id == repo.id).count()
-        repo_model = RepositoryBasicModel(
+    skip = (page - 1) * limit
+    rows = (
+        base_q.group_by(Repository.id)
+        .order_by(Repository.id)
+        .options(selectinload(Repository.author))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    if rows:
+        total = rows[0][2]
+    elif skip:
+        # 页码超出范围时窗口函数没有结果行，单独计数
+        total = base_q.with_entities(func.count(func.distinct(Repository.id))).scalar()
+    else:
+        total = 0
+
+    items = [
+        RepositoryBasicModel(
             id=repo.id,
             name=repo.name,
             full_name=repo.full_name,
             html_url=repo.html_url,
+            watched=repo.watched,
             release_count=release_count,
             author=repo.author
         )
-        result.append(repo_model)
-    
-    return result
+        for repo, release_count, _ in rows
+    ]
+    return PaginatedResponse[RepositoryBasicModel](
+        total=total,
+        page=page,
+        limit=limit,
+        pages=ceil(total / limit) if total else 1,
+        items=items
+    )
+
 
+def _repository_model(repo: Repository) -> RepositoryBasicModel:
+    return RepositoryBasicModel(
+        id=repo.id,
+        name=repo.name,
+        watched=repo.watched,
+        full_name=repo.full_name,
+        html_url=repo.html_url,
+        releases=repo.releases,
+        author=repo.author
+    )
 
 
-@router.get("/", response_model=PaginatedResponse[RepositoryBasicModel], tags=["Repositories"]) 
+@router.get("/", response_model=Union[PaginatedResponse[RepositoryBasicModel], CursorPaginatedResponse[RepositoryBasicModel]], tags=["Repositories"]) 
 async def get_repositories(
     page: int = Query(1, ge=1, description="页码（从1开始）"),
     limit: int = Query(10, ge=1, le=1000, description="每页条数"),
+    cursor: Optional[str] = Query(None, description="游标分页：传入上一页返回的 next_cursor，传空字符串从第一页开始"),
+    include_total: bool = Query(False, description="游标分页时是否返回总数"),
     db: Session = Depends(get_db),
-    current_user: Author = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     分页获取仓库的基本信息列表
+
+    传入 `cursor` 时使用按 Repository.id 的游标分页，默认不计算总数。
     """
     base_q = db.query(Repository)
     if not getattr(current_user, "is_admin", False):
         base_q = base_q.filter(Repository.author_id == current_user.id)
 
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        total = base_q.count() if include_total else None
+        page_q = base_q.order_by(Repository.id)
+        if last_id is not None:
+            page_q = page_q.filter(Repository.id > last_id)
+        # 多取一条用于判断是否还有下一页
+        repositories = page_q.limit(limit + 1).all()
+        next_cursor = encode_cursor(repositories[limit - 1].id) if len(repositories) > limit else None
+        return CursorPaginatedResponse[RepositoryBasicModel](
+            limit=limit,
+            next_cursor=next_cursor,
+            total=total,
+            items=[_repository_model(repo) for repo in repositories[:limit]]
+        )
+
     total = base_q.count()
     skip = (page - 1) * limit
     pages = ceil(total / limit) if total else 1
     repositories = base_q.offset(skip).limit(limit).all()
 
-    items = []
-    for repo in repositories: 
-        repo_model = RepositoryBasicModel(
-            id=repo.id,
-            name=repo.name,
-            watched=repo.watched,
-            full_name=repo.full_name,
-            html_url=repo.html_url,
-            releases=repo.releases,
-            author=repo.author
-        )
-        items.append(repo_model)
+    items = [_repository_model(repo) for repo in repositories]
 
     return PaginatedResponse[RepositoryBasicModel](
         total=total,
@@ -104,7 +154,7 @@ async def get_repositories(
 
 
 @router.get("/{repo_id}", response_model=RepositoryModel, tags=["Repositories"])
-async def get_repository(repo_id: int, db: Session = Depends(get_db), current_user: Author = Depends(get_current_user)):
+async def get_repository(repo_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     """
     获取特定仓库的详细信息，包括所有发布版本
     """
@@ -134,7 +184,7 @@ async def update_repo_watched(
     repo_id: int,
     payload: WatchedUpdate,
     db: Session = Depends(get_db),
-    current_user: Author = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Update the `watched` flag for a repository. Only the repository owner or an admin can modify this flag.
@@ -147,13 +197,19 @@ async def update_repo_watched(
     if not getattr(current_user, "is_admin", False) and repo.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    changed = repo.watched != bool(payload.watched)
+    counts_before = repository_counts(db, repo)
     repo.watched = bool(payload.watched)
     db.add(repo)
+    apply_counts_change(db, counts_before, repository_counts(db, repo))
     write_webhook_log_with_db(db, repository_id=repo.id,
                               author_id=current_user.id, event="",action="",
                               payload=f"设置仓库 {repo.full_name} 插件可见状态为 {repo.watched}")
     db.commit()
     db.refresh(repo)
+    if changed:
+        plugin_ids = [row[0] for row in db.query(Plugin.plugin_id).filter(Plugin.repository_id == repo.id).distinct()]
+        bump_catalog_revision(plugin_ids)
 
     return RepositoryBasicModel(
         id=repo.id,
@@ -13,6 +13,14 @@ class PaginatedResponse(BaseModel, Generic[T]):
     pages: int
     items: List[T]
 
+class CursorPaginatedResponse(BaseModel, Generic[T]):
+    limit: int
+    # 下一页的游标，为 None 表示已经是最后一页
+    next_cursor: Optional[str] = None
+    # 仅在请求 include_total=true 时返回
+    total: Optional[int] = None
+    items: List[T]
+
 class AssetModel(BaseModel):
     id: int
     github_id: int
@@ -60,6 +68,8 @@ class RepositoryBasicModel(BaseModel):
     full_name: str
     html_url: str
     watched: bool = False
+    # 仅在搜索结果中返回
+    release_count: Optional[int] = None
     releases: List[ReleaseModel] = []
     author: Optional[AuthorModel] = None
     model_config = ConfigDict(from_attributes=True)
@@ -72,6 +82,7 @@ class RepositoryModel(RepositoryBasicModel):
 class WebhookLogModel(BaseModel):
     id: int
     author: Optional[AuthorModel] = None
+    repository_id: Optional[int] = None
     repository: Optional[RepositoryBasicModel] = None
     event: str
     action: Optional[str] = None
@@ -117,4 +128,54 @@ class PluginModel(BaseModel):
     Dependencies: List[PluginDependencyModel] = []
     DownloadUrl: Optional[str] = None
     LastUpdated: Optional[str] = None
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class PluginVersionResultModel(BaseModel):
+    plugin_id: str
+    version: str
+    # 未找到对应的插件版本时为 False，plugin 为空
+    found: bool
+    plugin: Optional[PluginModel] = None
+
+
+class PluginUpdateModel(BaseModel):
+    Id: str
+    Name: Optional[str]
+    # 客户端当前安装的版本
+    InstalledVersion: str
+    Version: str
+    SdkVersion: Optional[str]
+    DownloadUrl: Optional[str]
+
+
+class ResolvedPluginModel(BaseModel):
+    Id: str
+    Version: Optional[str]
+    DownloadUrl: Optional[str] = None
+    # 与根插件之间的依赖层数，根插件为 0
+    Depth: int = 0
+    # 对该插件提出约束的插件（id@version）
+    RequiredBy: List[str] = []
+
+
+class DependencyConflictModel(BaseModel):
+    Id: str
+    Need: Optional[str] = None
+    RequiredBy: str
+    # 商店中该插件的可见版本
+    Available: List[str] = []
+    # missing：商店中没有该插件；unsatisfied：没有满足全部约束的版本；invalid：无法解析的约束
+    Reason: str
+
+
+class ResolveResultModel(BaseModel):
+    Id: str
+    Version: Optional[str]
+    # 没有冲突时为 True
+    Resolved: bool
+    # 按安装顺序排列（被依赖的在前，根插件最后）
+    Plugins: List[ResolvedPluginModel] = []
+    # 依赖环（plugin_id 路径，首尾相同）；环中的插件仍会被解析
+    Cycles: List[List[str]] = []
+    Conflicts: List[DependencyConflictModel] = []
@@ -0,0 +1,27 @@
+from typing import Any, Mapping, Optional, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def dump_fragment(model) -> bytes:
+    """将 pydantic 模型序列化为 JSON 片段（目录刷新时预先计算，请求时直接拼接）"""
+    return orjson.dumps(model.model_dump())
+
+
+def fragment_body(fields: Mapping[str, Any], items: Sequence[bytes]) -> bytes:
+    """分页 JSON：fields 按顺序输出为顶层字段，items 为预先序列化好的条目片段，直接拼接成 JSON 数组"""
+    head = orjson.dumps(dict(fields))[:-1]
+    return b"".join((head, b',"items":[' if fields else b'"items":[', b",".join(items), b"]}"))
+
+
+def fragment_page(fields: Mapping[str, Any], items: Sequence[bytes], headers: Optional[Mapping[str, str]] = None) -> Response:
+    """分页响应，内容见 fragment_body"""
+    return Response(content=fragment_body(fields, items), media_type="application/json", headers=headers)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text, func, select
+from sqlalchemy.engine import Engine
+
+# 商店目录修订号：任何影响插件商店可见内容的写入（发布入库、Release 可见性、
+# 仓库 watched 状态）在提交之后调用 bump_catalog_revision，
+# 内存中的目录据此判断是否需要重建或局部更新。
+_lock = threading.Lock()
+_revision = 0
+# 变更记录 (revision, plugin_ids)，plugin_ids 为 None 表示需要全量重建
+_changes = deque(maxlen=1024)
+# 已经被挤出变更记录的最大修订号，早于它的读者只能全量重建
+_floor = 0
+# 修订号只在进程内有效，ETag 中带上启动标识，避免重启后修订号归零产生错误的 304
+_epoch = uuid.uuid4().hex
+
+# 多进程部署时变更记录写入数据库，各进程按间隔轮询最新修订号
+_metadata = MetaData()
+catalog_changes = Table(
+    'catalog_changes', _metadata,
+    Column('id', Integer, primary_key=True),
+    # JSON 数组；NULL 表示需要全量重建
+    Column('plugin_ids', Text, nullable=True),
+    Column('created_at', DateTime),
+)
+_engine: Optional[Engine] = None
+_poll_interval = 1.0
+_last_poll = 0.0
+
+
+def attach(engine: Engine, poll_interval: float = 1.0):
+    """将修订号与变更记录持久化到数据库，使多个进程共享同一个目录修订号"""
+    global _engine, _poll_interval, _epoch, _last_poll
+    _metadata.create_all(engine)
+    _engine = engine
+    _poll_interval = poll_interval
+    # 修订号由数据库保证单调递增，ETag 不再需要进程启动标识
+    _epoch = "db"
+    _last_poll = 0.0
+
+
+def bump_catalog_revision(plugin_ids: Optional[Iterable[str]] = None) -> int:
+    """递增目录修订号并记录受影响的 plugin_id（None 表示全部）"""
+    global _revision, _floor
+    ids = None if plugin_ids is None else {i for i in plugin_ids if i}
+    if _engine is not None:
+        with _engine.begin() as conn:
+            revision = conn.execute(catalog_changes.insert().values(
+                plugin_ids=None if ids is None else json.dumps(sorted(ids)),
+                created_at=datetime.now(),
+            )).inserted_primary_key[0]
+            # 只保留最近的变更记录，落后更多的读者全量重建
+            conn.execute(catalog_changes.delete().where(catalog_changes.c.id <= revision - _changes.maxlen))
+        with _lock:
+            _revision = max(_revision, revision)
+            return revision
+    with _lock:
+        _revision += 1
+        if len(_changes) == _changes.maxlen:
+            _floor = _changes[0][0]
+        _changes.append((_revision, ids))
+        return _revision
+
+
+def get_catalog_revision() -> int:
+    global _revision, _last_poll
+    if _engine is not None and time.monotonic() - _last_poll >= _poll_interval:
+        _last_poll = time.monotonic()
+        with _engine.connect() as conn:
+            latest = conn.execute(select(func.max(catalog_changes.c.id))).scalar() or 0
+        with _lock:
+            _revision = max(_revision, latest)
+    return _revision
+
+
+def changes_since(revision: int) -> Optional[Set[str]]:
+    """返回 revision 之后变更过的 plugin_id 集合；返回 None 表示需要全量重建"""
+    if _engine is not None:
+        with _engine.connect() as conn:
+            oldest = conn.execute(select(func.min(catalog_changes.c.id))).scalar()
+            if oldest is not None and oldest > revision + 1:
+                return None
+            rows = conn.execute(select(catalog_changes.c.plugin_ids).where(catalog_changes.c.id > revision)).scalars()
+            changed: Set[str] = set()
+            for plugin_ids in rows:
+                if plugin_ids is None:
+                    return None
+                changed |= set(json.loads(plugin_ids))
+            return changed
+    with _lock:
+        if revision < _floor:
+            return None
+        changed: Set[str] = set()
+        for rev, ids in _changes:
+            if rev <= revision:
+                continue
+            if ids is None:
+                return None
+            changed |= ids
+        return changed
+
+
+def catalog_etag(*parts) -> str:
+    """根据当前目录修订号和请求参数生成强 ETag"""
+    h = hashlib.sha256(f"{_epoch}:{get_catalog_revision()}".encode('utf-8'))
+    for part in parts:
+        h.update(b'\0' + str(part).encode('utf-8'))
+    return f'"{h.hexdigest()[:32]}"'
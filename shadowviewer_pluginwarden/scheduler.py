@@ -0,0 +1,29 @@
+import asyncio
+from typing import Callable, List
+
+from loguru import logger
+
+# 应用生命周期内的后台定时任务（同步函数在线程池中执行，不阻塞事件循环）
+_tasks: List[asyncio.Task] = []
+
+
+async def _run_periodically(name: str, fn: Callable, interval: float):
+    while True:
+        try:
+            result = await asyncio.to_thread(fn)
+            logger.debug(f"Periodic job {name} finished: {result}")
+        except Exception:
+            logger.exception(f"Periodic job {name} failed")
+        await asyncio.sleep(interval)
+
+
+def schedule(name: str, fn: Callable, interval: float):
+    """注册定时任务：立即执行一次，之后每隔 interval 秒执行一次"""
+    _tasks.append(asyncio.create_task(_run_periodically(name, fn, interval), name=name))
+
+
+async def stop_scheduled():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
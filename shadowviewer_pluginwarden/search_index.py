@@ -0,0 +1,215 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+from sqlalchemy import Integer, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+# 插件全文索引：每个 Plugin 记录（即每个版本）一行，键为 Plugin.id。
+# SQLite 使用 FTS5 虚拟表（bm25 排序），PostgreSQL 使用带 GIN 索引的 tsvector 列（ts_rank_cd 排序）。
+# 索引在 save_releases_to_db 写入 plugin.json 时增量维护。
+#
+# 仓库名索引：支持 '%q%' 子串匹配的三元组索引。SQLite 使用 trigram 分词的 FTS5 外部内容表，
+# 由 repositories 表上的触发器维护；PostgreSQL 使用 pg_trgm 的 GIN 索引。
+# SQLite 缺少 trigram 分词器（3.34 之前）时不建索引，仓库名检索退化为对 repositories 的 LIKE 顺序扫描。
+
+# 查询最多使用的词数，避免过长的查询拖慢匹配
+MAX_TERMS = 8
+# bm25 各列权重：name, description, authors, tags
+_BM25_WEIGHTS = "10.0, 2.0, 4.0, 6.0"
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# 各 SQLite 引擎上是否存在 repository_search 表
+_repository_search_tables: "WeakKeyDictionary[Engine, bool]" = WeakKeyDictionary()
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def create_search_index(conn: Connection):
+    """创建全文索引表（迁移中调用）"""
+    if _is_postgres(conn):
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS plugin_search ("
+            "plugin_pk INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_plugin_search_document ON plugin_search USING GIN (document)"
+        ))
+    else:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS plugin_search USING fts5("
+            "name, description, authors, tags, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+
+
+def _document(plugin_pk: int, name: Optional[str], description: Optional[str],
+              authors: Optional[str], tags: Iterable[str]) -> dict:
+    return {
+        "pk": plugin_pk,
+        "name": name or "",
+        "description": description or "",
+        "authors": authors if isinstance(authors, str) else " ".join(authors or []),
+        "tags": " ".join(t for t in tags if t),
+    }
+
+
+def index_plugins(bind, documents: List[tuple]):
+    """批量写入（或替换）索引文档，documents 为 (plugin_pk, name, description, authors, tags) 列表，
+    每条 SQL 一次 executemany；bind 可以是 Session 或 Connection"""
+    if not documents:
+        return
+    params = [_document(*doc) for doc in documents]
+    if _is_postgres(bind.get_bind() if isinstance(bind, Session) else bind):
+        bind.execute(text(
+            "INSERT INTO plugin_search (plugin_pk, document) VALUES (:pk, "
+            "setweight(to_tsvector('simple', :name), 'A') || setweight(to_tsvector('simple', :tags), 'B') || "
+            "setweight(to_tsvector('simple', :authors), 'B') || setweight(to_tsvector('simple', :description), 'C')) "
+            "ON CONFLICT (plugin_pk) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+    else:
+        bind.execute(text("DELETE FROM plugin_search WHERE rowid = :pk"), params)
+        bind.execute(text(
+            "INSERT INTO plugin_search (rowid, name, description, authors, tags) "
+            "VALUES (:pk, :name, :description, :authors, :tags)"
+        ), params)
+
+
+def index_plugin(bind, plugin_pk: int, name: Optional[str], description: Optional[str],
+                 authors: Optional[str], tags: Iterable[str]):
+    """写入（或替换）一个 Plugin 记录的索引文档，bind 可以是 Session 或 Connection"""
+    index_plugins(bind, [(plugin_pk, name, description, authors, tags)])
+
+
+def query_terms(q: str) -> List[str]:
+    """将用户输入拆分为检索词（只保留字母数字，去掉 FTS 语法字符）"""
+    return _TERM_RE.findall(q.lower())[:MAX_TERMS]
+
+
+# 只保留商店目录中的记录（与 catalog.load_latest_plugins 一致）：Release 可见、仓库 watched，
+# 且是该 plugin_id 的最新可见版本（按版本键排序，无法解析的版本排在最前，版本键相同取 Plugin.id 最大的一条）。
+# 过滤在 SQL 中完成，分页的 LIMIT / OFFSET 才能下推到数据库
+_CATALOG_FILTER = (
+    "JOIN plugins p ON p.id = {pk} "
+    "JOIN releases r ON r.id = p.release_id AND r.visible "
+    "JOIN repositories repo ON repo.id = p.repository_id AND repo.watched "
+    "WHERE {match} AND p.plugin_id IS NOT NULL AND NOT EXISTS ("
+    "SELECT 1 FROM plugins q JOIN releases qr ON qr.id = q.release_id AND qr.visible "
+    "WHERE q.plugin_id = p.plugin_id AND ("
+    "q.version_key > p.version_key "
+    "OR (p.version_key IS NULL AND q.version_key IS NOT NULL) "
+    "OR ((q.version_key = p.version_key OR (q.version_key IS NULL AND p.version_key IS NULL)) AND q.id > p.id)))"
+)
+
+
+def _search_query(session: Session, terms: List[str]) -> Tuple[str, str, dict]:
+    """返回 (FROM 子句, 分数表达式, 参数)"""
+    if _is_postgres(session.get_bind()):
+        return (
+            "plugin_search CROSS JOIN to_tsquery('simple', :query) AS query "
+            + _CATALOG_FILTER.format(pk="plugin_search.plugin_pk", match="plugin_search.document @@ query"),
+            "-ts_rank_cd(plugin_search.document, query)",
+            {"query": " & ".join(f"{t}:*" for t in terms)},
+        )
+    return (
+        "plugin_search " + _CATALOG_FILTER.format(pk="plugin_search.rowid", match="plugin_search MATCH :query"),
+        f"bm25(plugin_search, {_BM25_WEIGHTS})",
+        {"query": " ".join(f'"{t}"*' for t in terms)},
+    )
+
+
+def search_plugin_pks(session: Session, terms: List[str], limit: Optional[int] = None, offset: int = 0) -> List[Tuple[int, float]]:
+    """按相关度返回商店目录中匹配的 (Plugin.id, 分数)，分数越小越相关；每个词按前缀匹配，多个词同时满足。
+    limit / offset 在 SQL 中分页"""
+    if not terms:
+        return []
+    source, score, params = _search_query(session, terms)
+    sql = f"SELECT p.id, {score} AS score FROM {source} ORDER BY score, p.id DESC"
+    if limit is not None:
+        sql += " LIMIT :limit OFFSET :offset"
+        params.update(limit=limit, offset=offset)
+    return [(pk, score) for pk, score in session.execute(text(sql), params)]
+
+
+def count_plugin_matches(session: Session, terms: List[str]) -> int:
+    """search_plugin_pks 的结果总数"""
+    if not terms:
+        return 0
+    source, _, params = _search_query(session, terms)
+    return session.execute(text(f"SELECT COUNT(*) FROM {source}"), params).scalar()
+
+
+def create_repository_search_index(conn: Connection):
+    """创建仓库名三元组索引（迁移中调用）"""
+    if _is_postgres(conn):
+        # pg_trgm 属于 contrib，未安装时 ILIKE 仍然可用，只是退化为顺序扫描
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_repositories_full_name_trgm "
+                    "ON repositories USING GIN (full_name gin_trgm_ops)"
+                ))
+        except Exception as e:
+            logger.warning(f"pg_trgm is not available, repository search will scan: {e}")
+        return
+    _repository_search_tables.pop(conn.engine, None)
+    try:
+        with conn.begin_nested():
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS repository_search USING fts5("
+                "full_name, content = 'repositories', content_rowid = 'id', tokenize = 'trigram')"
+            ))
+    except OperationalError as e:
+        # 不建触发器，repository_name_filter 回退到 LIKE
+        logger.warning(f"FTS5 trigram tokenizer is not available, repository search will scan: {e}")
+        return
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS repositories_search_ai AFTER INSERT ON repositories BEGIN "
+        "INSERT INTO repository_search (rowid, full_name) VALUES (new.id, new.full_name); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS repositories_search_ad AFTER DELETE ON repositories BEGIN "
+        "INSERT INTO repository_search (repository_search, rowid, full_name) VALUES ('delete', old.id, old.full_name); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS repositories_search_au AFTER UPDATE OF full_name ON repositories BEGIN "
+        "INSERT INTO repository_search (repository_search, rowid, full_name) VALUES ('delete', old.id, old.full_name); "
+        "INSERT INTO repository_search (rowid, full_name) VALUES (new.id, new.full_name); END"
+    ))
+    conn.execute(text("INSERT INTO repository_search (repository_search) VALUES ('rebuild')"))
+
+
+def _has_repository_search(session: Session, engine: Engine) -> bool:
+    available = _repository_search_tables.get(engine)
+    if available is None:
+        available = session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'repository_search'"
+        )).first() is not None
+        _repository_search_tables[engine] = available
+    return available
+
+
+def repository_name_filter(session: Session, id_column, name_column, q: str):
+    """仓库名（full_name 包含 name）不区分大小写的子串匹配条件，走三元组索引"""
+    pattern = f"%{q}%"
+    bind = session.get_bind()
+    if _is_postgres(bind):
+        return name_column.ilike(pattern)
+    if not _has_repository_search(session, bind.engine):
+        # SQLite 的 LIKE 对 ASCII 字母不区分大小写，与三元组索引的匹配结果一致
+        return name_column.like(pattern)
+    return id_column.in_(
+        text("SELECT rowid FROM repository_search WHERE full_name LIKE :pattern")
+        .bindparams(pattern=pattern).columns(rowid=Integer)
+    )
+
+
+def drop_search_indexes(conn: Connection):
+    """删除全文索引表（基准测试清理用；SQLite 触发器随 repositories 表一起删除）"""
+    conn.execute(text("DROP TABLE IF EXISTS plugin_search"))
+    conn.execute(text("DROP TABLE IF EXISTS repository_search"))
+    _repository_search_tables.pop(conn.engine, None)
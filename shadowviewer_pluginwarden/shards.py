@@ -0,0 +1,218 @@
+"""商店目录静态分片。
+
+将内存目录（StoreCatalog）按 plugin_id 分桶切分为 JSON 分片写入 settings.shard_dir（为空时不生成）：
+
+    manifest.json                 目录修订号、总数、桶数与分片列表（固定文件名，客户端每次重新验证）
+    plugins/{sha256 前 16 位}.json  一个分片，格式与 /store/plugins 的游标分页响应相同，内容不变时文件名不变
+
+每个文件旁边另有预压缩的 .gz 与 .br（安装 brotli 时），前置代理可以直接发送文件，例如 nginx：
+
+    location /api/store/static/ { alias <shard_dir>/; gzip_static on; brotli_static on; }
+
+未配置代理时由 /store/static/{path} 按 Accept-Encoding 返回对应的文件。
+
+插件按 plugin_id 的 crc32 分到固定的桶中，每个桶一个分片（桶内按目录顺序，空桶不生成分片），
+桶数为不小于 总数 / shard_page_size 的 2 的幂。插件的新版本、可见性变化或新插件只改变它所在的分片，
+其余分片内容不变；只有总数越过 2 的幂时桶数翻倍（或减半），所有分片重新生成一次。
+分片之间不保持目录顺序，需要按目录顺序浏览时使用 /store/plugins。
+分片按内容寻址，目录变化后只压缩、写入内容变化的分片，其余沿用已有文件。
+当前与上一份 manifest 引用的分片都会保留，持有旧 manifest 的客户端仍能读完整个目录。
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Set
+
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from loguru import logger
+
+from catalog import store_catalog
+from config import settings
+from responses import fragment_body
+from revision import get_catalog_revision
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+router = APIRouter(prefix="/store/static", tags=["Store"])
+
+MANIFEST = "manifest.json"
+SHARDS = "plugins"
+_SHARD_RE = re.compile(r'^plugins/[0-9a-f]{16}\.json$')
+# (Accept-Encoding 中的编码, 文件后缀)，按优先级排列
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _write(path: Path, data: bytes):
+    """先写临时文件再替换，读者不会看到写了一半的文件"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _write_encoded(path: Path, data: bytes):
+    """写入文件及其预压缩版本；压缩文件先于原文件写入，原文件存在即表示各版本齐全"""
+    _write(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path.with_name(path.name + ".br"), brotli.compress(data, quality=11))
+    else:
+        # 之前安装过 brotli 时留下的 .br 已过期
+        path.with_name(path.name + ".br").unlink(missing_ok=True)
+    _write(path, data)
+
+
+def bucket_count(total: int, size: int) -> int:
+    """不小于 total / size 的 2 的幂（至少为 1）"""
+    buckets = 1
+    while buckets * size < total:
+        buckets *= 2
+    return buckets
+
+
+def shard_bucket(plugin_id: str, buckets: int) -> int:
+    """插件所在的桶；crc32 与进程无关，重启后分片边界不变"""
+    return zlib.crc32(plugin_id.encode("utf-8")) % buckets
+
+
+class ShardPublisher:
+    """在目录修订号变化后重新生成静态分片（由定时任务调用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = -1
+        # 上一份 manifest 引用的分片文件名，清理时保留
+        self._previous: Set[str] = set()
+
+    @property
+    def root(self) -> Path:
+        return Path(settings.shard_dir)
+
+    def _read_manifest_files(self) -> Set[str]:
+        try:
+            manifest = orjson.loads((self.root / MANIFEST).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return set()
+        return {shard["file"] for shard in manifest.get("shards", [])}
+
+    def publish(self, force: bool = False) -> Optional[dict]:
+        """目录修订号变化后重新生成分片与 manifest，返回写入 / 沿用的分片数；未变化时返回 None"""
+        if not settings.shard_dir:
+            return None
+        with self._lock:
+            # 先读修订号：生成期间目录再次变化时，下一次检查会重新生成
+            revision = get_catalog_revision()
+            if revision == self._revision and not force:
+                return None
+            entries = store_catalog.with_ids()
+            root, size = self.root, max(settings.shard_page_size, 1)
+            (root / SHARDS).mkdir(parents=True, exist_ok=True)
+            if self._revision < 0:
+                self._previous = self._read_manifest_files()
+
+            buckets = bucket_count(len(entries), size)
+            chunks = [[] for _ in range(buckets)]
+            # entries 按 Plugin.id 倒序，桶内保持目录顺序
+            for _, item, blob in entries:
+                chunks[shard_bucket(item.Id, buckets)].append(blob)
+            shards, written = [], 0
+            for bucket, chunk in enumerate(chunks):
+                if not chunk:
+                    continue
+                body = fragment_body({"limit": len(chunk), "next_cursor": None, "total": None}, chunk)
+                digest = hashlib.sha256(body).hexdigest()[:16]
+                name = f"{SHARDS}/{digest}.json"
+                if not (root / name).exists():
+                    _write_encoded(root / name, body)
+                    written += 1
+                shards.append({"file": name, "bucket": bucket, "count": len(chunk), "bytes": len(body)})
+
+            manifest = orjson.dumps({
+                "revision": revision,
+                "generated_at": datetime.now().isoformat(),
+                "page_size": size,
+                "total": len(entries),
+                "buckets": buckets,
+                "shards": shards,
+            })
+            _write_encoded(root / MANIFEST, manifest)
+
+            current = {shard["file"] for shard in shards}
+            removed = self._cleanup(current | self._previous)
+            self._previous = current
+            self._revision = revision
+        report = {"revision": revision, "shards": len(shards), "written": written,
+                  "reused": len(shards) - written, "removed": removed}
+        logger.info(f"Store shards published: {report}")
+        return report
+
+    def _cleanup(self, keep: Set[str]) -> int:
+        """删除不再被引用的分片及其压缩版本（含中断留下的临时文件）"""
+        removed = 0
+        for path in (self.root / SHARDS).iterdir():
+            name = path.name.split(".", 1)[0] + ".json"
+            if f"{SHARDS}/{name}" not in keep:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+def _accepted(request: Request) -> Set[str]:
+    """Accept-Encoding 中可接受的编码（忽略 q=0）"""
+    encodings = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        token, *params = [p.strip() for p in part.split(";")]
+        q = next((p[2:] for p in params if p.startswith("q=")), "1")
+        try:
+            if float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(token.lower())
+    return encodings
+
+
+@router.get("/{path:path}")
+async def get_store_shard(path: str, request: Request):
+    """
+    静态目录分片与 manifest：按 Accept-Encoding 返回预压缩的文件，分片内容不可变（长期缓存），manifest 每次重新验证
+    """
+    if not settings.shard_dir or (path != MANIFEST and not _SHARD_RE.match(path)):
+        raise HTTPException(status_code=404, detail="Not found")
+    file = Path(settings.shard_dir) / path
+    accepted = _accepted(request)
+    headers = {
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "public, no-cache" if path == MANIFEST else "public, max-age=31536000, immutable",
+    }
+    for encoding, suffix in ENCODINGS:
+        encoded = file.with_name(file.name + suffix)
+        if encoding in accepted and encoded.is_file():
+            file = encoded
+            headers["Content-Encoding"] = encoding
+            break
+    try:
+        stat = file.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    # 每个编码版本是不同的表示，ETag 各不相同
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers["ETag"] = etag
+    if etag in [c.strip().removeprefix("W/") for c in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file, media_type="application/json", headers=headers, stat_result=stat)
+
+
+shard_publisher = ShardPublisher()
+
+
+def publish_shards() -> Optional[dict]:
+    return shard_publisher.publish()
@@ -1,184 +1,225 @@
 from math import ceil
-from typing import List
-from fastapi import APIRouter, Query, Depends
-from pydantic import BaseModel, ConfigDict
+from typing import Dict, List, Optional, Tuple, Union
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import tuple_
+from catalog import latest_versions, plugin_to_model, store_catalog
+from config import settings
+from dependency_graph import dependency_graph
 from models import Plugin, Release, get_db
 
-from sqlalchemy import func, desc
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
-from res_model import PaginatedResponse, PluginModel
+from pagination import decode_cursor, encode_cursor
+from res_model import CursorPaginatedResponse, PaginatedResponse, PluginModel, PluginUpdateModel, PluginVersionResultModel, ResolveResultModel
+from responses import ORJSONResponse, fragment_page
+from revision import catalog_etag
+from search_index import count_plugin_matches, query_terms, search_plugin_pks
 
-router = APIRouter(prefix="/store", tags=["Store"])
+# 商店接口使用 orjson 序列化；分页列表直接拼接目录中预先序列化好的插件片段
+# 接口均为同步函数，由 FastAPI 放到线程池执行：目录 / 索引的刷新与数据库查询都是同步的，不能阻塞事件循环
+router = APIRouter(prefix="/store", tags=["Store"], default_response_class=ORJSONResponse)
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(',')]
+    return '*' in candidates or any(c.removeprefix('W/') == etag for c in candidates)
  
 
-@router.get("/plugins", response_model=PaginatedResponse[PluginModel], tags=["Store"])
-async def get_store_plugins(page: int = Query(1, ge=1), limit: int = Query(30, ge=1, le=200), db: Session = Depends(get_db)):
-    # 子查询：每个 plugin_id 的所有版本
-    all_versions_subq = (
-        db.query(
-            Plugin.plugin_id.label("plugin_id"),
-            func.group_concat(Plugin.version).label("versions")
-        ).join(
-            Plugin.release
-        ).filter(
-            Plugin.release.has(visible=True)
-        ).group_by(Plugin.plugin_id)
-        .subquery()
-    )
+@router.get("/plugins", response_model=Union[PaginatedResponse[PluginModel], CursorPaginatedResponse[PluginModel]], tags=["Store"])
+def get_store_plugins(
+    request: Request,
+    page: int = Query(1, ge=1),
+    limit: int = Query(30, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="游标分页：传入上一页返回的 next_cursor，传空字符串从第一页开始"),
+    include_total: bool = Query(False, description="游标分页时是否返回总数"),
+):
+    # 目录未变化时直接返回 304，不触发目录刷新或任何 SQL
+    etag = catalog_etag(request.url.path, sorted(request.query_params.multi_items()))
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"ETag": etag}
 
-    # 子查询：每个 plugin_id 的最新版本
-    latest_version_subq = (
-        db.query(
-            Plugin.plugin_id.label("plugin_id"),
-            func.max(Plugin.version).label("latest_version")
-        ).join(
-            Plugin.release
-        ).filter(
-            Plugin.release.has(visible=True)
-        ).group_by(Plugin.plugin_id)
-        .subquery()
-    )
+    # 字段顺序与 CursorPaginatedResponse / PaginatedResponse 一致
+    if cursor is not None:
+        items, next_id = store_catalog.page_after(decode_cursor(cursor), limit, fragments=True)
+        return fragment_page({
+            "limit": limit,
+            "next_cursor": encode_cursor(next_id) if next_id is not None else None,
+            "total": len(store_catalog.snapshot()) if include_total else None,
+        }, items, headers)
 
-    # 主查询：取最新版本，同时 join 所有版本
-    query = (
-        db.query(
-            Plugin,
-            all_versions_subq.c.versions
-        ).join(
-            latest_version_subq,
-            (Plugin.plugin_id == latest_version_subq.c.plugin_id)
-            & (Plugin.version == latest_version_subq.c.latest_version)
-        ).join(
-            all_versions_subq,
-            Plugin.plugin_id == all_versions_subq.c.plugin_id
-        ).join(Plugin.release).join(Plugin.repository).filter(
-            Plugin.release.has(visible=True) & Plugin.repository.has(watched=True)
-        ).order_by(desc(Plugin.id))
+    # 直接对内存目录切片；目录在发布入库、可见性或 watched 变更后才会刷新
+    plugins = store_catalog.snapshot(fragments=True)
+    total = len(plugins)
+    skip = (page - 1) * limit
+    pages = ceil(total / limit) if total else 1
+
+    return fragment_page(
+        {"total": total, "page": page, "limit": limit, "pages": pages},
+        plugins[skip:skip + limit],
+        headers,
     )
 
 
-    total = query.count()
+@router.get("/search", response_model=PaginatedResponse[PluginModel], tags=["Store"])
+def search_store_plugins(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，按空白分隔，每个词按前缀匹配名称、描述、作者和标签"),
+    page: int = Query(1, ge=1),
+    limit: int = Query(30, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    etag = catalog_etag(request.url.path, sorted(request.query_params.multi_items()))
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # 全文索引包含所有版本，SQL 中只保留目录中的最新可见版本并按相关度分页，总数单独计数；
+    # 条目取自内存目录中预先序列化的片段
+    terms = query_terms(q)
     skip = (page - 1) * limit
+    matches = search_plugin_pks(db, terms, limit=limit, offset=skip)
+    plugins = store_catalog.lookup((pk for pk, _ in matches), fragments=True)
+    total = count_plugin_matches(db, terms) if matches or skip else 0
     pages = ceil(total / limit) if total else 1
-    # 分页
-    plugins = query.offset(skip).limit(limit).all()
-
-    # 将查询结果 (Plugin, versions) 映射为 PluginModel
-    results: List[PluginModel] = []
-    for row in plugins:
-        # row 结构： (Plugin, versions)
-        plugin_obj: Plugin = row[0]
-        versions_concat = row[1]
-        versions_list = versions_concat.split(',') if versions_concat else []
-        # 依赖
-        dependencies = []
-        for d in (plugin_obj.dependencies or []):
-            dependencies.append({"Id": d.dep_id, "Need": d.need})
-
-        zip_url = None
-        try:
-            rel = plugin_obj.release
-            if rel and rel.assets:
-                for a in rel.assets:
-                    if a.name and a.name.lower().endswith('.sdow'):
-                        zip_url = a.browser_download_url
-                        break
-        except Exception:
-            zip_url = None
-        tags = [i.tag for i in plugin_obj.tags] if plugin_obj.tags else []
-        pm = PluginModel(
-            Id=plugin_obj.plugin_id,
-            Name=plugin_obj.name,
-            Version=plugin_obj.version,
-            Versions=versions_list,
-            Tags=tags,
-            BackgroundColor=plugin_obj.background_color,
-            Description=plugin_obj.description,
-            Authors=plugin_obj.authors,
-            WebUri=plugin_obj.web_uri,
-            Logo=plugin_obj.logo,
-            SdkVersion=plugin_obj.sdk_version,
-            Dependencies=dependencies,
-            DownloadUrl=zip_url,
-            LastUpdated=plugin_obj.updated_at.isoformat() if plugin_obj.updated_at else None,
-        )
-        results.append(pm)
-
-    return PaginatedResponse[PluginModel](
-        total=total,
-        pages=pages,
-        page=page,
-        limit=limit,
-        items=results
+
+    return fragment_page(
+        {"total": total, "page": page, "limit": limit, "pages": pages},
+        plugins,
+        {"ETag": etag},
     )
+
+
 class PluginVersionReqModel(BaseModel):
     plugin_id: str
     version: str
     model_config = ConfigDict(from_attributes=True)
 
-@router.post("/plugins/version",response_model=PluginModel, tags=["Store"])
-async def get_plugin_version( req: PluginVersionReqModel, db: Session = Depends(get_db)):
-    # 子查询：每个 plugin_id 的所有版本
-    all_versions_subq = (
-        db.query(
-            Plugin.plugin_id.label("plugin_id"),
-            func.group_concat(Plugin.version).label("versions")
-        ).join(
-            Plugin.release
-        ).filter(
-            Plugin.release.has(visible=True)
-        ).group_by(Plugin.plugin_id)
-        .subquery()
-    )
-    row = (
-        db.query(
-            Plugin,
-            all_versions_subq.c.versions
-        ).join(
-            all_versions_subq,
-            Plugin.plugin_id == all_versions_subq.c.plugin_id
-        ).filter(
-            Plugin.plugin_id == req.plugin_id,
-            Plugin.version == req.version
-        ).first()
-    )
-    plugin: Plugin = row[0]
-    versions_concat = row[1]
-    versions_list = versions_concat.split(',') if versions_concat else []
-    if not plugin:
-        return {"error": "Plugin not found"}
-
-    # 依赖
-    dependencies = []
-    for d in (plugin.dependencies or []):
-        dependencies.append({"Id": d.dep_id, "Need": d.need})
-
-    zip_url = None
-    try:
-        rel = plugin.release
-        if rel and rel.assets:
-            for a in rel.assets:
-                if a.name and a.name.lower().endswith('.sdow'):
-                    zip_url = a.browser_download_url
-                    break
-    except Exception:
-        zip_url = None
-    tags = [i.tag for i in plugin.tags] if plugin.tags else []
-    pm = PluginModel(
-        Id=plugin.plugin_id,
-        Name=plugin.name,
-        Version=plugin.version,
-        Versions=versions_list,
-        Tags=tags,
-        BackgroundColor=plugin.background_color,
-        Description=plugin.description,
-        Authors=plugin.authors,
-        WebUri=plugin.web_uri,
-        Logo=plugin.logo,
-        SdkVersion=plugin.sdk_version,
-        Dependencies=dependencies,
-        DownloadUrl=zip_url,
-        LastUpdated=plugin.updated_at.isoformat() if plugin.updated_at else None,
+class PluginVersionBatchReqModel(BaseModel):
+    items: List[PluginVersionReqModel] = Field(..., min_length=1)
+
+
+def lookup_plugin_versions(db: Session, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], PluginModel]:
+    """批量查询 (plugin_id, version) 对应的插件，返回 {(plugin_id, version): PluginModel}，未找到的不在结果中
+
+    查询次数与请求条数无关：一次按 (plugin_id, version) 元组匹配插件（依赖与标签各一次批量加载），
+    一次查询这些插件的所有可见版本。同一版本有多条记录时使用最后入库的一条。
+    """
+    if not pairs:
+        return {}
+    plugins: Dict[Tuple[str, str], Plugin] = {}
+    rows = (
+        db.query(Plugin)
+        .filter(tuple_(Plugin.plugin_id, Plugin.version).in_(pairs))
+        .options(selectinload(Plugin.dependencies), selectinload(Plugin.tags))
+        .order_by(Plugin.id)
     )
-    return pm
\ No newline at end of file
+    for plugin in rows:
+        plugins[(plugin.plugin_id, plugin.version)] = plugin
+    if not plugins:
+        return {}
+
+    # 这些插件的所有可见版本，按版本键升序（走 (plugin_id, version_key) 索引）
+    versions: Dict[str, List[str]] = {}
+    rows = db.query(Plugin.plugin_id, Plugin.version).join(Plugin.release).filter(
+        Plugin.plugin_id.in_({plugin_id for plugin_id, _ in plugins}), Release.visible == True, Plugin.version.isnot(None)
+    ).order_by(Plugin.plugin_id, Plugin.version_key.asc().nullsfirst(), Plugin.id)
+    for plugin_id, version in rows:
+        versions.setdefault(plugin_id, []).append(version)
+    return {key: plugin_to_model(plugin, versions.get(key[0], [])) for key, plugin in plugins.items()}
+
+
+@router.post("/plugins/version",response_model=PluginModel, tags=["Store"])
+def get_plugin_version(req: PluginVersionReqModel, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag = catalog_etag(request.url.path, req.plugin_id, req.version)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    plugin = lookup_plugin_versions(db, [(req.plugin_id, req.version)]).get((req.plugin_id, req.version))
+    if plugin is None:
+        raise HTTPException(status_code=404, detail="Plugin not found")
+    response.headers["ETag"] = etag
+    return plugin
+
+
+@router.post("/plugins/versions", response_model=List[PluginVersionResultModel], tags=["Store"])
+def get_plugin_versions(req: PluginVersionBatchReqModel, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    批量查询插件版本（例如客户端恢复已安装的插件），按请求顺序逐条返回，未找到的条目 found 为 false。
+    每次最多 store_batch_max_items 条。
+    """
+    if len(req.items) > settings.store_batch_max_items:
+        raise HTTPException(status_code=422, detail=f"At most {settings.store_batch_max_items} items per request")
+    pairs = [(item.plugin_id, item.version) for item in req.items]
+    etag = catalog_etag(request.url.path, *pairs)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    found = lookup_plugin_versions(db, list(dict.fromkeys(pairs)))
+    return [
+        PluginVersionResultModel(plugin_id=plugin_id, version=version, found=(plugin_id, version) in found,
+                                 plugin=found.get((plugin_id, version)))
+        for plugin_id, version in pairs
+    ]
+
+
+@router.get("/resolve", response_model=ResolveResultModel, tags=["Store"])
+def resolve_plugin_dependencies(
+    request: Request,
+    response: Response,
+    plugin_id: str = Query(..., min_length=1, max_length=255),
+    version: Optional[str] = Query(None, max_length=100, description="插件版本，为空时取最新可见版本"),
+):
+    """
+    解析插件的传递依赖：每个依赖选择满足所有 Need 约束的最高可见版本，按安装顺序返回，并报告依赖环与冲突。
+    由内存中的依赖图提供，不查询数据库（依赖图在入库后按修订号增量刷新）。
+    """
+    etag = catalog_etag(request.url.path, plugin_id, version)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    result = dependency_graph.resolve(plugin_id, version)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Plugin not found")
+    response.headers["ETag"] = etag
+    return result
+
+
+class PluginUpdatesReqModel(BaseModel):
+    # 已安装的插件 {Id: Version}
+    Installed: Dict[str, str]
+    # 客户端的 SDK 版本，只返回 SdkVersion 不高于它的版本
+    SdkVersion: Optional[str] = None
+
+
+@router.post("/updates", response_model=List[PluginUpdateModel], tags=["Store"])
+def get_plugin_updates(req: PluginUpdatesReqModel, request: Request, response: Response):
+    """
+    检查更新：返回已安装插件中有更新的兼容可见版本的插件（每个插件取最高版本），没有更新的插件不返回。
+    由内存中的版本索引回答，不访问数据库；每次最多 store_batch_max_items 个插件。
+    """
+    if len(req.Installed) > settings.store_batch_max_items:
+        raise HTTPException(status_code=422, detail=f"At most {settings.store_batch_max_items} plugins per request")
+    etag = catalog_etag(request.url.path, sorted(req.Installed.items()), req.SdkVersion)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    updates = []
+    for plugin_id, installed in req.Installed.items():
+        entry = latest_versions.latest(plugin_id, installed, req.SdkVersion)
+        if entry is not None:
+            updates.append(PluginUpdateModel(
+                Id=plugin_id,
+                Name=entry.name,
+                InstalledVersion=installed,
+                Version=entry.version,
+                SdkVersion=entry.sdk_version,
+                DownloadUrl=entry.download_url,
+            ))
+    return updates
@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from pathlib import Path
+
+import pytest
+
+# 模块按扁平结构导入（与 uvicorn app:app 相同）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 测试会清空、改写表中的数据：总是使用临时 SQLite 数据库，忽略环境中已有的 DATABASE_URL
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'test.sqlite'}"
+for name, value in {
+    "APP_INSTALLATION_ID": "1",
+    "APP_PRIVATE_KEY": "test",
+    "REPO_NAME": "owner/index",
+    "BASE_BRANCH": "main",
+    "APP_ID": "1",
+    "APP_CLIENT_ID": "test",
+    "APP_CLIENT_SECRETS": "test",
+    "APP_REDIRECT_URI": "http://localhost/callback",
+    "WEBHOOK_TOKEN": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+_ids = count(1000)
+
+
+def next_id() -> int:
+    """测试共用同一个数据库，各测试的仓库 / release / asset 使用不重复的 id"""
+    return next(_ids)
+
+
+class PluginFiles:
+    """本地 HTTP 服务，提供 release 中的 plugin.json（与 bench._serve_files 相同），记录每次下载的路径"""
+
+    def __init__(self):
+        self.files = {}
+        self.downloads = []
+        files, downloads = self.files, self.downloads
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                downloads.append(self.path)
+                body = files.get(self.path, "").encode("utf-8")
+                self.send_response(200 if self.path in files else 404)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def release(self, repo: str, tag: str, plugin_id: str, version: str, release_id: int = None, **plugin) -> dict:
+        """生成 GitHub release webhook 中的 release 数据，plugin.json 由本地服务提供"""
+        release_id = release_id or next_id()
+        path = f"/{repo}/{tag}/plugin.json"
+        self.files[path] = json.dumps({
+            "Id": plugin_id, "Name": plugin_id.title(), "Version": version, "SdkVersion": "1.0.0",
+            "Description": f"{plugin_id} plugin", "Authors": "tester",
+            "PluginStore": {"Tags": ["test"], "BackgroundColor": "#fff"},
+            **plugin,
+        })
+        user = {"id": 1, "login": "tester", "avatar_url": "a", "html_url": "h", "type": "User"}
+
+        def asset(name, content_type, url, size):
+            return {"id": next_id(), "name": name, "browser_download_url": url, "content_type": content_type,
+                    "state": "uploaded", "size": size, "download_count": 0, "uploader": user,
+                    "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z"}
+
+        return {
+            "id": release_id, "tag_name": tag, "name": tag, "body": "", "draft": False, "prerelease": False,
+            "created_at": "2024-01-01T00:00:00Z", "published_at": "2024-01-02T00:00:00Z",
+            "html_url": "h", "tarball_url": "t", "zipball_url": "z", "author": user,
+            "assets": [
+                asset("plugin.json", "application/json", self.base_url + path, len(self.files[path])),
+                asset(f"{plugin_id}.sdow", "application/zip", f"https://example.com/{repo}/{tag}/{plugin_id}.sdow", 1000),
+            ],
+        }
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def plugin_files():
+    files = PluginFiles()
+    yield files
+    files.close()
+
+
+@pytest.fixture
+def repository():
+    """创建一个已安装的仓库，返回其 full_name"""
+    from models import Repository, get_session
+
+    def create(watched: bool = True) -> str:
+        repo_id = next_id()
+        full_name = f"owner/repo{repo_id}"
+        with get_session() as session:
+            session.add(Repository(id=repo_id, name=f"repo{repo_id}", full_name=full_name, installed=True, watched=watched))
+            session.commit()
+        return full_name
+
+    return create
@@ -0,0 +1,124 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import auth
+from auth import CurrentUser, get_current_user
+from config import settings
+from conftest import next_id
+from models import Author, get_or_create_author, get_session
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    monkeypatch.setattr(settings, "auth_cache_ttl", 60.0)
+    auth._token_cache.clear()
+    yield clock
+    auth._token_cache.clear()
+
+
+@pytest.fixture
+def author():
+    """已登录（持久化了 token）的普通作者，返回 (GitHub 用户信息, token)"""
+    user_id = next_id()
+    user = {"id": user_id, "login": f"user{user_id}", "avatar_url": "a", "html_url": "h", "type": "User"}
+    token = f"gho_{user_id}"
+    with get_session() as session:
+        get_or_create_author(session, user, access_token=token)
+        session.commit()
+    return user, token
+
+
+def _request(token: str) -> Request:
+    return Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def _set_admin(author_id: int, is_admin: bool):
+    with get_session() as session:
+        session.get(Author, author_id).is_admin = is_admin
+        session.commit()
+
+
+def _login(monkeypatch, user: dict, token: str):
+    """模拟 GitHub OAuth 回调"""
+    class _Response:
+        status_code = 200
+
+        def __init__(self, data):
+            self.data = data
+
+        def json(self):
+            return self.data
+
+    monkeypatch.setattr(auth.requests, "post", lambda *a, **kw: _Response({"access_token": token, "scope": "read:user"}))
+    monkeypatch.setattr(auth.requests, "get", lambda *a, **kw: _Response(user))
+    import app
+    response = TestClient(app.app).get("/api/auth/callback", params={"code": "c"}, follow_redirects=False)
+    assert response.status_code == 307
+
+
+def test_cache_holds_snapshot_without_token(clock, author):
+    user, token = author
+    current = get_current_user(_request(token))
+    assert current == CurrentUser(user["id"], user["login"], "a", "h", "User", False)
+    (_, cached), = auth._token_cache.values()
+    assert cached is current and token not in repr(auth._token_cache)
+
+
+def test_unknown_token_rejected(clock, author):
+    with pytest.raises(HTTPException) as e:
+        get_current_user(_request("gho_unknown"))
+    assert e.value.status_code == 401
+
+
+def test_ttl_expiry(clock, author):
+    user, token = author
+    assert not get_current_user(_request(token)).is_admin
+    _set_admin(user["id"], True)
+    # TTL 内使用缓存，过期后重新查库
+    clock.now += 59
+    assert not get_current_user(_request(token)).is_admin
+    clock.now += 2
+    assert get_current_user(_request(token)).is_admin
+
+
+def test_login_invalidates(clock, author, monkeypatch):
+    user, token = author
+    assert not get_current_user(_request(token)).is_admin
+    monkeypatch.setattr(settings, "admin_github_logins", user["login"])
+    new_token = token + "n"
+    _login(monkeypatch, user, new_token)
+    # 重新登录后旧 token 不再被缓存接受，新 token 立即带上管理员标记
+    with pytest.raises(HTTPException):
+        get_current_user(_request(token))
+    assert get_current_user(_request(new_token)).is_admin
+
+
+def test_logout_invalidates(clock, author):
+    user, token = author
+    assert not get_current_user(_request(token)).is_admin
+    _set_admin(user["id"], True)
+    import app
+    client = TestClient(app.app)
+    client.cookies.set("access_token", token)
+    client.get("/api/auth/logout", follow_redirects=False)
+    assert not auth._token_cache
+    assert get_current_user(_request(token)).is_admin
+
+
+def test_me_serializes_snapshot(clock, author):
+    user, token = author
+    import app
+    response = TestClient(app.app).get("/api/authors/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == {"id": user["id"], "login": user["login"], "avatar_url": "a", "html_url": "h", "type": "User"}
@@ -0,0 +1,103 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import catalog
+import revision
+from auth import CurrentUser, get_current_user
+from catalog import StoreCatalog, load_latest_plugins
+from models import Plugin, Release, Repository, get_session, save_releases_to_db
+from revision import bump_catalog_revision, catalog_changes
+
+
+@pytest.fixture
+def client():
+    import app
+    app.app.dependency_overrides[get_current_user] = lambda: CurrentUser(1, "admin", None, None, "User", True)
+    yield TestClient(app.app)
+    app.app.dependency_overrides.pop(get_current_user)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """记录目录刷新时 load_latest_plugins 的 plugin_ids 参数（None 表示全量加载）"""
+    calls = []
+
+    def load(session, plugin_ids=None):
+        calls.append(None if plugin_ids is None else set(plugin_ids))
+        return load_latest_plugins(session, plugin_ids)
+
+    monkeypatch.setattr(catalog, "load_latest_plugins", load)
+    return calls
+
+
+@pytest.fixture
+def store(plugin_files, repository, loads):
+    """已加载的目录，以及一个带两个插件的仓库"""
+    repo = repository()
+    save_releases_to_db("release", "published", repo, [
+        plugin_files.release(repo, "a1", f"{repo}/a", "1.0"),
+        plugin_files.release(repo, "a2", f"{repo}/a", "2.0"),
+        plugin_files.release(repo, "b1", f"{repo}/b", "1.0"),
+    ])
+    store_catalog = StoreCatalog()
+    store_catalog.snapshot()
+    del loads[:]
+    return store_catalog, repo
+
+
+def _assert_matches_full_reload(store_catalog: StoreCatalog):
+    entries = [(pk, model) for pk, model, _ in store_catalog.with_ids()]
+    with get_session() as session:
+        full = load_latest_plugins(session)
+    assert entries == sorted(full.values(), key=lambda e: e[0], reverse=True)
+    assert store_catalog.revision == revision.get_catalog_revision()
+
+
+def _latest(store_catalog: StoreCatalog, plugin_id: str):
+    return next((model for _, model, _ in store_catalog.with_ids() if model.Id == plugin_id), None)
+
+
+def test_hidden_release_refreshes_incrementally(store, client, loads):
+    store_catalog, repo = store
+    with get_session() as session:
+        release_id = session.query(Release.id).join(Plugin, Plugin.release_id == Release.id).filter(
+            Plugin.plugin_id == f"{repo}/a", Plugin.version == "2.0").scalar()
+    assert client.patch(f"/api/releases/{release_id}/visible", json={"visible": False}).status_code == 200
+
+    assert _latest(store_catalog, f"{repo}/a").Version == "1.0"
+    assert loads == [{f"{repo}/a"}]
+    _assert_matches_full_reload(store_catalog)
+
+
+def test_new_version_refreshes_incrementally(store, plugin_files, loads):
+    store_catalog, repo = store
+    save_releases_to_db("release", "published", repo, [plugin_files.release(repo, "b2", f"{repo}/b", "1.1")])
+
+    entry = _latest(store_catalog, f"{repo}/b")
+    assert (entry.Version, entry.Versions) == ("1.1", ["1.0", "1.1"])
+    assert loads == [{f"{repo}/b"}]
+    _assert_matches_full_reload(store_catalog)
+
+
+def test_unwatched_repository_refreshes_incrementally(store, client, loads):
+    store_catalog, repo = store
+    with get_session() as session:
+        repo_id = session.query(Repository.id).filter(Repository.full_name == repo).scalar()
+    assert client.patch(f"/api/repositories/{repo_id}/watched", json={"watched": False}).status_code == 200
+
+    assert _latest(store_catalog, f"{repo}/a") is None and _latest(store_catalog, f"{repo}/b") is None
+    assert loads == [{f"{repo}/a", f"{repo}/b"}]
+    _assert_matches_full_reload(store_catalog)
+
+
+def test_truncated_change_log_rebuilds(store, plugin_files, loads):
+    store_catalog, repo = store
+    save_releases_to_db("release", "published", repo, [plugin_files.release(repo, "a3", f"{repo}/a", "3.0")])
+    latest = bump_catalog_revision([f"{repo}/b"])
+    # 目录之后的第一条变更记录已被清理，变更记录不再连续
+    with revision._engine.begin() as conn:
+        conn.execute(catalog_changes.delete().where(catalog_changes.c.id < latest))
+
+    assert _latest(store_catalog, f"{repo}/a").Version == "3.0"
+    assert loads == [None]
+    _assert_matches_full_reload(store_catalog)
@@ -0,0 +1,114 @@
+from dependency_graph import DependencyNode, _resolve
+from versions import version_key
+
+
+def _graph(*plugins):
+    """plugins: (plugin_id, version, {dep_id: need})，同一插件的版本按版本键升序排列"""
+    nodes = {}
+    for pk, (plugin_id, version, deps) in enumerate(plugins, start=1):
+        nodes.setdefault(plugin_id, []).append(DependencyNode(
+            pk, plugin_id, version, version_key(version), f"https://example.com/{plugin_id}-{version}.sdow",
+            tuple(deps.items()),
+        ))
+    for versions in nodes.values():
+        versions.sort(key=lambda n: n.key)
+    return nodes
+
+
+def _resolved(nodes, plugin_id):
+    return _resolve(nodes, nodes[plugin_id][-1])
+
+
+def _installed(result):
+    return [(p["Id"], p["Version"]) for p in result["Plugins"]]
+
+
+def test_install_order_and_highest_versions():
+    nodes = _graph(
+        ("app", "1.0", {"ui": ">=1.0", "core": "^1.0"}),
+        ("ui", "1.0", {"core": ">=1.1"}),
+        ("ui", "1.2", {"core": ">=1.1"}),
+        ("core", "1.0", {}),
+        ("core", "1.4", {}),
+        ("core", "2.0", {}),
+    )
+    result = _resolved(nodes, "app")
+    assert result["Resolved"] and not result["Cycles"] and not result["Conflicts"]
+    assert _installed(result) == [("core", "1.4"), ("ui", "1.2"), ("app", "1.0")]
+    core = result["Plugins"][0]
+    # 先经由 ui 到达 core，深度取第一次到达时的深度
+    assert core["Depth"] == 2 and core["RequiredBy"] == ["ui@1.2", "app@1.0"]
+
+
+def test_restart_pins_constraints_learned_later():
+    # 先按 app 的约束选了 lib 2.0，之后 ui 要求 <2.0：带着全部约束重新遍历，改选 lib 1.5
+    nodes = _graph(
+        ("app", "1.0", {"lib": "*", "ui": "*"}),
+        ("ui", "1.0", {"lib": "<2.0"}),
+        ("lib", "1.0", {}),
+        ("lib", "1.5", {}),
+        ("lib", "2.0", {}),
+    )
+    result = _resolved(nodes, "app")
+    assert result["Resolved"]
+    assert _installed(result) == [("lib", "1.5"), ("ui", "1.0"), ("app", "1.0")]
+
+
+def test_unsatisfiable_constraints_are_conflicts():
+    nodes = _graph(
+        ("app", "1.0", {"lib": ">=2.0", "ui": "*"}),
+        ("ui", "1.0", {"lib": "<2.0"}),
+        ("lib", "1.0", {}),
+        ("lib", "2.0", {}),
+    )
+    result = _resolved(nodes, "app")
+    assert not result["Resolved"]
+    assert [(c["Id"], c["Need"], c["RequiredBy"], c["Reason"]) for c in result["Conflicts"]] == [
+        ("lib", "<2.0", "ui@1.0", "unsatisfied"),
+    ]
+    assert result["Conflicts"][0]["Available"] == ["1.0", "2.0"]
+
+
+def test_missing_and_invalid_dependencies():
+    nodes = _graph(
+        ("app", "1.0", {"ghost": ">=1.0", "lib": "latest", "old": ">=5.0"}),
+        ("lib", "1.0", {}),
+        ("old", "1.0", {}),
+    )
+    result = _resolved(nodes, "app")
+    assert not result["Resolved"]
+    assert {c["Id"]: c["Reason"] for c in result["Conflicts"]} == {
+        "ghost": "missing", "lib": "invalid", "old": "unsatisfied",
+    }
+    assert _installed(result) == [("app", "1.0")]
+
+
+def test_cycles_are_reported_without_looping():
+    nodes = _graph(
+        ("a", "1.0", {"b": "*"}),
+        ("b", "1.0", {"c": "*"}),
+        ("c", "1.0", {"a": ">=1.0"}),
+    )
+    result = _resolved(nodes, "a")
+    assert result["Resolved"]
+    assert result["Cycles"] == [["a", "b", "c", "a"]]
+    assert _installed(result) == [("c", "1.0"), ("b", "1.0"), ("a", "1.0")]
+
+
+def test_root_version_cannot_be_replaced():
+    # 依赖要求根插件的其他版本时不重新选择根插件，记为冲突
+    nodes = _graph(
+        ("a", "1.0", {"b": "*"}),
+        ("a", "2.0", {"b": "*"}),
+        ("b", "1.0", {"a": "<2.0"}),
+    )
+    result = _resolved(nodes, "a")
+    assert [(c["Id"], c["Reason"]) for c in result["Conflicts"]] == [("a", "unsatisfied")]
+
+
+def test_deep_chain_does_not_hit_recursion_limit():
+    size = 5000
+    nodes = _graph(*((f"p{i}", "1.0", {f"p{i + 1}": ">= 1.0"} if i + 1 < size else {}) for i in range(size)))
+    result = _resolved(nodes, "p0")
+    assert result["Resolved"] and len(result["Plugins"]) == size
+    assert result["Plugins"][0]["Id"] == f"p{size - 1}" and result["Plugins"][0]["Depth"] == size - 1
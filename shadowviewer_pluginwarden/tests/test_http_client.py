@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+
+from config import settings
+from http_client import HttpClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "http_retries", 2)
+    monkeypatch.setattr(settings, "http_retry_backoff", 0.0)
+    routes = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        route = routes[request.url.path]
+        return route(request) if callable(route) else route.pop(0)
+
+    instance = HttpClient()
+
+    async def open_with_mock():
+        instance._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        instance._semaphore = asyncio.Semaphore(settings.http_max_concurrency)
+
+    instance._open = open_with_mock
+    instance.routes = routes
+    yield instance
+    instance.close()
+
+
+def test_retries_retryable_status(client):
+    client.routes["/flaky"] = [httpx.Response(503), httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, text="ok")]
+    response = client.get("http://github.test/flaky")
+    assert response.status_code == 200 and response.text == "ok"
+    assert client.routes["/flaky"] == []
+
+
+def test_gives_up_after_retries(client):
+    client.routes["/down"] = [httpx.Response(502) for _ in range(settings.http_retries + 1)]
+    assert client.get("http://github.test/down").status_code == 502
+    assert client.routes["/down"] == []
+
+
+def test_client_errors_are_not_retried(client):
+    client.routes["/missing"] = [httpx.Response(404), httpx.Response(200)]
+    assert client.get("http://github.test/missing").status_code == 404
+    assert len(client.routes["/missing"]) == 1
+
+
+def test_transport_errors_are_retried(client):
+    attempts = []
+
+    def unstable(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200)
+
+    client.routes["/unstable"] = unstable
+    assert client.get("http://github.test/unstable").status_code == 200
+    assert len(attempts) == 2
+
+
+def test_get_many_keeps_order_and_returns_exceptions(client):
+    def broken(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    client.routes["/a"] = lambda request: httpx.Response(200, text="a")
+    client.routes["/b"] = lambda request: httpx.Response(200, text="b")
+    client.routes["/broken"] = broken
+    responses = client.get_many(["http://github.test/b", "http://github.test/broken", "http://github.test/a"])
+    assert responses[0].text == "b" and responses[2].text == "a"
+    assert isinstance(responses[1], httpx.ConnectError)
+    assert client.get_many([]) == []
+
+
+def test_async_callers_share_the_client(client):
+    client.routes["/async"] = lambda request: httpx.Response(200, text=request.method)
+
+    async def run():
+        return await asyncio.gather(*(client.arequest("HEAD", "http://github.test/async") for _ in range(5)))
+
+    assert [r.text for r in asyncio.run(run())] == ["HEAD"] * 5
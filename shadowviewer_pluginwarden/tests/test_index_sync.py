@@ -0,0 +1,236 @@
+import base64
+import hashlib
+import json
+
+import pytest
+
+import index_sync as index_sync_module
+from config import settings
+from index_sync import INDEX_PATH, IndexSync, IndexSyncError, PluginUpdate, git_blob_sha
+from models import IndexSyncUpdate, get_session
+
+
+class _Response:
+    def __init__(self, status_code: int, body=None, content: bytes = b""):
+        self.status_code = status_code
+        self._body = body
+        self.content = content
+        self.text = json.dumps(body) if body is not None else ""
+
+    def json(self):
+        return self._body
+
+
+class StubGitHub:
+    """内存中的 Git Data API：只实现 IndexSync 用到的接口，PATCH 只接受快进更新"""
+
+    def __init__(self, branch: str):
+        self.branch = branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.files = {}
+        self.calls = []
+        # 每次 PATCH 之前调用，用于模拟其他提交先落地
+        self.before_patch = None
+        self.head = self._commit(self._tree({}), [], "init")
+
+    def _tree(self, entries: dict) -> str:
+        sha = hashlib.sha1(json.dumps(sorted(entries.items())).encode()).hexdigest()
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def _commit(self, tree: str, parents: list, message: str) -> str:
+        sha = hashlib.sha1(f"{tree}{parents}{message}{len(self.commits)}".encode()).hexdigest()
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def _blob(self, data: bytes) -> str:
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def push(self, path: str, data: bytes, message: str = "external"):
+        """直接在分支上提交一个文件（其他人的提交）"""
+        entries = dict(self.trees[self.commits[self.head]["tree"]])
+        entries[path] = self._blob(data)
+        self.head = self._commit(self._tree(entries), [self.head], message)
+
+    def read(self, path: str) -> bytes:
+        return self.blobs[self.trees[self.commits[self.head]["tree"]][path]]
+
+    def request(self, method, url, headers=None, json=None):
+        path = url.split(f"/repos/{settings.repo_name}/", 1)[1]
+        self.calls.append((method, path))
+        if method == "GET" and path == f"git/ref/heads/{self.branch}":
+            return _Response(200, {"object": {"sha": self.head}})
+        if method == "GET" and path.startswith("git/commits/"):
+            return _Response(200, {"tree": {"sha": self.commits[path.rsplit("/", 1)[1]]["tree"]}})
+        if method == "GET" and path.startswith("git/trees/"):
+            entries = self.trees[path.rsplit("/", 1)[1]]
+            return _Response(200, {"tree": [{"path": p, "sha": s} for p, s in entries.items()]})
+        if method == "GET" and path.startswith("git/blobs/"):
+            data = self.blobs[path.rsplit("/", 1)[1]]
+            return _Response(200, {"content": base64.b64encode(data).decode()})
+        if method == "POST" and path == "git/blobs":
+            return _Response(201, {"sha": self._blob(base64.b64decode(json["content"]))})
+        if method == "POST" and path == "git/trees":
+            entries = dict(self.trees[json["base_tree"]])
+            for entry in json["tree"]:
+                entries[entry["path"]] = entry["sha"] if "sha" in entry else self._blob(entry["content"].encode())
+            return _Response(201, {"sha": self._tree(entries)})
+        if method == "POST" and path == "git/commits":
+            return _Response(201, {"sha": self._commit(json["tree"], json["parents"], json["message"])})
+        if method == "PATCH" and path == f"git/refs/heads/{self.branch}":
+            if self.before_patch:
+                self.before_patch()
+            if self.commits[json["sha"]]["parents"] != [self.head]:
+                return _Response(422, {"message": "Update is not a fast forward"})
+            self.head = json["sha"]
+            return _Response(200, {"object": {"sha": self.head}})
+        return _Response(404, {"message": "Not Found"})
+
+    def get_many(self, urls, **kwargs):
+        return [_Response(200, content=self.files[url]) if url in self.files else _Response(404) for url in urls]
+
+
+@pytest.fixture
+def github(monkeypatch):
+    monkeypatch.setattr(settings, "index_sync_window", 3600.0)
+    monkeypatch.setattr(settings, "index_sync_retries", 2)
+    stub = StubGitHub(settings.base_branch)
+    monkeypatch.setattr(index_sync_module, "http_client", stub)
+    with get_session() as session:
+        session.query(IndexSyncUpdate).delete()
+        session.commit()
+    return stub
+
+
+@pytest.fixture
+def sync(github):
+    instance = IndexSync()
+    yield instance
+    # 不等待窗口结束，也不在测试结束后同步
+    with instance._lock:
+        if instance._timer is not None:
+            instance._timer.cancel()
+
+
+def _index(github) -> dict:
+    return {p["Id"]: p for p in json.loads(github.read(INDEX_PATH))}
+
+
+def _stored() -> dict:
+    with get_session() as session:
+        return {row.plugin_id: json.loads(row.plugin_json) for row in session.query(IndexSyncUpdate)}
+
+
+def test_window_is_committed_once(github, sync):
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.1"}))
+    sync.enqueue(PluginUpdate({"Id": "beta", "Version": "2.0"}))
+
+    sha = sync.flush()
+    assert sha == github.head
+    assert {k: v["Version"] for k, v in _index(github).items()} == {"alpha": "1.1", "beta": "2.0"}
+    assert github.commits[sha]["message"].startswith("Sync 2 plugins")
+    assert [m for m, p in github.calls if m == "PATCH"] == ["PATCH"]
+    assert sync.stats()["coalesced"] == 1 and sync.stats()["pending"] == 0
+    assert sync.flush() is None
+
+
+def test_rebuilds_on_moved_branch(github, sync):
+    github.push(INDEX_PATH, json.dumps([{"Id": "beta", "Version": "1.0"}]).encode())
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+
+    # 第一次 PATCH 之前其他人提交了 gamma：第一次 422，第二次基于新的分支头重新生成
+    def concurrent_commit():
+        github.before_patch = None
+        index = json.loads(github.read(INDEX_PATH)) + [{"Id": "gamma", "Version": "1.0"}]
+        github.push(INDEX_PATH, json.dumps(index).encode())
+    github.before_patch = concurrent_commit
+    moved_from = github.head
+
+    sha = sync.flush()
+    assert set(_index(github)) == {"alpha", "beta", "gamma"}
+    parent = github.commits[sha]["parents"][0]
+    assert parent != moved_from and github.commits[parent]["parents"] == [moved_from]
+    assert sync.stats()["retries"] == 1 and sync.stats()["commits"] == 1
+
+
+def test_gives_up_and_keeps_updates(github, sync):
+    github.before_patch = lambda: github.push("other.txt", str(len(github.commits)).encode())
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+
+    with pytest.raises(IndexSyncError):
+        sync.flush()
+    assert [m for m, _ in github.calls].count("PATCH") == settings.index_sync_retries + 1
+    # 放回队列并保留在表中，等待下一次同步
+    assert sync.stats()["pending"] == 1 and sync.stats()["failures"] == 1
+    assert set(_stored()) == {"alpha"}
+
+    github.before_patch = None
+    sync.flush()
+    assert set(_index(github)) == {"alpha"} and _stored() == {}
+
+
+def test_pending_updates_survive_restart(github, sync):
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}, "alpha/logo.png", "https://example.com/logo.png"))
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.1"}, "alpha/logo.png", "https://example.com/logo.png"))
+    assert _stored() == {"alpha": {"Id": "alpha", "Version": "1.1"}}
+
+    restarted = IndexSync()
+    try:
+        assert restarted.load() == 1
+        github.files["https://example.com/logo.png"] = b"PNG"
+        restarted.flush()
+    finally:
+        with restarted._lock:
+            restarted._timer.cancel()
+    alpha = _index(github)["alpha"]
+    assert alpha["Version"] == "1.1" and alpha["Logo"].endswith("/alpha/logo.png")
+    assert github.read("alpha/logo.png") == b"PNG"
+    assert _stored() == {}
+
+
+def test_update_during_sync_is_kept(github, sync):
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+    # 同步进行中同一插件再次加入队列：成功后只删除已提交的那一条
+    github.before_patch = lambda: sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.1"}))
+
+    sync.flush()
+    assert _index(github)["alpha"]["Version"] == "1.0"
+    assert _stored() == {"alpha": {"Id": "alpha", "Version": "1.1"}}
+    assert sync.stats()["pending"] == 1
+
+
+def test_unchanged_index_makes_no_commit(github, sync):
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+    head = sync.flush()
+    sync.enqueue(PluginUpdate({"Id": "alpha", "Version": "1.0"}))
+    assert sync.flush() == head == github.head
+
+
+@pytest.mark.parametrize("enabled, action, queued", [
+    (True, "released", True),
+    (True, "published", False),
+    (False, "released", False),
+])
+def test_released_webhook_queues_index_update(plugin_files, repository, monkeypatch, enabled, action, queued):
+    import github_utils
+
+    monkeypatch.setattr(settings, "index_sync_enabled", enabled)
+    updates = []
+    monkeypatch.setattr(github_utils.index_sync, "enqueue", updates.append)
+    repo = repository()
+    release = plugin_files.release(repo, "v1", f"{repo}/indexed", "1.0")
+    release["assets"].append({**release["assets"][1], "id": 1, "name": "logo.png", "content_type": "image/png"})
+
+    assert github_utils.webhook_release({"action": action, "repository": {"full_name": repo}, "release": release}, "release") == "success"
+    if not queued:
+        assert updates == []
+        return
+    update, = updates
+    assert (update.plugin_json["Id"], update.plugin_json["Version"]) == (f"{repo}/indexed", "1.0")
+    assert [a["name"] for a in update.plugin_json["Assets"]] == [f"{repo}/indexed.sdow"]
+    assert (update.logo_path, update.logo_url) == (f"{repo}/indexed/logo.png", release["assets"][2]["browser_download_url"])
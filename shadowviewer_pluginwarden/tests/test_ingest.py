@@ -0,0 +1,127 @@
+import copy
+
+import pytest
+from sqlalchemy import event
+
+import models
+import plugin_cache
+from models import Asset, Dependency, Plugin, PluginTag, Release, get_session, save_releases_to_db
+
+
+@pytest.fixture
+def statements():
+    """记录入库期间执行的 SQL：(语句首行, 参数组数)"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement.split("\n")[0], len(parameters) if executemany else 1))
+
+    event.listen(models.engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(models.engine, "before_cursor_execute", record)
+
+
+@pytest.fixture(autouse=True)
+def empty_plugin_cache():
+    # 内存中的 plugin.json 缓存会掩盖数据库中保存的内容，每个测试从空缓存开始
+    plugin_cache.clear()
+    yield
+    plugin_cache.clear()
+
+
+def _writes(statements, table: str):
+    return [(sql, rows) for sql, rows in statements if sql.startswith((f"UPDATE {table} ", f"INSERT INTO {table} ", f"DELETE FROM {table} "))]
+
+
+def _release(session, github_id: int) -> Release:
+    return session.query(Release).filter(Release.github_id == github_id).one()
+
+
+def test_tag_rename_updates_release_by_github_id(plugin_files, repository, statements):
+    repo = repository()
+    first = plugin_files.release(repo, "v1", f"{repo}/renamed", "1.0")
+    release_id = first["id"]
+    save_releases_to_db("release", "published", repo, [first])
+    with get_session() as session:
+        pk = _release(session, release_id).id
+
+    # tag 改名：按 (repository_id, tag_name) 找不到已有 release，插入时按 github_id 冲突改为更新
+    renamed = plugin_files.release(repo, "v1.0", f"{repo}/renamed", "1.0.1", release_id=release_id)
+    del statements[:]
+    save_releases_to_db("release", "edited", repo, [renamed])
+    assert plugin_files.downloads == [f"/{repo}/v1/plugin.json", f"/{repo}/v1.0/plugin.json"]
+    assert [sql.split(" (")[0] for sql, _ in _writes(statements, "releases")] == ["INSERT INTO releases"]
+    with get_session() as session:
+        release = _release(session, release_id)
+        assert (release.id, release.tag_name) == (pk, "v1.0")
+        assets = session.query(Asset).filter(Asset.release_id == pk).order_by(Asset.name).all()
+        # 同名 asset 按 (release_id, name) 更新，不产生重复记录
+        assert [(a.name, a.browser_download_url) for a in assets] == [
+            (a["name"], a["browser_download_url"]) for a in sorted(renamed["assets"], key=lambda a: a["name"])
+        ]
+        plugins = session.query(Plugin).filter(Plugin.release_id == pk).all()
+        assert [(p.plugin_id, p.version) for p in plugins] == [(f"{repo}/renamed", "1.0.1")]
+        assert session.query(Release).filter(Release.repository_id == release.repository_id).count() == 1
+
+
+def test_mixed_rows_update_in_grouped_executemany(plugin_files, repository, statements):
+    repo = repository()
+    releases = [plugin_files.release(repo, f"v{i}", f"{repo}/mixed", f"1.{i}") for i in range(4)]
+    save_releases_to_db("release", "published", repo, releases)
+
+    # 再次入库：一半 release 没有 author（UPDATE 中不含 author_id 列），asset 都换了新的 updated_at
+    edited = copy.deepcopy(releases)
+    for i, release in enumerate(edited):
+        release["name"] = f"edited {i}"
+        if i % 2:
+            release["author"] = None
+        for asset in release["assets"]:
+            asset["download_count"] = 10 + i
+            asset["updated_at"] = "2024-02-01T00:00:00Z"
+    del statements[:]
+    downloads = len(plugin_files.downloads)
+    save_releases_to_db("release", "edited", repo, edited)
+
+    # 不同列组合的行按组各执行一次 executemany，语句条数与 release 数量无关
+    updates = _writes(statements, "releases")
+    assert len(updates) == 2 and all(sql.startswith("UPDATE releases ") for sql, _ in updates)
+    assert sorted(rows for _, rows in updates) == [2, 2]
+    assert [rows for _, rows in _writes(statements, "assets")] == [8]
+    # plugin.json 的 asset 戳变化需要重新下载，但内容未变，不重写插件、依赖与标签
+    assert len(plugin_files.downloads) == downloads + 4
+    (sql, rows), = _writes(statements, "plugins")
+    assert sql.startswith("UPDATE plugins SET download_url=?, raw_json_asset=?") and rows == 4
+    assert _writes(statements, "plugin_tags") == [] and _writes(statements, "dependencies") == []
+
+    with get_session() as session:
+        rows = {r.github_id: r for r in session.query(Release).filter(Release.github_id.in_([r["id"] for r in releases]))}
+        for i, release in enumerate(releases):
+            row = rows[release["id"]]
+            # 没有 author 的行保留原来的 author_id
+            assert (row.name, row.author_id) == (f"edited {i}", 1)
+        counts = {a.github_id: a.download_count for a in session.query(Asset).filter(Asset.release_id.in_([r.id for r in rows.values()]))}
+        assert counts == {a["id"]: 10 + i for i, release in enumerate(edited) for a in release["assets"]}
+
+
+def test_unchanged_asset_skips_download(plugin_files, repository, statements):
+    repo = repository()
+    releases = [plugin_files.release(repo, f"v{i}", f"{repo}/same", f"2.{i}", Dependencies=[{"Id": "dep", "Need": ">=1.0"}])
+                for i in range(3)]
+    save_releases_to_db("release", "published", repo, releases)
+    assert len(plugin_files.downloads) == 3
+    with get_session() as session:
+        before = {p.id: (p.updated_at, p.raw_json_sha256) for p in session.query(Plugin).join(Plugin.release).filter(
+            Release.github_id.in_([r["id"] for r in releases]))}
+
+    # 同一 asset（id / updated_at / size 不变）：plugin.json 取自数据库，不下载也不重写
+    plugin_cache.clear()
+    del statements[:]
+    save_releases_to_db("release", "edited", repo, copy.deepcopy(releases))
+    assert len(plugin_files.downloads) == 3
+    for table in ("plugins", "plugin_tags", "dependencies", "plugin_search"):
+        assert _writes(statements, table) == []
+    with get_session() as session:
+        after = {p.id: (p.updated_at, p.raw_json_sha256) for p in session.query(Plugin).filter(Plugin.id.in_(before))}
+        assert after == before
+        assert session.query(Dependency).filter(Dependency.plugin_id.in_(before)).count() == 3
+        assert session.query(PluginTag).filter(PluginTag.plugin_id.in_(before)).count() == 3
@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from conftest import next_id
+from catalog import load_latest_plugins
+from models import Base, Plugin, Release, Repository, get_session, save_releases_to_db
+from search_index import (count_plugin_matches, create_repository_search_index, query_terms, repository_name_filter,
+                          search_plugin_pks)
+
+
+@pytest.fixture
+def word():
+    # 测试共用一个数据库，检索词与 plugin_id 每次都不同
+    return f"quokka{next_id()}"
+
+
+@pytest.fixture
+def catalog_pks(plugin_files, repository, word):
+    """几个描述中含检索词的插件：多个版本、不可见的版本、未 watched 的仓库，返回 {名称后缀: 目录中的 Plugin.id}"""
+    repo = repository()
+    save_releases_to_db("release", "published", repo, [
+        plugin_files.release(repo, "a1", f"{word}-a", "1.0", Description=f"{word} one"),
+        plugin_files.release(repo, "a2", f"{word}-a", "2.0", Description=f"{word} two"),
+        plugin_files.release(repo, "b1", f"{word}-b", "1.0", Description=word),
+        plugin_files.release(repo, "bx", f"{word}-b", "weird", Description=word),
+        plugin_files.release(repo, "c1", f"{word}-c", "1.0", Description=word),
+        plugin_files.release(repo, "c2", f"{word}-c", "3.0", Description=f"{word} hidden"),
+        plugin_files.release(repo, "d1", f"{word}-d", "1.0", Description=word),
+    ])
+    hidden_repo = repository(watched=False)
+    save_releases_to_db("release", "published", hidden_repo, [
+        plugin_files.release(hidden_repo, "e1", f"{word}-e", "1.0", Description=word),
+    ])
+    with get_session() as session:
+        release = session.query(Release).join(Plugin, Plugin.release_id == Release.id).filter(
+            Plugin.plugin_id == f"{word}-c", Plugin.version == "3.0").one()
+        release.visible = False
+        session.commit()
+        latest = load_latest_plugins(session, [f"{word}-{suffix}" for suffix in "abcde"])
+        return {plugin_id.rsplit("-", 1)[1]: pk for plugin_id, (pk, _) in latest.items()}
+
+
+def test_only_catalog_entries_match(catalog_pks, word):
+    with get_session() as session:
+        pks = [pk for pk, _ in search_plugin_pks(session, query_terms(word))]
+        assert sorted(pks) == sorted(catalog_pks.values())
+        assert count_plugin_matches(session, query_terms(word)) == len(catalog_pks) == 4
+    assert "e" not in catalog_pks
+
+
+def test_pages_are_limited_in_sql(catalog_pks, word):
+    terms = query_terms(word)
+    with get_session() as session:
+        everything = search_plugin_pks(session, terms)
+        pages = [search_plugin_pks(session, terms, limit=3, offset=offset) for offset in (0, 3, 6)]
+    assert [len(page) for page in pages] == [3, 1, 0]
+    assert pages[0] + pages[1] == everything
+
+
+def test_relevance_order(catalog_pks, word):
+    with get_session() as session:
+        pks = [pk for pk, _ in search_plugin_pks(session, query_terms(f"{word} two"))]
+    assert pks == [catalog_pks["a"]]
+    with get_session() as session:
+        # 不可见的新版本与被它遮住的旧版本都不出现在结果中
+        assert search_plugin_pks(session, query_terms(f"{word} hidden")) == []
+        assert search_plugin_pks(session, query_terms(f"{word} one")) == []
+
+
+def test_empty_query():
+    with get_session() as session:
+        assert search_plugin_pks(session, []) == [] and count_plugin_matches(session, []) == 0
+
+
+@pytest.fixture(params=[True, False], ids=["trigram", "no-trigram"])
+def repositories_engine(request, tmp_path):
+    """只含 repositories 的临时 SQLite 库；no-trigram 模拟缺少 trigram 分词器的 SQLite"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'repos.sqlite'}")
+    Base.metadata.create_all(engine, tables=[Repository.__table__])
+    if not request.param:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _no_trigram(conn, cursor, statement, *args):
+            if "tokenize = 'trigram'" in statement:
+                raise OperationalError(statement, None, sqlite3.OperationalError("no such tokenizer: trigram"))
+    with engine.begin() as conn:
+        create_repository_search_index(conn)
+    yield engine
+    engine.dispose()
+
+
+def test_repository_name_filter(repositories_engine):
+    with Session(repositories_engine) as session:
+        session.add_all([Repository(id=i, name=name.split("/")[1], full_name=name, installed=True, watched=True)
+                         for i, name in enumerate(["Owner/Alpha-Kit", "owner/beta", "other/alphabet"], 1)])
+        session.commit()
+        # 触发器维护索引：改名后按新名称匹配
+        session.get(Repository, 2).full_name = "owner/betakit"
+        session.commit()
+        rows = session.query(Repository.full_name).filter(
+            repository_name_filter(session, Repository.id, Repository.full_name, "KIT")
+        ).order_by(Repository.id).all()
+    assert [name for name, in rows] == ["Owner/Alpha-Kit", "owner/betakit"]
@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import store
+from revision import bump_catalog_revision
+
+
+@pytest.fixture
+def client():
+    import app
+    return TestClient(app.app)
+
+
+def test_same_revision_and_params_not_modified(client, monkeypatch):
+    first = client.get("/api/store/plugins", params={"page": 1, "limit": 5})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    # 命中 ETag 时不刷新目录
+    def refresh():
+        raise AssertionError("catalog refreshed for a 304")
+
+    monkeypatch.setattr(store.store_catalog, "refresh", refresh)
+    for header in (etag, f'W/{etag}', f'"other", {etag}', "*"):
+        response = client.get("/api/store/plugins", params={"page": 1, "limit": 5}, headers={"If-None-Match": header})
+        assert (response.status_code, response.headers["ETag"], response.content) == (304, etag, b"")
+
+
+def test_bumped_revision_returns_new_etag(client):
+    etag = client.get("/api/store/plugins").headers["ETag"]
+    bump_catalog_revision([])
+    response = client.get("/api/store/plugins", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert client.get("/api/store/plugins", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_params_change_etag(client):
+    def etag(url, **params):
+        return client.get(url, params=params).headers["ETag"]
+
+    assert etag("/api/store/plugins", page=1) != etag("/api/store/plugins", page=2)
+    assert etag("/api/store/plugins", page=1) != etag("/api/store/plugins", page=1, limit=10)
+    assert etag("/api/store/plugins", page=1) != etag("/api/store/search", q="x", page=1)
+    assert etag("/api/store/search", q="a") != etag("/api/store/search", q="b")
+    # 参数顺序不影响 ETag
+    assert client.get("/api/store/plugins?page=2&limit=3").headers["ETag"] == \
+        client.get("/api/store/plugins?limit=3&page=2").headers["ETag"]
+
+    old = etag("/api/store/plugins", page=1)
+    response = client.get("/api/store/plugins", params={"page": 2}, headers={"If-None-Match": old})
+    assert response.status_code == 200
+
+
+def test_post_body_keys_etag(client):
+    def post(plugin_id, **headers):
+        return client.post("/api/store/plugins/versions", json={"items": [{"plugin_id": plugin_id, "version": "1.0"}]},
+                           headers=headers)
+
+    etag = post("missing-a").headers["ETag"]
+    assert post("missing-b").headers["ETag"] != etag
+    assert post("missing-a", **{"If-None-Match": etag}).status_code == 304
+    assert post("missing-b", **{"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,65 @@
+import pytest
+
+from versions import parse_need, satisfies, version_key
+
+
+@pytest.mark.parametrize("lower, higher", [
+    ("1.9", "1.10"),
+    ("1.0.0-rc.1", "1.0.0"),
+    ("1.0.0-alpha", "1.0.0-beta"),
+    ("1.0.0-2", "1.0.0-alpha"),
+    ("1.0.0-beta.2", "1.0.0-beta.10"),
+    ("1.2", "1.2.0.1"),
+    ("v0.9", "1.0"),
+])
+def test_version_key_order(lower, higher):
+    assert version_key(lower) < version_key(higher)
+
+
+def test_version_key_equivalent_forms():
+    assert version_key("1.2") == version_key("1.2.0") == version_key("v1.2.0.0") == version_key("1.2.0+build.5")
+
+
+@pytest.mark.parametrize("version", [None, "", "latest", "1..2", "1.0-"])
+def test_version_key_invalid(version):
+    assert version_key(version) is None
+
+
+def _ok(need, version):
+    return satisfies(version_key(version), parse_need(need))
+
+
+@pytest.mark.parametrize("need, allowed, rejected", [
+    ("", ["0.1", "9.9"], []),
+    ("*", ["0.1"], []),
+    ("1.2.0", ["1.2.0", "3.0"], ["1.1.9", "1.2.0-rc.1"]),
+    (">=1.0 <2.0", ["1.0", "1.9.9"], ["0.9", "2.0"]),
+    (">=1.0, <2.0", ["1.5"], ["2.0"]),
+    (">= 1.0", ["1.0", "2.0"], ["0.9"]),
+    (">= 1.0, < 2.0", ["1.5"], ["0.9", "2.0"]),
+    ("= 1.2", ["1.2.0"], ["1.2.1"]),
+    ("^1.2.3", ["1.2.3", "1.9"], ["1.2.2", "2.0"]),
+    ("^0.2.3", ["0.2.9"], ["0.3.0"]),
+    ("^ 1.2", ["1.3"], ["2.0"]),
+    ("~1.2.3", ["1.2.9"], ["1.3.0"]),
+    ("1.2.*", ["1.2.0", "1.2.7"], ["1.3.0", "1.1.9"]),
+    ("[1.0,2.0)", ["1.0", "1.9"], ["2.0", "0.9"]),
+    ("(,1.0]", ["0.1", "1.0"], ["1.0.1"]),
+    ("[1.0]", ["1.0.0"], ["1.0.1"]),
+    ("<1.0 || >=2.0", ["0.5", "2.1"], ["1.5"]),
+])
+def test_satisfies(need, allowed, rejected):
+    for version in allowed:
+        assert _ok(need, version), (need, version)
+    for version in rejected:
+        assert not _ok(need, version), (need, version)
+
+
+@pytest.mark.parametrize("need", ["latest", ">=", "[1.0", "(1.0)", ">=1.0 <abc"])
+def test_parse_need_invalid(need):
+    assert parse_need(need) is None
+
+
+def test_unparseable_version_only_matches_any():
+    assert satisfies(None, parse_need("*"))
+    assert not satisfies(None, parse_need(">=1.0"))
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+
+import pytest
+
+import webhook_queue
+from config import settings
+from models import WebhookDelivery, WebhookJob, get_session
+from webhook_queue import claim_job, enqueue, fail_job, is_duplicate_delivery, prune_deliveries, renew_lease, requeue_expired_jobs
+
+
+@pytest.fixture(autouse=True)
+def queue(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_max_attempts", 3)
+    monkeypatch.setattr(settings, "webhook_retry_backoff", 5.0)
+    with get_session() as session:
+        session.query(WebhookJob).delete()
+        session.query(WebhookDelivery).delete()
+        session.commit()
+    webhook_queue._recent_deliveries.clear()
+
+
+def _job(job_id: int) -> WebhookJob:
+    with get_session() as session:
+        return session.get(WebhookJob, job_id)
+
+
+def _claim_now(worker_id: str):
+    """领取任务，忽略退避时间"""
+    with get_session() as session:
+        session.query(WebhookJob).filter(WebhookJob.status == "pending").update({"next_attempt_at": datetime.now()})
+        session.commit()
+    return claim_job(worker_id)
+
+
+def test_duplicate_delivery_is_dropped():
+    assert enqueue("release", "{}", "d-1") is not None
+    assert enqueue("release", "{}", "d-1") is None
+    # 内存 LRU 丢失（例如重启）后由表拦截
+    webhook_queue._recent_deliveries.clear()
+    assert enqueue("release", "{}", "d-1") is None
+
+
+def test_failed_job_can_be_redelivered():
+    job_id = enqueue("release", "{}", "d-2")
+    for attempt in range(1, settings.webhook_max_attempts + 1):
+        job = _claim_now("w")
+        assert job["id"] == job_id and job["attempts"] == attempt
+        fail_job(job_id, job["attempts"], "boom", "w")
+    assert _job(job_id).status == "failed"
+    assert not is_duplicate_delivery("d-2")
+
+    redelivered = enqueue("release", "{}", "d-2")
+    assert redelivered is not None and redelivered != job_id
+    assert enqueue("release", "{}", "d-2") is None
+
+
+def test_prune_deliveries_keeps_recent(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_delivery_retention_days", 7)
+    enqueue("release", "{}", "recent")
+    with get_session() as session:
+        session.add(WebhookDelivery(delivery_id="old", event="release", received_at=datetime.now() - timedelta(days=8)))
+        session.commit()
+    assert prune_deliveries() == 1
+    with get_session() as session:
+        assert [d.delivery_id for d in session.query(WebhookDelivery)] == ["recent"]
+
+
+def _signed(body: bytes) -> dict:
+    digest = hmac.new(settings.webhook_token.encode(), body, hashlib.sha256).hexdigest()
+    return {"X-Hub-Signature-256": f"sha256={digest}"}
+
+
+def test_webhook_endpoint_queues_raw_body():
+    from fastapi.testclient import TestClient
+    import app
+
+    client = TestClient(app.app)
+    body = b'{"action": "published"}'
+    headers = {"X-GitHub-Event": "release", "X-GitHub-Delivery": "d-raw", **_signed(body)}
+    response = client.post("/api/webhook", content=body, headers=headers)
+    assert response.status_code == 202
+    # 请求体原样入队，由 worker 解析
+    assert _job(response.json()["queued"]).payload == body.decode()
+    assert client.post("/api/webhook", content=body, headers=headers).json() == {"duplicate": "d-raw"}
+    assert client.post("/api/webhook", content=body, headers={**headers, "X-Hub-Signature-256": "sha256=0"}).status_code == 403
+
+
+def test_invalid_payload_is_dropped_without_retry():
+    assert webhook_queue.process_job({"id": 1, "event": "release", "payload": "not json"}) == "invalid payload"
+
+
+def test_leased_job_is_not_claimed_twice():
+    job_id = enqueue("release", "{}", "lease-1")
+    assert _claim_now("w1")["id"] == job_id
+    assert _claim_now("w2") is None
+    # 只有持有租约的 worker 能续约或记录失败
+    assert not renew_lease(job_id, "w2")
+    assert renew_lease(job_id, "w1")
+    fail_job(job_id, 1, "boom", "w2")
+    job = _job(job_id)
+    assert (job.status, job.worker_id, job.last_error) == ("running", "w1", None)
+
+
+def test_expired_lease_is_requeued(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_job_lease", 300.0)
+    job_id = enqueue("release", "{}", "lease-2")
+    assert _claim_now("w1")["attempts"] == 1
+    # 租约仍有效时不重新排队
+    assert requeue_expired_jobs() == 0
+    with get_session() as session:
+        session.get(WebhookJob, job_id).claimed_at = datetime.now() - timedelta(seconds=301)
+        session.commit()
+    assert requeue_expired_jobs() == 1
+    assert (_job(job_id).status, _job(job_id).worker_id) == ("pending", None)
+
+    job = _claim_now("w2")
+    assert (job["id"], job["attempts"]) == (job_id, 2)
+    # 原 worker 恢复后既不能续约，也不能覆盖新租约的状态
+    assert not renew_lease(job_id, "w1")
+    fail_job(job_id, 1, "late", "w1")
+    assert (_job(job_id).status, _job(job_id).worker_id) == ("running", "w2")
+
+
+def test_retry_backoff_schedule():
+    job_id = enqueue("release", "{}", "backoff")
+    for attempt, delay in ((1, 5.0), (2, 10.0)):
+        job = _claim_now("w")
+        assert job["attempts"] == attempt
+        before = datetime.now()
+        fail_job(job_id, job["attempts"], f"boom {attempt}", "w")
+        retry_at = _job(job_id).next_attempt_at
+        assert before + timedelta(seconds=delay - 1) <= retry_at <= datetime.now() + timedelta(seconds=delay)
+        # 退避期内不可领取
+        assert claim_job("w") is None
+
+
+def test_job_fails_after_max_attempts():
+    job_id = enqueue("release", "{}", "max")
+    for attempt in range(1, settings.webhook_max_attempts + 1):
+        assert _job(job_id).status == "pending"
+        fail_job(job_id, _claim_now("w")["attempts"], f"boom {attempt}", "w")
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.last_error) == ("failed", 3, "boom 3")
+    assert _claim_now("w") is None and requeue_expired_jobs() == 0
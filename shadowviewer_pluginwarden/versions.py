@@ -0,0 +1,141 @@
+import re
+from typing import List, Optional, Tuple
+
+# 形如 1.2.3 / v1.2 / 1.0.0-beta.2+build 的版本号
+_VERSION_RE = re.compile(r'^\s*[vV]?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]*)?\s*$')
+
+_PARTS = 4
+_WIDTH = 8
+_MAX_KEY = 100
+
+
+def version_key(version: Optional[str]) -> Optional[str]:
+    """将版本号转换为可按字符串排序的键，无法解析时返回 None。
+
+    数字部分补零到固定宽度（1.10 > 1.9），预发布版本排在正式版本之前
+    （1.0.0-rc.1 < 1.0.0），预发布标识中数字段排在字母段之前。
+    """
+    if not version:
+        return None
+    m = _VERSION_RE.match(version)
+    if not m:
+        return None
+    nums = [int(n) for n in m.group(1).split('.')][:_PARTS]
+    nums += [0] * (_PARTS - len(nums))
+    key = '.'.join(f"{min(n, 10 ** _WIDTH - 1):0{_WIDTH}d}" for n in nums)
+    pre = m.group(2)
+    if not pre:
+        # '~' 大于预发布使用的 '-'，正式版本排在同号预发布版本之后
+        return key + '~'
+    idents = []
+    for ident in pre.split('.'):
+        if ident.isdigit():
+            idents.append(f"0{min(int(ident), 10 ** _WIDTH - 1):0{_WIDTH}d}")
+        else:
+            idents.append(f"1{ident}")
+    return (key + '-' + '.'.join(idents))[:_MAX_KEY]
+
+
+# 依赖版本约束（Dependency.need）：解析为析取范式，任一组内的 (运算符, 版本键) 全部满足即满足约束
+# 支持：
+#   空 / *                     任意版本
+#   1.2.0                      不低于该版本（与 NuGet 相同，裸版本号表示最低版本）
+#   >=1.0 <2.0、>= 1.0, < 2.0  比较运算符 >= > <= < = ==（运算符后可有空白），空白或逗号分隔表示同时满足
+#   ^1.2.3、~1.2.3、1.2.*      兼容版本、近似版本与通配符
+#   [1.0,2.0)、(,1.0]、[1.0]   NuGet 区间写法
+#   a || b                     满足其一即可
+Constraint = List[List[Tuple[str, str]]]
+
+_INTERVAL_RE = re.compile(r'^([\[(])\s*([^,\])]*?)\s*(?:,\s*([^\])]*?)\s*)?([\])])$')
+_COMPARATOR_RE = re.compile(r'^(>=|<=|==|=|>|<|\^|~)?\s*(\S+)$')
+_WILDCARD_RE = re.compile(r'^[vV]?((?:\d+\.)*)[*xX]$')
+# 运算符与版本号之间的空白（>= 1.0），按空白拆分前去掉
+_OPERATOR_SPACE_RE = re.compile(r'(>=|<=|==|=|>|<|\^|~)\s+')
+
+
+def _numbers(version: str) -> Optional[List[int]]:
+    m = _VERSION_RE.match(version)
+    return [int(n) for n in m.group(1).split('.')] if m else None
+
+
+def _below(nums: List[int], index: int) -> str:
+    """第 index 段加一后的版本的下界（不含该版本的预发布版本）"""
+    bumped = nums[:index] + [nums[index] + 1]
+    return version_key('.'.join(map(str, bumped)))[:-1] + '-'
+
+
+def _comparators(text: str) -> Optional[List[Tuple[str, str]]]:
+    wildcard = _WILDCARD_RE.match(text)
+    if wildcard:
+        prefix = [int(n) for n in wildcard.group(1).split('.') if n]
+        if not prefix:
+            return []
+        return [('>=', version_key('.'.join(map(str, prefix)))), ('<', _below(prefix, len(prefix) - 1))]
+    m = _COMPARATOR_RE.match(text)
+    if not m:
+        return None
+    op, version = m.group(1) or '>=', m.group(2)
+    key, nums = version_key(version), _numbers(version)
+    if key is None:
+        return None
+    if op == '^':
+        padded = (nums + [0, 0])[:3]
+        index = next((i for i, n in enumerate(padded) if n), len(padded) - 1)
+        return [('>=', key), ('<', _below(padded, index))]
+    if op == '~':
+        return [('>=', key), ('<', _below(nums + [0], 1 if len(nums) >= 2 else 0))]
+    return [('==' if op == '=' else op, key)]
+
+
+def parse_need(need: Optional[str]) -> Optional[Constraint]:
+    """解析依赖版本约束，无法解析时返回 None；空约束返回 [[]]（任意版本）"""
+    need = (need or '').strip()
+    if need in ('', '*'):
+        return [[]]
+    alternatives = []
+    for part in need.split('||'):
+        part = part.strip()
+        interval = _INTERVAL_RE.match(part)
+        if interval:
+            low_open, low, high, high_open = interval.groups()
+            if high is None:
+                # [1.0] 表示精确版本
+                if low_open != '[' or high_open != ']' or not low:
+                    return None
+                high = low
+            group = []
+            for bound, op in ((low, '>=' if low_open == '[' else '>'), (high, '<=' if high_open == ']' else '<')):
+                if bound:
+                    key = version_key(bound)
+                    if key is None:
+                        return None
+                    group.append((op, key))
+            alternatives.append(group)
+            continue
+        group = []
+        for text in _OPERATOR_SPACE_RE.sub(r'\1', part).replace(',', ' ').split():
+            comparators = _comparators(text)
+            if comparators is None:
+                return None
+            group.extend(comparators)
+        alternatives.append(group)
+    return alternatives
+
+
+_OPS = {
+    '>=': lambda a, b: a >= b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '<': lambda a, b: a < b,
+    '==': lambda a, b: a == b,
+}
+
+
+def satisfies(key: Optional[str], constraint: Constraint) -> bool:
+    """版本键是否满足约束；无法解析的版本只满足任意版本约束"""
+    for group in constraint:
+        if not group:
+            return True
+        if key is not None and all(_OPS[op](key, bound) for op, bound in group):
+            return True
+    return False
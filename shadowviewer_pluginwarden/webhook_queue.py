@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+from github_utils import webhook_install, webhook_release
+from models import WebhookDelivery, WebhookJob, get_session
+
+# 后台队列处理的事件类型
+HANDLED_EVENTS = ("installation", "installation_repositories", "release")
+
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_workers: List[asyncio.Task] = []
+_reaper_task: Optional[asyncio.Task] = None
+# 本进程的标识，worker 领取任务时写入 WebhookJob.worker_id（多进程部署时区分各进程）
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# 最近接收的 X-GitHub-Delivery（LRU），避免重复投递每次都查库
+_recent_deliveries: "OrderedDict[str, None]" = OrderedDict()
+_deliveries_lock = threading.Lock()
+
+
+def _remember_delivery(delivery_id: str):
+    with _deliveries_lock:
+        _recent_deliveries[delivery_id] = None
+        _recent_deliveries.move_to_end(delivery_id)
+        while len(_recent_deliveries) > settings.webhook_delivery_cache_size:
+            _recent_deliveries.popitem(last=False)
+
+
+def _forget_delivery(delivery_id: str):
+    with _deliveries_lock:
+        _recent_deliveries.pop(delivery_id, None)
+
+
+def is_duplicate_delivery(delivery_id: str) -> bool:
+    """投递是否已经处理过：先查内存 LRU，未命中再查 webhook_deliveries 表"""
+    if not delivery_id:
+        return False
+    with _deliveries_lock:
+        if delivery_id in _recent_deliveries:
+            _recent_deliveries.move_to_end(delivery_id)
+            return True
+    with get_session() as session:
+        exists = session.get(WebhookDelivery, delivery_id) is not None
+    if exists:
+        _remember_delivery(delivery_id)
+    return exists
+
+
+def enqueue(event: str, payload: str, delivery_id: str = None) -> Optional[int]:
+    """将 webhook 事件写入持久化队列，返回任务 id；重复投递返回 None
+
+    投递记录与任务在同一事务中写入，并发的重复投递由主键冲突拦截。
+    """
+    if is_duplicate_delivery(delivery_id):
+        return None
+    with get_session() as session:
+        if delivery_id:
+            session.add(WebhookDelivery(delivery_id=delivery_id, event=event))
+        job = WebhookJob(delivery_id=delivery_id, event=event, payload=payload, status='pending')
+        session.add(job)
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            _remember_delivery(delivery_id)
+            return None
+        job_id = job.id
+    if delivery_id:
+        _remember_delivery(delivery_id)
+    wakeup, loop = _wakeup, _loop
+    if wakeup is not None:
+        # enqueue 在线程池中执行，asyncio.Event 只能在事件循环线程中设置
+        loop.call_soon_threadsafe(wakeup.set)
+    return job_id
+
+
+def prune_deliveries() -> int:
+    """删除超过保留期的投递记录（由定时任务调用）"""
+    horizon = datetime.now() - timedelta(days=settings.webhook_delivery_retention_days)
+    with get_session() as session:
+        count = session.query(WebhookDelivery).filter(WebhookDelivery.received_at < horizon).delete(synchronize_session=False)
+        session.commit()
+    return count
+
+
+def claim_job(worker_id: str) -> Optional[dict]:
+    """领取一个到期的 pending 任务并标记为 running（租约属于 worker_id），没有可处理任务时返回 None"""
+    now = datetime.now()
+    with get_session() as session:
+        candidates = (
+            session.query(WebhookJob.id)
+            .filter(WebhookJob.status == 'pending', WebhookJob.next_attempt_at <= now)
+            .order_by(WebhookJob.next_attempt_at, WebhookJob.id)
+            .limit(5)
+            .all()
+        )
+        for (job_id,) in candidates:
+            # 条件更新保证同一任务只会被一个 worker 领取
+            claimed = (
+                session.query(WebhookJob)
+                .filter(WebhookJob.id == job_id, WebhookJob.status == 'pending')
+                .update({"status": 'running', "started_at": now, "worker_id": worker_id, "claimed_at": now,
+                         "attempts": WebhookJob.attempts + 1},
+                        synchronize_session=False)
+            )
+            session.commit()
+            if claimed:
+                job = session.get(WebhookJob, job_id)
+                return {"id": job.id, "event": job.event, "payload": job.payload, "attempts": job.attempts}
+    return None
+
+
+def complete_job(job_id: int):
+    with get_session() as session:
+        session.query(WebhookJob).filter(WebhookJob.id == job_id).delete(synchronize_session=False)
+        session.commit()
+
+
+def renew_lease(job_id: int, worker_id: str) -> bool:
+    """续约仍由 worker_id 持有的任务，任务已被重新排队或领取时返回 False"""
+    with get_session() as session:
+        renewed = (
+            session.query(WebhookJob)
+            .filter(WebhookJob.id == job_id, WebhookJob.status == 'running', WebhookJob.worker_id == worker_id)
+            .update({"claimed_at": datetime.now()}, synchronize_session=False)
+        )
+        session.commit()
+    return bool(renewed)
+
+
+def fail_job(job_id: int, attempts: int, error: str, worker_id: str = None):
+    """记录失败；未超过最大重试次数时按指数退避重新排队。任务已不属于 worker_id（租约过期后被其他 worker 领取）时不做修改
+
+    最终失败的任务同时删除其投递记录，GitHub 上重新投递（Redeliver）同一个 X-GitHub-Delivery 时会再次入队。
+    """
+    with get_session() as session:
+        job = session.get(WebhookJob, job_id)
+        if not job or (worker_id is not None and (job.status != 'running' or job.worker_id != worker_id)):
+            return
+        job.last_error = error
+        delivery_id = None
+        if attempts >= settings.webhook_max_attempts:
+            job.status = 'failed'
+            delivery_id = job.delivery_id
+            if delivery_id:
+                session.query(WebhookDelivery).filter(WebhookDelivery.delivery_id == delivery_id).delete(synchronize_session=False)
+            logger.error(f"Webhook job {job_id} ({job.event}) failed after {attempts} attempts: {error}")
+        else:
+            job.status = 'pending'
+            job.next_attempt_at = datetime.now() + timedelta(seconds=settings.webhook_retry_backoff * 2 ** (attempts - 1))
+            logger.warning(f"Webhook job {job_id} ({job.event}) attempt {attempts} failed, retry at {job.next_attempt_at}: {error}")
+        session.commit()
+    if delivery_id:
+        _forget_delivery(delivery_id)
+
+
+def requeue_expired_jobs() -> int:
+    """将租约已过期的 running 任务（其 worker 已退出或卡住）重新放回队列；租约仍有效的任务属于其他进程，不做修改"""
+    horizon = datetime.now() - timedelta(seconds=settings.webhook_job_lease)
+    with get_session() as session:
+        count = (
+            session.query(WebhookJob)
+            .filter(WebhookJob.status == 'running',
+                    (WebhookJob.claimed_at == None) | (WebhookJob.claimed_at < horizon))
+            .update({"status": 'pending', "worker_id": None, "claimed_at": None}, synchronize_session=False)
+        )
+        session.commit()
+    return count
+
+
+def process_job(job: dict):
+    # 接收时只校验签名，这里是唯一一次解析请求体
+    try:
+        payload = json.loads(job["payload"])
+    except ValueError:
+        # 签名有效但不是 JSON：重试也不会成功，直接丢弃
+        logger.error(f"Webhook job {job['id']} ({job['event']}) has an invalid JSON payload, dropped")
+        return "invalid payload"
+    event = job["event"]
+    if event == "installation" or event == "installation_repositories":
+        return webhook_install(payload, event)
+    elif event == "release":
+        return webhook_release(payload, event)
+
+
+def queue_stats() -> dict:
+    """队列深度与延迟：各状态任务数量，以及最早一个待处理任务已等待的秒数"""
+    with get_session() as session:
+        counts = dict(session.query(WebhookJob.status, func.count(WebhookJob.id)).group_by(WebhookJob.status).all())
+        oldest = session.query(func.min(WebhookJob.created_at)).filter(WebhookJob.status.in_(('pending', 'running'))).scalar()
+    return {
+        "pending": counts.get('pending', 0),
+        "running": counts.get('running', 0),
+        "failed": counts.get('failed', 0),
+        "workers": len(_workers),
+        "lag_seconds": (datetime.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+async def _heartbeat(job_id: int, worker_id: str):
+    """处理期间定期续约"""
+    while True:
+        await asyncio.sleep(settings.webhook_job_lease / 3)
+        try:
+            if not await asyncio.to_thread(renew_lease, job_id, worker_id):
+                logger.warning(f"Webhook job {job_id} lease lost by {worker_id}")
+                return
+        except Exception as e:
+            logger.error(f"Failed to renew lease of webhook job {job_id}: {e}")
+
+
+async def _reaper():
+    """定期重新排队租约过期的任务"""
+    while True:
+        await asyncio.sleep(settings.webhook_job_lease / 2)
+        try:
+            requeued = await asyncio.to_thread(requeue_expired_jobs)
+        except Exception as e:
+            logger.error(f"Failed to requeue expired webhook jobs: {e}")
+            continue
+        if requeued:
+            logger.warning(f"Requeued {requeued} webhook jobs with expired leases")
+            _wakeup.set()
+
+
+async def _worker(index: int):
+    worker_id = f"{PROCESS_ID}:{index}"
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_job, worker_id)
+        except Exception as e:
+            logger.error(f"Webhook worker {index} failed to claim job: {e}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.webhook_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+        heartbeat = asyncio.create_task(_heartbeat(job["id"], worker_id))
+        try:
+            result = await asyncio.to_thread(process_job, job)
+            await asyncio.to_thread(complete_job, job["id"])
+            logger.info(f"Webhook job {job['id']} ({job['event']}) processed by worker {index}: {result}")
+        except Exception as e:
+            logger.exception(f"Webhook job {job['id']} ({job['event']}) failed")
+            await asyncio.to_thread(fail_job, job["id"], job["attempts"], str(e), worker_id)
+        finally:
+            heartbeat.cancel()
+
+
+async def start_workers():
+    global _wakeup, _loop, _reaper_task
+    _wakeup = asyncio.Event()
+    _loop = asyncio.get_running_loop()
+    # 只回收租约已过期的任务：其他进程仍在处理的任务租约有效，不会被重复处理
+    recovered = await asyncio.to_thread(requeue_expired_jobs)
+    if recovered:
+        logger.info(f"Requeued {recovered} unfinished webhook jobs")
+    for i in range(max(settings.webhook_workers, 1)):
+        _workers.append(asyncio.create_task(_worker(i)))
+    _reaper_task = asyncio.create_task(_reaper())
+
+
+async def stop_workers():
+    global _reaper_task, _wakeup, _loop
+    tasks = _workers + ([_reaper_task] if _reaper_task else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _reaper_task = _wakeup = _loop = None